@@ -2,10 +2,19 @@
 """
 Handle the emake annotation file.
 """
+from pyannolib import buildcache
+from pyannolib import compressed
 from pyannolib import concatfile
+from pyannolib import jobindex
+from pyannolib import pathtable
 import re
 import datetime
 import os
+import multiprocessing
+import io
+import mmap
+import array
+from itertools import chain, compress, imap, izip
 
 try:
     # Try to import the C-based ElementTree (faster!)
@@ -14,6 +23,14 @@ except ImportError:
     # But use the Python-based ElementTree if necessary
     from xml.etree import ElementTree as ET
 
+from xml.parsers import expat
+
+try:
+    # lxml is optional; it is only needed for BACKEND_LXML
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
 
 # Job status values
 JOB_STATUS_NORMAL = "normal"
@@ -55,6 +72,11 @@ OP_TYPE_APPEND = "append"
 OP_TYPE_BLINDCREATE = "blindcreate"
 OP_TYPE_SUBMAKE = "submake"
 
+# The op types that change the file
+OP_WRITE_TYPES = (OP_TYPE_CREATE, OP_TYPE_MODIFY, OP_TYPE_UNLINK,
+        OP_TYPE_RENAME, OP_TYPE_LINK, OP_TYPE_MODIFYATTRS, OP_TYPE_APPEND,
+        OP_TYPE_BLINDCREATE)
+
 # Op filetype values
 OP_FILETYPE_FILE = "file"
 OP_FILETYPE_SYMLINK = "symlink"
@@ -78,6 +100,77 @@ MESSAGE_SEVERITY_ERROR = "error"
 # Some error strings
 MSG_UNEXPECTED_XML_ELEM = "Unexpected xml element: "
 
+# The buffer size used when reading multi-part annotation files
+ANNO_BUFFER_SIZE = 1024 * 1024
+
+# The strings that mark the end of the header
+HEADER_END_MAKE = "<make"
+HEADER_END_MESSAGE = "<message"
+
+# The strings that we look for in the metrics footer
+FOOTER_START_METRICS = "<metrics>"
+FOOTER_END_METRICS = "</metrics>"
+FOOTER_END_JOB = "</job>"
+
+# The parsers that AnnotatedBuild can use for the body of the file
+BACKEND_ETREE = "etree"
+BACKEND_EXPAT = "expat"
+BACKEND_LXML = "lxml"
+
+# The child records of a Job that iterJobs(fields=...) can ask for
+JOB_FIELD_TIMING = "timing"
+JOB_FIELD_OPS = "ops"
+JOB_FIELD_DEPS = "deps"
+JOB_FIELD_WAITING_JOBS = "waiting_jobs"
+JOB_FIELD_COMMANDS = "commands"
+JOB_FIELD_OUTPUTS = "outputs"
+JOB_FIELD_CONFLICT = "conflict"
+JOB_FIELD_VARS = "vars"
+JOB_FIELD_COMMIT_TIMES = "commit_times"
+
+# The kinds of events that iterEvents() yields
+EVENT_JOB_START = "job-start"
+EVENT_TIMING = "timing"
+EVENT_OP = "op"
+EVENT_DEP = "dep"
+EVENT_JOB_END = "job-end"
+
+# The values of the enumerated attributes (job types, op types, etc.)
+# are looked up here, so that every record with the same value shares
+# one string, instead of having a copy of its own.
+class _EnumValues(dict):
+    def __missing__(self, value):
+        self[value] = value
+        return value
+
+_enum_values = _EnumValues()
+
+# OpList stores the type, filetype, found and isdir values of each op
+# as one-byte codes. Key = value, Value = code. The known values are
+# added up front, so every process has the same codes for them.
+class _OpCodes(dict):
+    MAX_CODES = 256
+
+    def __init__(self, values):
+        dict.__init__(self)
+        # Index = code, Value = value
+        self.values = []
+        for value in values:
+            self[value]
+
+    def __missing__(self, value):
+        if len(self.values) == self.MAX_CODES:
+            raise PyAnnolibError("Too many different <op> attribute values")
+        code = self[value] = len(self.values)
+        self.values.append(_enum_values[value])
+        return code
+
+_op_codes = _OpCodes([None, OP_TYPE_LOOKUP, OP_TYPE_READ, OP_TYPE_CREATE,
+    OP_TYPE_MODIFY, OP_TYPE_UNLINK, OP_TYPE_RENAME, OP_TYPE_LINK,
+    OP_TYPE_MODIFYATTRS, OP_TYPE_APPEND, OP_TYPE_BLINDCREATE,
+    OP_TYPE_SUBMAKE, OP_FILETYPE_FILE, OP_FILETYPE_SYMLINK,
+    OP_FILETYPE_DIR, OP_FOUND_TRUE, OP_FOUND_FALSE])
+
 # This value is returned by the parseJobs callback if
 # the caller wants parsing to stop. There is no way to re-start it.
 StopParseJobs = 1
@@ -90,10 +183,14 @@ class PyAnnolibError(Exception):
 
 ###################################################
 
-class AnnoXMLNames:
+class AnnoXMLNames(object):
     """These constants are used by any class that is parsing 
     the annotation XML."""
 
+    # So that the record classes that use these names can have
+    # __slots__ instead of a __dict__
+    __slots__ = ()
+
     # Found in the "header"
     ELEMENT_BUILD = "build"
     ELEMENT_PROPERTIES = "properties"
@@ -137,7 +234,34 @@ class AnnoXMLNames:
 
 ###################################################
 
-
+# The <job> sub-element that holds each JOB_FIELD_*
+JOB_FIELD_ELEMENTS = {
+    JOB_FIELD_TIMING : AnnoXMLNames.ELEMENT_TIMING,
+    JOB_FIELD_OPS : AnnoXMLNames.ELEMENT_OPLIST,
+    JOB_FIELD_DEPS : AnnoXMLNames.ELEMENT_DEPLIST,
+    JOB_FIELD_WAITING_JOBS : AnnoXMLNames.ELEMENT_WAITING_JOBS,
+    JOB_FIELD_COMMANDS : AnnoXMLNames.ELEMENT_COMMAND,
+    JOB_FIELD_OUTPUTS : AnnoXMLNames.ELEMENT_OUTPUT,
+    JOB_FIELD_CONFLICT : AnnoXMLNames.ELEMENT_CONFLICT,
+    JOB_FIELD_VARS : AnnoXMLNames.ELEMENT_ENVIRONMENT,
+    JOB_FIELD_COMMIT_TIMES : AnnoXMLNames.ELEMENT_COMMIT_TIMES,
+}
+
+def _skipped_elements(fields):
+    """Returns the set of <job> sub-elements that are not needed
+    for the JOB_FIELD_* names in fields. If fields is None,
+    everything is needed."""
+    if fields is None:
+        return frozenset()
+
+    fields = set(fields)
+    unknown = fields - set(JOB_FIELD_ELEMENTS)
+    if unknown:
+        raise PyAnnolibError("Unknown job field: %s" %
+                (", ".join(sorted(unknown)),))
+
+    return frozenset([elem for (field, elem) in JOB_FIELD_ELEMENTS.items()
+        if field not in fields])
 
 class AnnotatedBuild(AnnoXMLNames):
     ID = "id"
@@ -145,11 +269,17 @@ class AnnotatedBuild(AnnoXMLNames):
     START = "start"
     LOCAL_AGENTS = "localAgents"
 
-    def __init__(self, filename, fh=None, ignore_unknown=True):
+    def __init__(self, filename, fh=None, ignore_unknown=True,
+            write_cache=False, backend=BACKEND_ETREE, streaming=False):
         """Can raise IOError"""
         # Initialize this since it is used in __str
         self.build_id = None
 
+        # In streaming mode, nothing is kept from the jobs once they
+        # have been handed out (see iterJobs()), so the memory used
+        # does not grow with the number of jobs.
+        self.streaming = streaming
+
         # Should we ignore unknown elements? If true,
         # we silently ignore htem. If false, we error out.
         self.ignore_unknown = ignore_unknown
@@ -168,6 +298,9 @@ class AnnotatedBuild(AnnoXMLNames):
         # Key = metric name, Value = metric value (string)
         self.metrics = {}
 
+        # The file names of all the ops and deps
+        self.path_table = pathtable.PathTable()
+
         # This is initialized now, but won't be filled in until
         # the message records are seen while processing jobs
         self.messages = []
@@ -180,6 +313,32 @@ class AnnotatedBuild(AnnoXMLNames):
         # Key = job ID, value = Job object
         self.make_jobs = {}
 
+        # The byte offset where the body (the first <make> or <message>)
+        # starts, and the XML declaration from the top of the file;
+        # both are filled in by _read_header()
+        self.body_offset = 0
+        self.xml_decl = ""
+
+        # The byte-offset index of the jobs; created on demand
+        # by getJobIndex()
+        self.job_index = None
+
+        # The binary cache of the parsed body, if there is an
+        # up-to-date one; loaded on demand by _getCache(). If
+        # write_cache is True, a complete iterJobs() writes a new one.
+        self.cache = None
+        self.cache_checked = False
+        self.write_cache = write_cache
+
+        # The class that parses the body
+        if backend not in BODY_PARSERS:
+            raise PyAnnolibError("Unknown parser backend: %s" % (backend,))
+        if backend == BACKEND_LXML and lxml_etree is None:
+            raise PyAnnolibError("The lxml backend needs lxml installed")
+        self.body_parser_class = BODY_PARSERS[backend]
+
+        self.filename = filename
+
         if filename:
             assert not fh, "filename and fh both given"
 
@@ -201,13 +360,10 @@ class AnnotatedBuild(AnnoXMLNames):
         # Now, skip to the end of the file and look for metrics.
         self._parse_metrics()
 
-        # Set the filehandle back to the beginning; when parseJobs()
-        # is run, it uses AnnoXMLBodyParser, which skips over all the XML
-        # fields that are part of the header. It's not the most efficient
-        # way to handle the separation of body and header; it would be
-        # much nicer to skip over the header and start parsing where
-        # the body starts. Maybe we'll do that in the future.
-        self.fh.seek(0, os.SEEK_SET)
+        # Set the filehandle to where the body starts; when parseJobs()
+        # is run, AnnoXMLBodyParser starts there, so it doesn't have
+        # to parse the header again.
+        self.fh.seek(self.body_offset, os.SEEK_SET)
 
     def close(self):
         """Closes the filehandle, which may be needed if you had
@@ -267,15 +423,64 @@ class AnnotatedBuild(AnnoXMLNames):
 
 
     def _read_header(self):
+        """Returns the text of the header, up to (but not including)
+        the first <message> or <make> record, and sets body_offset and
+        xml_decl."""
+        re_xml_decl = re.compile(r"\s*(?P<decl><\?xml[^>]*\?>)")
+
+        mm = _mmap_file(self.fh)
+        if mm is not None:
+            try:
+                header_text = self._read_header_mmap(mm)
+            finally:
+                mm.close()
+        else:
+            header_text = self._read_header_chunked()
+
+        self.body_offset = len(header_text)
+
+        # Remember the XML declaration, as it names the
+        # encoding that the body parser needs to know.
+        m = re_xml_decl.match(header_text)
+        if m:
+            self.xml_decl = m.group("decl")
+
+        return header_text
+
+    def _read_header_mmap(self, mm):
+        # I suspect only <make> can come first, but who knows?
+        # Look for <make> first, so that the search for <message>
+        # doesn't have to go past it; in a build without any
+        # messages, that would scan the whole file.
+        i = mm.find(HEADER_END_MAKE)
+        if i == -1:
+            i = mm.find(HEADER_END_MESSAGE)
+        else:
+            j = mm.find(HEADER_END_MESSAGE, 0, i)
+            if j != -1:
+                i = j
+
+        if i == -1:
+            msg = "Did not find end of header"
+            raise PyAnnolibError(msg)
+
+        return mm[:i]
+
+    def _read_header_chunked(self):
         # Read chunks of the file until we find the
         # first <message> or <make> record
-        # I suspect only <make> can come first, but who knows?
         BYTES_TO_READ = 32768
-        header_text = ""
+        chunks = []
 
         re_start = re.compile(r"(?P<start><message|<make)")
 
-        start_pos = 0
+        # The end of the text we have already read, which could
+        # hold the start of a "<message" string split across two reads,
+        # and its offset from the start of the header.
+        tail = ""
+        tail_pos = 0
+        total_len = 0
+
         while True:
             new_data = self.fh.read(BYTES_TO_READ)
             # EOF?
@@ -283,24 +488,29 @@ class AnnotatedBuild(AnnoXMLNames):
                 msg = "Did not find end of header"
                 raise PyAnnolibError(msg)
 
-            # Can we see the first thing after the header?
-            header_text += new_data
-            m = re_start.search(header_text, start_pos)
+            # Can we see the first thing after the header? Search only
+            # the new data, plus enough of the old data to find the
+            # string if it was split between the two reads. The maximum
+            # string size is len("<message"), which is 8.
+            m = re_start.search(tail + new_data)
             if m:
-                i = m.start("start")
-                return header_text[:i]
-            else:
-                # On the next loop we will read more data
-                # but let's increment start_pos by a value less
-                # than BYTES_TO_READ so that in case the string
-                # was split between this read and the next read
-                # we will still find it. The maximum string size
-                # is len("<message"), which is 8. Thus,
-                # we should start scanning at BYTES_TO_READ - ( 8 - 1 )
-                start_pos += (BYTES_TO_READ - 7)
+                i = tail_pos + m.start("start")
+                chunks.append(new_data)
+                return "".join(chunks)[:i]
+
+            chunks.append(new_data)
+            total_len += len(new_data)
+            tail = (tail + new_data)[-7:]
+            tail_pos = total_len - len(tail)
 
 
     def _parse_metrics(self):
+        # Finding the footer of a compressed stream would mean
+        # decompressing the whole file, so in that case the
+        # metrics are stored by AnnoXMLBodyParser when it reaches them.
+        if not _is_random_access(self.fh):
+            return
+
         metrics_text = self._read_metrics_footer()
         if not metrics_text:
             return
@@ -312,7 +522,10 @@ class AnnotatedBuild(AnnoXMLNames):
             msg = "Error reading <metrics>: %s" % (e,)
             raise PyAnnolibError(msg)
 
-        # Store the data in our dictionary
+        self._store_metrics(root)
+
+    def _store_metrics(self, root):
+        """Store the data from a <metrics> element in our dictionary."""
         for elem in list(root):
             if elem.tag == self.ELEMENT_METRIC:
                 metric_name = elem.get(self.ATTR_METRIC_NAME)
@@ -324,62 +537,78 @@ class AnnotatedBuild(AnnoXMLNames):
     def _read_metrics_footer(self):
         """Returns the text of the <metrics></metrics> block of XML.
         Or, returns None if it is missing."""
-        # Number of bytes to skip backwards at a time.
-        # In my tests, the metrics section is ~3000 bytes.
-        SKIP_NUM_BYTES = 500
-        ELEM_STRING_START_METRICS = "<metrics>"
-        ELEM_STRING_END_METRICS = "</metrics>"
-        ELEM_STRING_END_JOB = "</job>"
-        
-        # When reading, we want to read more than what we just
-        # skipped, so that if half the string is in one chunk, and
-        # half the string is in the next chunk, we are sure to find
-        # the string.
-        READ_CHUNK_NUM_BYTES = SKIP_NUM_BYTES + len(ELEM_STRING_START_METRICS)
+        mm = _mmap_file(self.fh)
+        if mm is not None:
+            try:
+                return self._read_metrics_footer_mmap(mm)
+            finally:
+                mm.close()
+        else:
+            return self._read_metrics_footer_chunked()
 
-        # Go to EOF
-        self.fh.seek(0, os.SEEK_END)
+    def _read_metrics_footer_mmap(self, mm):
+        # The last job is near the end of the file, so this
+        # is quick. The metrics must come after it.
+        i = mm.rfind(FOOTER_END_JOB)
+        if i == -1:
+            i = 0
 
-        pos = self.fh.tell()
+        i = mm.find(FOOTER_START_METRICS, i)
+        if i == -1:
+            return None
 
-        # Go back in chunks, until we find "<metrics>"
-        pos -= SKIP_NUM_BYTES
-        self.fh.seek(pos, os.SEEK_SET)
-        while pos >= 0:
-            data = self.fh.read(READ_CHUNK_NUM_BYTES)
-            i = data.find(ELEM_STRING_START_METRICS)
-            if i == -1:
-                # Didn't find it. Are there any other indications
-                # that we have gone too far? If we see a job, then yes.
-                if data.find(ELEM_STRING_END_JOB) != -1:
-                    return None
-                else:
-                    pos -= SKIP_NUM_BYTES
-                    self.fh.seek(pos, os.SEEK_SET)
-            else:
-                # We found it; stop looping
+        j = mm.find(FOOTER_END_METRICS, i)
+        if j == -1:
+            msg = "Found %s but not %s" % (FOOTER_START_METRICS,
+                    FOOTER_END_METRICS)
+            raise PyAnnolibError(msg)
+
+        return mm[i:j + len(FOOTER_END_METRICS)]
+
+    def _read_metrics_footer_chunked(self):
+        # Number of bytes to read backwards at a time.
+        # In my tests, the metrics section is ~3000 bytes, so
+        # one read usually finds it.
+        CHUNK_NUM_BYTES = 65536
+
+        # Go to EOF
+        self.fh.seek(0, os.SEEK_END)
+        end_pos = self.fh.tell()
+
+        # Go back in chunks, until we find "<metrics>". Each
+        # chunk is joined to the front of the text we have already
+        # read, so a string split between two chunks is still found.
+        text = ""
+        pos = end_pos
+        while pos > 0:
+            pos = max(0, pos - CHUNK_NUM_BYTES)
+            self.fh.seek(pos, os.SEEK_SET)
+            text = self.fh.read(CHUNK_NUM_BYTES) + text
+
+            # The metrics must come after the last job
+            i = text.rfind(FOOTER_END_JOB)
+            i = text.find(FOOTER_START_METRICS, max(i, 0))
+            if i != -1:
                 break
 
-        # We found "<metrics>". Let's read the whole "<metrics>"
-        # section into memory. First, position the filehandle
-        # to the place where "<metrics>" starts, then read to EOF.
-        self.fh.seek(pos + i, os.SEEK_SET)
-        metrics_text = self.fh.read()
+            # If we see a job, we have gone too far
+            if text.find(FOOTER_END_JOB) != -1:
+                return None
+        else:
+            return None
 
-        # We need to trim the stuff after "</metrics>",
-        # which should be "</build>"
-        i = metrics_text.find(ELEM_STRING_END_METRICS)
-        if i == -1:
-            msg = "Found %s but not %s" % (ELEM_STRING_START_METRICS,
-                    ELEM_STRING_END_METRICS)
+        j = text.find(FOOTER_END_METRICS, i)
+        if j == -1:
+            msg = "Found %s but not %s" % (FOOTER_START_METRICS,
+                    FOOTER_END_METRICS)
             raise PyAnnolibError(msg)
 
-        metrics_text = metrics_text[:i + len(ELEM_STRING_END_METRICS)]
-        return metrics_text
+        return text[i:j + len(FOOTER_END_METRICS)]
 
 
     def addMessage(self, msg):
-        self.messages.append(msg)
+        if not self.streaming:
+            self.messages.append(msg)
 
     def getCM(self):
         return self.cm
@@ -433,6 +662,19 @@ class AnnotatedBuild(AnnoXMLNames):
     def getMetrics(self):
         return self.metrics
 
+    def getPathTable(self):
+        """Returns the PathTable that holds the file names of the
+        ops and deps of the jobs that have been parsed."""
+        return self.path_table
+
+    def _jobPathTable(self):
+        """Returns the PathTable for a Job that is about to be
+        parsed. In streaming mode, each Job has its own."""
+        if self.streaming:
+            return pathtable.PathTable()
+        else:
+            return self.path_table
+
     def getMetric(self, name):
         return self.metrics.get(name)
 
@@ -440,8 +682,14 @@ class AnnotatedBuild(AnnoXMLNames):
         return self.messages
 
     def addMakeProcess(self, make_elem):
+        # In streaming mode, the parser keeps the MakeProcesses that
+        # are still open, and each Job keeps its own.
+        if self.streaming:
+            return
+
+        # A second pass over the jobs, or getJob(), can find
+        # a MakeProcess that we already know about; that's ok.
         make_id = make_elem.getID()
-        assert make_id not in self.make_procs
         self.make_procs[make_id] = make_elem
 
     def getMakeProcess(self, make_id):
@@ -450,13 +698,21 @@ class AnnotatedBuild(AnnoXMLNames):
     def addMakeJob(self, job):
         # For Make #0, we will be passed None for job,
         # so check for that.
-        if job:
+        if job and not self.streaming:
             job_id = job.getID()
-            assert job_id not in self.make_jobs
             self.make_jobs[job_id] = job
 
     def getMakeJob(self, job_id):
-        return self.make_jobs.get(job_id)
+        job = self.make_jobs.get(job_id)
+
+        # If we have an index, we don't have to have seen the job
+        # already; we can read it.
+        if not job and job_id and self.job_index is not None:
+            job = self.getJob(job_id)
+            if job:
+                self.make_jobs[job_id] = job
+
+        return job
 
     def getMakePath(self, job):
         """This is just like getJobPath, but returns only
@@ -515,33 +771,319 @@ class AnnotatedBuild(AnnoXMLNames):
 
         return job_chain
 
-    def getAllJobs(self):
+    def getAllJobs(self, workers=None, fields=None):
         """Gather all Job records in a list and return that list.
         It's a convenience function; the same could be done via parseJobs()
         and the appropriate callback."""
 
-        jobs = [job for job in self.iterJobs()]
+        jobs = [job for job in self.iterJobs(workers, fields)]
 
         return jobs
 
-    def parseJobs(self, cb, user_data=None):
+    def parseJobs(self, cb, user_data=None, workers=None, fields=None):
         """Like iterJobs, but calls a callback function as cb(job, user_data).
         If the callback returns StopParseJobs, the iteration stops."""
-        for job in self.iterJobs():
+        for job in self.iterJobs(workers, fields):
             retval = cb(job, user_data)
             if retval == StopParseJobs:
                 break
 
-    def iterJobs(self):
-        """Parse jobs and yield one Job at a time."""
+    def iterJobs(self, workers=None, fields=None, prefilter=None):
+        """Parse jobs and yield one Job at a time.
+
+        If fields is given, it is a collection of JOB_FIELD_* names,
+        and only those child records of each Job are parsed; the
+        others are left empty. For example, fields=[JOB_FIELD_TIMING]
+        gives Jobs with timings, but no ops, deps, commands, etc.
+        The attributes of the <job> element, and the return value,
+        are always there. Can raise PyAnnolibError for an unknown field.
+
+        If prefilter (a JobPrefilter; see pyannolib/prefilter.py) is
+        given, the jobs are found by scanning the raw bytes of the file,
+        and only those that match the prefilter are parsed. That is
+        done serially; workers is ignored.
+
+        If workers is greater than 1, the jobs are parsed by that many
+        worker processes, but are still yielded in file order. That
+        needs the job index (see getJobIndex()), so it is only done if
+        the AnnotatedBuild was given a filename rather than a filehandle,
+        and the file is not a gzip or xz stream.
+
+        If there is an up-to-date cache file (see writeCache()), the
+        jobs are read from it instead of the XML. Those Jobs load their
+        child records when they are first used, so fields makes no
+        difference to them.
+
+        If the AnnotatedBuild was created with streaming=True, the
+        memory used by iterJobs() does not grow with the number of
+        jobs. The build does not keep the messages, the make jobs or
+        the finished MakeProcesses, and each Job has a PathTable of
+        its own, so getMessages(), getMakeJob(), getJobPath(), etc.,
+        know nothing. The cache, and workers, are not used, as they
+        need the whole build at once."""
+        if not self.fh:
+            raise PyAnnolibError("filehandle was not set in Build object")
+
+        skip_elements = _skipped_elements(fields)
+
+        if self.streaming:
+            workers = None
+            cache = None
+        else:
+            cache = self._getCache()
+
+        if cache is not None:
+            return cache.iterJobs(self)
+
+        if prefilter is not None:
+            parser = AnnoPrefilterBodyParser(self, self.ignore_unknown,
+                    prefilter, skip_elements)
+            return parser.parse()
+
+        jobs = self._iterParsedJobs(workers, skip_elements)
+
+        # Only complete jobs can be cached
+        if self.write_cache and self.filename and not skip_elements and \
+                not self.streaming:
+            return self._iterAndCache(jobs)
+        else:
+            return jobs
+
+    def iterEvents(self, fields=None):
+        """Parse the jobs and yield their parts as they are read, as
+        (event, job, record) tuples, where event is one of:
+
+            EVENT_JOB_START     the job's attributes have been read
+            EVENT_TIMING        record is a Timing of the job
+            EVENT_OP            record is an Operation of the job
+            EVENT_DEP           record is a Dependency of the job
+            EVENT_JOB_END       the rest of the job has been read
+
+        The job is the same Job object in all of a job's events. Its
+        attributes and MakeProcess are set at EVENT_JOB_START, and its
+        other child records (commands, outputs, etc.) by EVENT_JOB_END,
+        but the timings, ops and deps are only in the events, so a job
+        with a huge <opList> is never held in memory all at once.
+        record is None for EVENT_JOB_START and EVENT_JOB_END.
+
+        fields is as for iterJobs(); unwanted ops, etc., give no
+        events. The MakeProcesses, make jobs and Messages are added to
+        the build as with iterJobs(). This always parses the XML, with
+        pyexpat; the cache and the job index are not used."""
         if not self.fh:
             raise PyAnnolibError("filehandle was not set in Build object")
 
+        skip_elements = _skipped_elements(fields)
+
+        # getJob() may have moved the filehandle
+        self.fh.seek(self.body_offset, os.SEEK_SET)
+
+        parser = AnnoEventBodyParser(self, self.ignore_unknown, skip_elements)
+        prefix = self.xml_decl + "<" + self.ELEMENT_BUILD + ">"
+        return parser.parse(BodyStream(prefix, self.fh))
+
+    def _iterParsedJobs(self, workers, skip_elements=frozenset()):
+        """Parse the jobs from the XML, for iterJobs()"""
+        if workers > 1 and self.filename and _is_random_access(self.fh):
+            parser = AnnoParallelBodyParser(self, self.ignore_unknown, workers,
+                    skip_elements=skip_elements)
+            return parser.parse()
+
+        # getJob() may have moved the filehandle
+        self.fh.seek(self.body_offset, os.SEEK_SET)
+
         # Create the parser
-        parser = AnnoXMLBodyParser(self, self.ignore_unknown)
+        parser = self.body_parser_class(self, self.ignore_unknown,
+                skip_elements)
+
+        # Parse the body, starting where the header ends. The parser
+        # needs a root element, so give it a <build> of its own.
+        prefix = self.xml_decl + "<" + self.ELEMENT_BUILD + ">"
+        return parser.parse(BodyStream(prefix, self.fh))
+
+    def _getCache(self):
+        """Returns the BuildCache for this build, if the cache file
+        exists and is up to date, or None."""
+        if not self.cache_checked:
+            self.cache_checked = True
+            filenames = self._getPartFilenames()
+            if filenames:
+                cache = buildcache.BuildCache(jobindex.file_key(filenames))
+                if cache.load(buildcache.cache_filename(self.filename)):
+                    self.cache = cache
+        return self.cache
+
+    def _iterAndCache(self, jobs):
+        """Yield the jobs, adding them and the messages to a new
+        BuildCache. If all the jobs are read, the cache is saved."""
+        cache = buildcache.BuildCache(
+                jobindex.file_key(self._getPartFilenames()))
+
+        num_messages = len(self.messages)
+        for job in jobs:
+            # Any new messages came before this job
+            for msg in self.messages[num_messages:]:
+                cache.addMessage(msg)
+            num_messages = len(self.messages)
+
+            cache.addJob(job)
+            yield job
+
+        for msg in self.messages[num_messages:]:
+            cache.addMessage(msg)
+        cache.addMakeProcesses(self.make_procs)
+        cache.metrics = self.metrics
+
+        self._saveCache(cache)
+
+    def _saveCache(self, cache):
+        # Failure to write the cache (read-only directory, etc.)
+        # is not an error
+        try:
+            cache.save(buildcache.cache_filename(self.filename))
+        except (IOError, OSError):
+            return
+        self.cache = cache
+        self.cache_checked = True
+
+    def writeCache(self):
+        """Parse all the jobs and write the cache file next to the
+        annotation file, so that the next iterJobs() (in this process
+        or another) is fast. See pyannolib/buildcache.py"""
+        if not self.filename:
+            raise PyAnnolibError("writeCache() needs a filename")
+
+        # Make sure the jobs come from the XML, not an old cache
+        self.cache = None
+        self.cache_checked = True
+
+        write_cache = self.write_cache
+        self.write_cache = True
+        try:
+            for job in self.iterJobs():
+                pass
+        finally:
+            self.write_cache = write_cache
+
+    def _getPartFilenames(self):
+        """Returns the names of the annotation file parts, or None
+        if we were given a filehandle instead of a filename."""
+        if not self.filename:
+            return None
 
-        # Parse the file
-        return parser.parse(self.fh)
+        # anno_open() wraps a ConcatenatedFile in a BufferedReader
+        raw = getattr(self.fh, "raw", self.fh)
+        return getattr(raw, "filenames", [self.filename])
+
+    def _getParts(self):
+        """Returns a list of (filename, start_offset, size) tuples
+        for the annotation file parts."""
+        filenames = self._getPartFilenames()
+
+        # A single file may be compressed, so ask the filehandle
+        # for its (uncompressed) size.
+        if len(filenames) == 1:
+            pos = self.fh.tell()
+            self.fh.seek(0, os.SEEK_END)
+            size = self.fh.tell()
+            self.fh.seek(pos, os.SEEK_SET)
+            return [(filenames[0], 0, size)]
+
+        parts = []
+        start = 0
+        for filename in filenames:
+            size = os.path.getsize(filename)
+            parts.append((filename, start, size))
+            start += size
+        return parts
+
+    def getJobIndex(self):
+        """Returns the JobIndex for this build, loading it from the
+        sidecar file or building it (and writing the sidecar) if
+        necessary. See pyannolib/jobindex.py"""
+        if self.job_index is not None:
+            return self.job_index
+
+        pos = self.fh.tell()
+        try:
+            self.job_index = jobindex.load_or_build(self.fh,
+                    self._getPartFilenames(), self.body_offset)
+        except (IOError, OSError) as e:
+            raise PyAnnolibError(e)
+        finally:
+            self.fh.seek(pos, os.SEEK_SET)
+
+        return self.job_index
+
+    def _readSpan(self, offset, length):
+        self.fh.seek(offset, os.SEEK_SET)
+        data = self.fh.read(length)
+        if len(data) != length:
+            msg = "Short read at offset %d; is the job index stale?" % \
+                    (offset,)
+            raise PyAnnolibError(msg)
+        return data
+
+    def _getIndexedMakeProcess(self, make_num):
+        """Returns the MakeProcess for a make number in the job index."""
+        if make_num < 0:
+            return None
+
+        make_id = "M%08x" % (make_num,)
+        make_proc = self.make_procs.get(make_id)
+        if make_proc:
+            return make_proc
+
+        offset, length, parent_job_id = \
+                self.job_index.getMakeSpan(make_num)
+
+        text = self._readSpan(offset, length)
+        make_proc = _parse_make_text(text, offset, make_num)
+        make_proc.setParentJobID(parent_job_id)
+        self.addMakeProcess(make_proc)
+        return make_proc
+
+    def _readIndexedJob(self, offset, length, make_num):
+        text = self._readSpan(offset, length)
+        job = _parse_job_text(text, offset, self.ignore_unknown, (),
+                self.path_table)
+        job.setMakeProcess(self._getIndexedMakeProcess(make_num))
+        return job
+
+    def getJob(self, job_id):
+        """Returns the Job with the given ID, or None if there is
+        no such job. This uses the job index (see getJobIndex()) to
+        read and parse only that one job."""
+        jobs = self.getJobs([job_id])
+        if jobs:
+            return jobs[0]
+        else:
+            return None
+
+    def getJobs(self, job_ids):
+        """Returns a list of the Jobs with the given IDs, in the
+        order in which they appear in the annotation file. IDs that
+        are not in the file are skipped. Like getJob(), this uses
+        the job index."""
+        index = self.getJobIndex()
+
+        spans = []
+        for job_id in set(job_ids):
+            span = index.getJobSpan(job_id)
+            if span:
+                spans.append(span)
+
+        # Read in file order, to be kind to the disk
+        spans.sort()
+
+        pos = self.fh.tell()
+        try:
+            jobs = [self._readIndexedJob(offset, length, make_num)
+                    for (offset, length, make_num) in spans]
+        finally:
+            self.fh.seek(pos, os.SEEK_SET)
+
+        return jobs
 
 
 ####################################################
@@ -549,7 +1091,10 @@ class AnnotatedBuild(AnnoXMLNames):
         
 
 
-class MakeProcess:
+class MakeProcess(object):
+
+    __slots__ = ("level", "cmd", "cwd", "owd", "mode", "parent_job_id",
+            "make_proc_id")
 
     LEVEL = "level"
     CMD = "cmd"
@@ -562,7 +1107,7 @@ class MakeProcess:
         self.cmd = elem.get(self.CMD)
         self.cwd = elem.get(self.CWD)
         self.owd = elem.get(self.OWD) # implied, not required
-        self.mode = elem.get(self.MODE)
+        self.mode = _enum_values[elem.get(self.MODE)]
 
         # This is not stored as a field in the XML file; it is
         # constructed by noting the sequential order of <job>'s
@@ -608,6 +1153,11 @@ class MakeProcess:
 
 class Job(AnnoXMLNames):
 
+    __slots__ = ("job_id", "status", "thread", "type", "name", "needed_by",
+            "line", "file", "partof", "outputs", "make", "timings", "oplist",
+            "waiting_jobs", "commands", "deplist", "conflict", "vars",
+            "commit_times", "retval", "cache_row")
+
     ID = "id"
     STATUS  ="status"
     THREAD = "thread"
@@ -619,21 +1169,32 @@ class Job(AnnoXMLNames):
     SUCCESS = 0
     PARTOF = "partof"   # for FOLLOW-type jobs
 
-    def __init__(self, elem, ignore_unknown):
+    def __init__(self, elem, ignore_unknown, skip_elements=(),
+            path_table=None):
+        """elem is the <job> Element, or a dictionary of its attributes;
+        in that case the child records are added by the caller
+        (see AnnoExpatBodyParser). Child elements whose tags are
+        in skip_elements are not parsed (see iterJobs()). The file
+        names of the ops and deps are stored in path_table, which
+        should be the build's PathTable; if it is not given, the
+        Job gets a table of its own."""
         self.job_id = elem.get(self.ID)
-        self.status = elem.get(self.STATUS, JOB_STATUS_NORMAL)
+        self.status = _enum_values[elem.get(self.STATUS, JOB_STATUS_NORMAL)]
         self.thread = elem.get(self.THREAD)
-        self.type = elem.get(self.TYPE)
+        self.type = _enum_values[elem.get(self.TYPE)]
         self.name = elem.get(self.NAME)
         self.needed_by = elem.get(self.NEEDED_BY)
         self.line = elem.get(self.LINE)
         self.file = elem.get(self.FILE)
         self.partof = elem.get(self.PARTOF)
 
+        if path_table is None:
+            path_table = pathtable.PathTable()
+
         self.outputs = []
         self.make = None
         self.timings = []
-        self.oplist = []
+        self.oplist = OpList(path_table)
         self.waiting_jobs = []
         self.commands = []
         self.deplist = []
@@ -645,8 +1206,14 @@ class Job(AnnoXMLNames):
         # we assume success, but a <failed> record overrides that.
         self.retval = self.SUCCESS
 
+        if isinstance(elem, dict):
+            return
+
         for child_elem in list(elem):
-            if child_elem.tag == self.ELEMENT_TIMING:
+            if child_elem.tag in skip_elements:
+                continue
+
+            elif child_elem.tag == self.ELEMENT_TIMING:
                 timing = Timing(child_elem)
                 self.timings.append(timing)
 
@@ -675,7 +1242,7 @@ class Job(AnnoXMLNames):
                 self.conflict = Conflict(child_elem)
 
             elif child_elem.tag == self.ELEMENT_DEPLIST:
-                self.parseDepList(child_elem)
+                self.parseDepList(child_elem, path_table)
 
             elif child_elem.tag == self.ELEMENT_ENVIRONMENT:
                 for var_elem in list(child_elem):
@@ -697,19 +1264,36 @@ class Job(AnnoXMLNames):
     def __str__(self):
         return "<Job id=%s>" % (self.job_id,)
 
+    def __getattr__(self, name):
+        # A Job re-created from the build cache gets its child records
+        # (timings, ops, ...) the first time one of them is used.
+        # See pyannolib/buildcache.py. This is only called for
+        # attributes that have not been set.
+        if name not in buildcache.JOB_CHILD_ATTRS:
+            raise AttributeError(name)
+
+        try:
+            cache_row = self.cache_row
+        except AttributeError:
+            raise AttributeError(name)
+
+        del self.cache_row
+        (cache, job_num) = cache_row
+        cache.loadJobChildren(self, job_num)
+        return getattr(self, name)
+
     def parseOpList(self, elem):
         for child_elem in list(elem):
             if child_elem.tag == self.ELEMENT_OP:
-                op = Operation(child_elem)
-                self.oplist.append(op)
+                self.oplist.add(child_elem)
 
             else:
                 assert False, MSG_UNEXPECTED_XML_ELEM + child_elem.tag
 
-    def parseDepList(self, elem):
+    def parseDepList(self, elem, path_table):
         for child_elem in list(elem):
             if child_elem.tag == self.ELEMENT_DEP:
-                dep = Dependency(child_elem)
+                dep = Dependency(child_elem, path_table)
                 self.deplist.append(dep)
 
             else:
@@ -725,6 +1309,16 @@ class Job(AnnoXMLNames):
     def setMakeProcess(self, make_elem):
         self.make = make_elem
 
+    def setPathTable(self, path_table):
+        """Move the file names of the ops and deps to another
+        PathTable, such as the build's, from the one they were
+        parsed into."""
+        self.oplist.setPathTable(path_table)
+        ids = path_table.ids
+        for dep in self.deplist:
+            dep.file_id = ids[dep.getFile()]
+            dep.path_table = path_table
+
     def getID(self):
         return self.job_id
 
@@ -741,6 +1335,7 @@ class Job(AnnoXMLNames):
         return self.outputs
 
     def getOperations(self):
+        """Returns the OpList of the job's Operations."""
         return self.oplist
 
     def getMakeProcess(self):
@@ -749,6 +1344,36 @@ class Job(AnnoXMLNames):
     def getTimings(self):
         return self.timings
 
+    def getFirstInvoked(self):
+        """Returns the earliest invoked time of the job's timings
+        (a job that is re-run has more than one), or None."""
+        times = [timing.invoked for timing in self.timings
+                if timing.invoked is not None]
+        if times:
+            return min(times)
+        else:
+            return None
+
+    def getLastCompleted(self):
+        """Returns the latest completed time of the job's timings,
+        or None."""
+        times = [timing.completed for timing in self.timings
+                if timing.completed is not None]
+        if times:
+            return max(times)
+        else:
+            return None
+
+    def getAgentTime(self):
+        """Returns the total time that agents spent on the job,
+        over all of its runs."""
+        return sum([timing.getDuration() or 0.0
+            for timing in self.timings])
+
+    first_invoked = property(getFirstInvoked)
+    last_completed = property(getLastCompleted)
+    agent_time = property(getAgentTime)
+
     def getWaitingJobs(self):
         return self.waiting_jobs
 
@@ -820,9 +1445,9 @@ Thread:    %s
             text += self.conflict.getTextReport()
             text += "\n"
 
-        if self.commitTimes:
-            text += "Commands:\n"
-            text += self.commitTimes.getTextReport()
+        if self.commit_times:
+            text += "Commit Times:\n"
+            text += self.commit_times.getTextReport()
             text += "\n"
 
         if self.timings:
@@ -940,25 +1565,39 @@ Thread:    %s
 #            del self.make_id
 
 
-class Operation:
+class Operation(object):
+
+    __slots__ = ("type", "file_id", "path_table", "filetype", "found",
+            "isdir")
+
     TYPE = "type"
     FILE = "file"
     FILETYPE = "filetype"
     FOUND = "found"
     ISDIR = "isdir"
 
-    def __init__(self, elem):
-        self.type = elem.get(self.TYPE)
-        self.file = elem.get(self.FILE)
-        self.filetype = elem.get(self.FILETYPE, OP_FILETYPE_FILE)
-        self.found = elem.get(self.FOUND, OP_FOUND_TRUE)
-        self.isdir = elem.get(self.ISDIR, OP_ISDIR_TRUE)
+    def __init__(self, elem, path_table):
+        """The file name is stored in path_table, the build's
+        PathTable; see getFileID()."""
+        self.type = _enum_values[elem.get(self.TYPE)]
+        self.file_id = path_table.ids[elem.get(self.FILE)]
+        self.path_table = path_table
+        self.filetype = _enum_values[elem.get(self.FILETYPE, OP_FILETYPE_FILE)]
+        self.found = _enum_values[elem.get(self.FOUND, OP_FOUND_TRUE)]
+        self.isdir = _enum_values[elem.get(self.ISDIR, OP_ISDIR_TRUE)]
 
     def getType(self):
         return self.type
 
     def getFile(self):
-        return self.file
+        return self.path_table.paths[self.file_id]
+
+    file = property(getFile)
+
+    def getFileID(self):
+        """The ID of the file name in the build's PathTable. Two
+        records have the same file if they have the same ID."""
+        return self.file_id
 
     def getFileType(self):
         return self.filetype
@@ -966,51 +1605,209 @@ class Operation:
     def getFound(self):
         return self.found
 
+    def getIsDir(self):
+        return self.isdir
+
     def getTextReport(self):
         if self.found == "1":
             found = "found"
         else:
             found = "not-found"
-        text  = "(%s,%s,%s) %s\n" % (self.type, self.filetype, found, self.file)
+        text  = "(%s,%s,%s) %s\n" % (self.type, self.filetype, found,
+                self.getFile())
         return text
 
 
-class Timing:
+class OpList(object):
+    """The Operations of a Job. A link step can have 100,000 ops, so
+    instead of an Operation object per op, the ops are kept in two
+    arrays: the ID of each op's file in the build's PathTable, and
+    four one-byte codes per op, for its type, filetype, found and isdir
+    values (see _OpCodes). Iterating over an OpList yields Operation
+    objects, made as they are needed; changing them does not change
+    the OpList."""
+
+    __slots__ = ("file_ids", "codes", "path_table")
+
+    # The codes of an op, in order
+    NUM_CODES = 4
+
+    def __init__(self, path_table):
+        self.file_ids = array.array("i")
+        self.codes = array.array("B")
+        self.path_table = path_table
+
+    def __getstate__(self):
+        # Another process may have different codes for values
+        # that are not known up front
+        return (self.file_ids, self.codes, self.path_table,
+                _op_codes.values)
+
+    def __setstate__(self, state):
+        (self.file_ids, self.codes, self.path_table, values) = state
+        code_map = [_op_codes[value] for value in values]
+        if code_map != range(len(code_map)):
+            self.codes = array.array("B",
+                    map(code_map.__getitem__, self.codes))
+
+    def add(self, elem):
+        """Add an op, from its <op> Element, or a dictionary of
+        its attributes."""
+        self.file_ids.append(self.path_table.ids[elem.get(Operation.FILE)])
+        self.codes.extend((_op_codes[elem.get(Operation.TYPE)],
+            _op_codes[elem.get(Operation.FILETYPE, OP_FILETYPE_FILE)],
+            _op_codes[elem.get(Operation.FOUND, OP_FOUND_TRUE)],
+            _op_codes[elem.get(Operation.ISDIR, OP_ISDIR_TRUE)]))
+
+    def append(self, op):
+        """Add an Operation."""
+        self.file_ids.append(self.path_table.ids[op.getFile()])
+        self.codes.extend((_op_codes[op.type], _op_codes[op.filetype],
+            _op_codes[op.found], _op_codes[op.isdir]))
+
+    def addColumns(self, types, files, filetypes, founds, isdirs):
+        """Add many ops at once, from an iterable of the values of
+        each attribute."""
+        self.file_ids.extend(imap(self.path_table.ids.__getitem__, files))
+        self.codes.extend(imap(_op_codes.__getitem__,
+            chain.from_iterable(izip(types, filetypes, founds, isdirs))))
+
+    def __len__(self):
+        return len(self.file_ids)
+
+    def __iter__(self):
+        values = _op_codes.values
+        path_table = self.path_table
+        new_op = Operation.__new__
+
+        # The same iterator four times, to take the codes four at a time
+        codes = iter(self.codes)
+        for (file_id, op_type, filetype, found, isdir) in \
+                izip(self.file_ids, codes, codes, codes, codes):
+            op = new_op(Operation)
+            op.type = values[op_type]
+            op.file_id = file_id
+            op.path_table = path_table
+            op.filetype = values[filetype]
+            op.found = values[found]
+            op.isdir = values[isdir]
+            yield op
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+
+        file_id = self.file_ids[index]
+        if index < 0:
+            index += len(self.file_ids)
+        codes = self.codes[index * self.NUM_CODES:
+                (index + 1) * self.NUM_CODES]
+        values = _op_codes.values
+
+        op = Operation.__new__(Operation)
+        op.type = values[codes[0]]
+        op.file_id = file_id
+        op.path_table = self.path_table
+        op.filetype = values[codes[1]]
+        op.found = values[codes[2]]
+        op.isdir = values[codes[3]]
+        return op
+
+    def setPathTable(self, path_table):
+        """Move the file names to another PathTable; see
+        Job.setPathTable()."""
+        paths = self.path_table.paths
+        self.file_ids = array.array("i",
+                path_table.getIDs(map(paths.__getitem__, self.file_ids)))
+        self.path_table = path_table
+
+    def countByType(self):
+        """Returns a dictionary of the number of ops of each type.
+        Key = op type, Value = count"""
+        types = self.codes[0::self.NUM_CODES]
+        values = _op_codes.values
+        return dict([(values[code], types.count(code))
+            for code in set(types)])
+
+    def getFileIDs(self, op_types=None):
+        """Returns the list of the file IDs of the ops whose types
+        are in op_types, or of all the ops. An ID is in the list
+        once for each op."""
+        if op_types is None:
+            return self.file_ids.tolist()
+
+        wanted = set([_op_codes[op_type] for op_type in op_types
+            if op_type in _op_codes])
+        return list(compress(self.file_ids,
+            imap(wanted.__contains__, self.codes[0::self.NUM_CODES])))
+
+    def getFiles(self, op_types=None):
+        """Like getFileIDs(), but returns the file names."""
+        return map(self.path_table.paths.__getitem__,
+                self.getFileIDs(op_types))
+
+    def getWrittenFiles(self):
+        """Returns the names of the files the ops changed
+        (see OP_WRITE_TYPES), without duplicates, in the order
+        they were first changed."""
+        seen = set()
+        file_ids = [file_id for file_id in self.getFileIDs(OP_WRITE_TYPES)
+                if file_id not in seen and not seen.add(file_id)]
+        return map(self.path_table.paths.__getitem__, file_ids)
+
+
+class Timing(object):
+
+    __slots__ = ("invoked", "completed", "node")
+
     INVOKED = "invoked"
     COMPLETED = "completed"
     NODE = "node"
 
     def __init__(self, elem):
-        self.invoked = elem.get(self.INVOKED)
-        self.completed = elem.get(self.COMPLETED)
-        self.node = elem.get(self.NODE)
+        # The times are seconds since the start of the build;
+        # they are parsed once, here, as every report needs
+        # them as numbers.
+        self.invoked = _parse_time(elem.get(self.INVOKED))
+        self.completed = _parse_time(elem.get(self.COMPLETED))
+        # There are only as many nodes as there are agents
+        self.node = _enum_values[elem.get(self.NODE)]
 
     def getInvoked(self):
+        """Returns the invoked time, as a float, or None."""
         return self.invoked
 
     def getCompleted(self):
+        """Returns the completed time, as a float, or None."""
         return self.completed
 
     def getNode(self):
         return self.node
 
-    def getTextReport(self):
+    def getDuration(self):
+        """Returns completed - invoked, or None if either is missing."""
+        if self.invoked is None or self.completed is None:
+            return None
+        return self.completed - self.invoked
 
-        try:
-            duration = float(self.completed) - float(self.invoked)
-        except ValueError:
-            duration = None
+    duration = property(getDuration)
 
+    def getTextReport(self):
         text = " Node: %s " % (self.node,)
         padding = "        " + " " * len(self.node,)
-        text += "Invoked:    %15s sec\n" % (self.invoked, )
-        text += padding + "Completed:  %15s sec\n" % (self.completed, )
-        text += padding + "Duration:   %15s sec\n" % (duration, )
+        text += "Invoked:    %15s sec\n" % (format_time(self.invoked), )
+        text += padding + "Completed:  %15s sec\n" % \
+                (format_time(self.completed), )
+        text += padding + "Duration:   %15s sec\n" % \
+                (format_time(self.getDuration()), )
 
         return text
 
 
 class Command(AnnoXMLNames):
+
+    __slots__ = ("line", "argv", "outputs")
+
     LINE = "line"
 
     def __init__(self, elem):
@@ -1019,6 +1816,10 @@ class Command(AnnoXMLNames):
         self.argv = ""
         self.outputs = []
 
+        # A dictionary of attributes has no children
+        if isinstance(elem, dict):
+            return
+
         for child_elem in list(elem):
             if child_elem.tag == self.ELEMENT_ARGV:
                 assert not self.argv
@@ -1050,10 +1851,13 @@ class Command(AnnoXMLNames):
             text += output.getTextReport()
         return text
 
-class Output:
+class Output(object):
+
+    __slots__ = ("text", "src")
+
     def __init__(self, text, src):
         self.text = text
-        self.src = src
+        self.src = _enum_values[src]
 
     def getText(self):
         return self.text
@@ -1070,38 +1874,51 @@ class Output:
         return text_report
 
 
-class Dependency:
+class Dependency(object):
+
+    __slots__ = ("write_job", "file_id", "path_table", "type")
+
     WRITE_JOB = "writejob"
     FILE = "file"
     TYPE = "type"
 
-    def __init__(self, elem):
+    def __init__(self, elem, path_table):
+        """Like Operation, the file name is stored in path_table."""
         self.write_job = elem.get(self.WRITE_JOB)
-        self.file = elem.get(self.FILE)
-        self.type = elem.get(self.TYPE, DEP_TYPE_FILE)
+        self.file_id = path_table.ids[elem.get(self.FILE)]
+        self.path_table = path_table
+        self.type = _enum_values[elem.get(self.TYPE, DEP_TYPE_FILE)]
 
     def getWriteJob(self):
         return self.write_job
 
     def getFile(self):
-        return self.file
+        return self.path_table.paths[self.file_id]
+
+    file = property(getFile)
+
+    def getFileID(self):
+        return self.file_id
 
     def getType(self):
         return self.type
 
     def getTextReport(self):
-        text  = "File: %s\n" % (self.file,)
+        text  = "File: %s\n" % (self.getFile(),)
         text += "Type: %s WriteJob: %s\n\n" % (self.type, self.write_job)
         return text
 
-class Conflict:
+class Conflict(object):
+
+    __slots__ = ("type", "write_job", "file", "rerun_by")
+
     TYPE = "type"
     WRITE_JOB = "writejob"
     FILE = "file"
     RERUN_BY = "rerunby"
 
     def __init__(self, elem):
-        self.type = elem.get(self.TYPE)
+        self.type = _enum_values[elem.get(self.TYPE)]
         self.write_job = elem.get(self.WRITE_JOB)
         self.file = elem.get(self.FILE)
         self.rerun_by = elem.get(self.RERUN_BY)
@@ -1126,7 +1943,10 @@ Rerun By: %s
 """ % (self.file, self.type, self.write_job, self.rerun_by)
 
 
-class CommitTimes:
+class CommitTimes(object):
+
+    __slots__ = ("start", "wait", "commit", "write")
+
     START = "start"
     WAIT = "wait"
     COMMIT = "commit"
@@ -1158,7 +1978,10 @@ Write: %s
 """ % (self.start, self.wait, self.commit, self.write)
 
 
-class Message:
+class Message(object):
+
+    __slots__ = ("thread", "time", "severity", "code", "text")
+
     THREAD = "thread"
     TIME = "time"
     SEVERITY = "severity"
@@ -1167,9 +1990,14 @@ class Message:
     def __init__(self, elem):
         self.thread = elem.get(self.THREAD)
         self.time = elem.get(self.TIME)
-        self.severity = elem.get(self.SEVERITY)
+        self.severity = _enum_values[elem.get(self.SEVERITY)]
         self.code = elem.get(self.CODE)
-        self.text = elem.text
+
+        # A dictionary of attributes has no text; use setText()
+        if isinstance(elem, dict):
+            self.text = None
+        else:
+            self.text = elem.text
 
     def setText(self, text):
         self.text = text
@@ -1190,14 +2018,46 @@ class Message:
         return self.code
 
 
+class BodyStream:
+    """A read-only file-like object that returns some prefix text,
+    and then the rest of a filehandle, starting at its current
+    position. This lets us parse the body of the annotation file
+    without the header, by making a new root element for it."""
+
+    def __init__(self, prefix, fh):
+        self.prefix = prefix
+        self.fh = fh
+
+    def read(self, num_bytes=-1):
+        if not self.prefix:
+            return self.fh.read(num_bytes)
+
+        if num_bytes < 0:
+            data = self.prefix + self.fh.read()
+            self.prefix = ""
+            return data
+
+        data = self.prefix[:num_bytes]
+        self.prefix = self.prefix[num_bytes:]
+        if len(data) < num_bytes:
+            data += self.fh.read(num_bytes - len(data))
+        return data
+
+
 class AnnoXMLBodyParser(AnnoXMLNames):
 
-    def __init__(self, build, ignore_unknown):
+    def __init__(self, build, ignore_unknown, skip_elements=frozenset()):
         self.build = build
         self.chars = ""
         self.indent = 0
         self.ignore_unknown = ignore_unknown
 
+        # The <job> sub-elements that are not wanted; see iterJobs().
+        # All of them but <output> (which is in <command>, too) can
+        # be freed as soon as they are parsed.
+        self.skip_elements = skip_elements
+        self.cleared_elements = skip_elements - set([self.ELEMENT_OUTPUT])
+
         # In local mode builds, make elements can nest,
         # so this list of make_elem's is a stack.
         self.make_elems = []
@@ -1213,6 +2073,26 @@ class AnnoXMLBodyParser(AnnoXMLNames):
 
         self.metrics = {}
 
+        # The <build> and the open <make> elements, while parse() runs.
+        # Clearing an element frees what is in it, but not the element
+        # itself, so the finished children are removed from these, too;
+        # otherwise an empty element per job would stay in memory.
+        self.open_elems = []
+
+
+    def iterparse(self, fh, events):
+        return ET.iterparse(fh, events=events)
+
+    def pruneFinished(self, elem):
+        """Remove the children of the innermost open element that come
+        before elem, which has just ended; they are finished. elem stays,
+        as lxml has yet to give it its tail text, and so do the children
+        after it, which iterparse() may have read ahead."""
+        parent = self.open_elems[-1]
+        for (i, child) in enumerate(parent):
+            if child is elem:
+                del parent[:i]
+                return
 
     def parse(self, fh, use_generator=False):
     
@@ -1242,7 +2122,7 @@ class AnnoXMLBodyParser(AnnoXMLNames):
         # http://effbot.org/zone/element-iterparse.htm#incremental-parsing
         START_EVENT = "start"
         END_EVENT = "end"
-        icontext = ET.iterparse(fh, events=(START_EVENT, END_EVENT))
+        icontext = self.iterparse(fh, events=(START_EVENT, END_EVENT))
 
         # Turn the context into an iterator
         context = iter(icontext)
@@ -1250,11 +2130,14 @@ class AnnoXMLBodyParser(AnnoXMLNames):
         # Get the root element
         event, root = context.next()
 
+        self.open_elems = [root]
+
         #for action, elem in ET.iterparse(fh):
         for event, elem in context:
             if event == START_EVENT:
                 if elem.tag == self.ELEMENT_MAKE:
                     self.startMake(elem)
+                    self.open_elems.append(elem)
                     continue
                 else:
                     # Skip all other START events
@@ -1264,9 +2147,14 @@ class AnnoXMLBodyParser(AnnoXMLNames):
             def call_yield(job):
                 yield job
 
+            if elem.tag in self.cleared_elements:
+                elem.clear()
+                continue
+
             if elem.tag == self.ELEMENT_JOB:
                 assert len(self.make_elems) > 0
-                job = Job(elem, self.ignore_unknown)
+                job = Job(elem, self.ignore_unknown, self.skip_elements,
+                        self.build._jobPathTable())
 
                 job.setMakeProcess(self.make_elems[-1])
 
@@ -1277,13 +2165,18 @@ class AnnoXMLBodyParser(AnnoXMLNames):
                 # we know which job begins a Make process.
                 self.prev_job_elem = job
 
+                self.pruneFinished(elem)
+
             elif elem.tag == self.ELEMENT_MESSAGE:
                 msg = Message(elem)
                 self.build.addMessage(msg)
+                self.pruneFinished(elem)
 
             elif elem.tag == self.ELEMENT_MAKE:
                 assert len(self.make_elems) > 0
                 self.make_elems.pop()
+                self.open_elems.pop()
+                self.pruneFinished(elem)
 
             # Explicitly skip elements that are sub-elements
             # of Job
@@ -1326,10 +2219,11 @@ class AnnoXMLBodyParser(AnnoXMLNames):
             elif elem.tag == self.ELEMENT_VAR:
                 continue
 
-            # We handled metrics at the beginning of
-            # the parse
+            # We usually handled metrics at the beginning of
+            # the parse, but not for compressed streams.
             elif elem.tag == self.ELEMENT_METRICS:
-                continue
+                if not self.build.metrics:
+                    self.build._store_metrics(elem)
 
             # Explicitly skip ourself!
             elif elem.tag == self.ELEMENT_BUILD:
@@ -1346,7 +2240,11 @@ class AnnoXMLBodyParser(AnnoXMLNames):
 
 
     def startMake(self, elem):
-        make_elem = MakeProcess(elem, self.make_proc_num, self)
+        # If we've seen this make before (a second pass over the file,
+        # or getJob()), keep using the same object.
+        make_elem = self.build.getMakeProcess("M%08x" % (self.make_proc_num,))
+        if not make_elem:
+            make_elem = MakeProcess(elem, self.make_proc_num, self)
 
         self.make_proc_num += 1
 
@@ -1370,11 +2268,710 @@ class AnnoXMLBodyParser(AnnoXMLNames):
 
 
 
+class AnnoLxmlBodyParser(AnnoXMLBodyParser):
+    """The same as AnnoXMLBodyParser, but with lxml's iterparse()."""
+
+    def iterparse(self, fh, events):
+        # huge_tree lifts lxml's limits on the size of text nodes,
+        # as job outputs can be very large.
+        return lxml_etree.iterparse(fh, events=events, huge_tree=True)
+
+
+class AnnoExpatBodyParser(AnnoXMLBodyParser):
+    """Parses the body with pyexpat callbacks, creating the Job,
+    Operation, Timing, etc., objects directly from the attributes of
+    each element, without building an ElementTree element first.
+    The results are the same as AnnoXMLBodyParser's."""
+
+    # How much of the file is given to expat at a time
+    READ_SIZE = 256 * 1024
+
+    def __init__(self, build, ignore_unknown, skip_elements=frozenset()):
+        AnnoXMLBodyParser.__init__(self, build, ignore_unknown, skip_elements)
+
+        # The job, and the command in the job, being parsed,
+        # and the PathTable for the job's file names
+        self.job = None
+        self.command = None
+        self.path_table = None
+
+        # The name of the environment variable or metric being parsed
+        self.text_name = None
+
+        # The pieces of the text of the current element, if
+        # it is an element whose text we want
+        self.text = []
+
+        # Jobs and Messages, parsed but not yet handed out by parse()
+        self.records = []
+
+        # Does the data being parsed have any non-ASCII bytes?
+        self.non_ascii = False
+
+        self.start_handlers = {
+            self.ELEMENT_JOB : self.startJob,
+            self.ELEMENT_TIMING : self.startTiming,
+            self.ELEMENT_DEP : self.startDep,
+            self.ELEMENT_COMMAND : self.startCommand,
+            self.ELEMENT_ARGV : self.startText,
+            self.ELEMENT_OUTPUT : self.startText,
+            self.ELEMENT_VAR : self.startNamedText,
+            self.ELEMENT_FAILED : self.startFailed,
+            self.ELEMENT_CONFLICT : self.startConflict,
+            self.ELEMENT_COMMIT_TIMES : self.startCommitTimes,
+            self.ELEMENT_WAITING_JOBS : self.startWaitingJobs,
+            self.ELEMENT_MESSAGE : self.startText,
+            self.ELEMENT_METRIC : self.startNamedText,
+            self.ELEMENT_MAKE : self.startMake,
+        }
+
+        self.end_handlers = {
+            self.ELEMENT_JOB : self.endJob,
+            self.ELEMENT_COMMAND : self.endCommand,
+            self.ELEMENT_ARGV : self.endArgv,
+            self.ELEMENT_OUTPUT : self.endOutput,
+            self.ELEMENT_VAR : self.endVar,
+            self.ELEMENT_MESSAGE : self.endMessage,
+            self.ELEMENT_METRIC : self.endMetric,
+            self.ELEMENT_METRICS : self.endMetrics,
+            self.ELEMENT_MAKE : self.endMake,
+        }
+
+        # Elements that need no handling of their own
+        self.other_elements = set([
+            self.ELEMENT_OPLIST, self.ELEMENT_DEPLIST,
+            self.ELEMENT_ENVIRONMENT, self.ELEMENT_METRICS,
+            self.ELEMENT_PROPERTIES, self.ELEMENT_PROPERTY,
+            self.ELEMENT_BUILD])
+
+        # Everything inside an unwanted element is passed over by
+        # startSkip(). <output> is only skipped if it is the job's
+        # output, not a command's.
+        for tag in skip_elements:
+            if tag == self.ELEMENT_OUTPUT:
+                self.start_handlers[tag] = self.startOutput
+            else:
+                self.start_handlers[tag] = self.startSkip
+                self.end_handlers.pop(tag, None)
+
+        # How deep we are in the element being skipped
+        self.skip_depth = 0
+
+    def parse(self, fh, use_generator=False):
+        self.parser = expat.ParserCreate()
+
+        # Have expat give us UTF-8 strs; _decode_text() turns
+        # them into unicode when they are not ASCII, as ElementTree does.
+        self.parser.returns_unicode = False
+        self.parser.buffer_text = True
+        self.parser.buffer_size = 65536
+
+        self.start_handler = self.makeStartHandler()
+        self.end_handler = self.makeEndHandler()
+        self.parser.StartElementHandler = self.start_handler
+        self.parser.EndElementHandler = self.end_handler
+
+        prev_non_ascii = False
+        while True:
+            data = fh.read(self.READ_SIZE)
+
+            # An element may start in the previous chunk, so check both
+            this_non_ascii = _has_non_ascii(data)
+            self.non_ascii = this_non_ascii or prev_non_ascii
+            prev_non_ascii = this_non_ascii
+
+            try:
+                self.parser.Parse(data, not data)
+            except expat.ExpatError as e:
+                msg = "Error parsing XML: %s" % (e,)
+                raise PyAnnolibError(msg)
+
+            for record in self.records:
+                if isinstance(record, Message):
+                    self.build.addMessage(record)
+                else:
+                    yield record
+            del self.records[:]
+
+            if not data:
+                break
+
+    def _attrs(self, attrs):
+        return dict([(name, _decode_text(value))
+            for (name, value) in attrs.items()])
+
+    # The start and end handlers are called for every element, so they
+    # are closures, with everything they need in local variables.
+
+    def makeStartHandler(self):
+        get_handler = self.start_handlers.get
+        ELEMENT_OP = self.ELEMENT_OP
+
+        def start(tag, attrs):
+            if self.non_ascii:
+                attrs = self._attrs(attrs)
+
+            # Ops are the most common element, so check for them first
+            if tag == ELEMENT_OP:
+                self.add_op(attrs)
+                return
+
+            handler = get_handler(tag)
+            if handler:
+                handler(attrs)
+            elif tag not in self.other_elements:
+                if not self.ignore_unknown:
+                    assert False, MSG_UNEXPECTED_XML_ELEM + tag
+
+        return start
+
+    def makeEndHandler(self):
+        get_handler = self.end_handlers.get
+
+        def end(tag):
+            handler = get_handler(tag)
+            if handler:
+                handler()
+
+        return end
+
+    def characters(self, data):
+        self.text.append(data)
+
+    def startSkip(self, attrs):
+        """Pass over this element and everything in it, until
+        its end tag."""
+        self.skip_depth = 1
+        self.parser.StartElementHandler = self.skipStart
+        self.parser.EndElementHandler = self.skipEnd
+
+    def skipStart(self, tag, attrs):
+        self.skip_depth += 1
 
-def anno_open(filename, mode="rb"):
+    def skipEnd(self, tag):
+        self.skip_depth -= 1
+        if self.skip_depth == 0:
+            self.parser.StartElementHandler = self.start_handler
+            self.parser.EndElementHandler = self.end_handler
+
+    def startOutput(self, attrs):
+        """Used instead of startText() for <output> if the
+        job's outputs are not wanted."""
+        if self.command:
+            self.startText(attrs)
+        else:
+            self.startSkip(attrs)
+
+    def startText(self, attrs):
+        """Start collecting the text of an element."""
+        self.attrs = attrs
+        self.text = []
+        self.parser.CharacterDataHandler = self.characters
+
+    def startNamedText(self, attrs):
+        self.text_name = attrs.get(self.ATTR_VAR_NAME)
+        self.startText(attrs)
+
+    def endText(self):
+        """Stop collecting text, and return it. Like ElementTree,
+        this returns None if there was no text."""
+        self.parser.CharacterDataHandler = None
+        text = "".join(self.text)
+        self.text = []
+        if text:
+            return _decode_text(text)
+        else:
+            return None
+
+    def startJob(self, attrs):
+        self.path_table = self.build._jobPathTable()
+        self.job = Job(attrs, self.ignore_unknown, (), self.path_table)
+        self.add_op = self.job.oplist.add
+
+    def endJob(self):
+        assert len(self.make_elems) > 0
+        self.job.setMakeProcess(self.make_elems[-1])
+        self.records.append(self.job)
+
+        # Set the "previous job" to this job, so that
+        # we know which job begins a Make process.
+        self.prev_job_elem = self.job
+        self.job = None
+
+    def startTiming(self, attrs):
+        self.job.timings.append(Timing(attrs))
+
+    def startDep(self, attrs):
+        self.job.deplist.append(Dependency(attrs, self.path_table))
+
+    def startCommand(self, attrs):
+        self.command = Command(attrs)
+        self.job.commands.append(self.command)
+
+    def endCommand(self):
+        self.command = None
+
+    def endArgv(self):
+        self.command.argv = self.endText()
+
+    def endOutput(self):
+        output_src = self.attrs.get(self.ATTR_OUTPUT_SRC, OUTPUT_SRC_MAKE)
+        output = Output(self.endText(), output_src)
+
+        # Is it the command output or the job output?
+        if self.command:
+            self.command.outputs.append(output)
+        else:
+            self.job.outputs.append(output)
+
+    def endVar(self):
+        text = self.endText()
+        if self.job:
+            self.job.vars[self.text_name] = text
+
+    def startFailed(self, attrs):
+        self.job.retval = int(attrs.get(self.ATTR_FAILED_CODE))
+
+    def startConflict(self, attrs):
+        self.job.conflict = Conflict(attrs)
+
+    def startCommitTimes(self, attrs):
+        self.job.commit_times = CommitTimes(attrs)
+
+    def startWaitingJobs(self, attrs):
+        # The job IDs are space-delimited in the string
+        self.job.waiting_jobs = attrs.get(self.ATTR_WAITINGJOBS_IDLIST).split()
+
+    def endMessage(self):
+        msg = Message(self.attrs)
+        msg.setText(self.endText())
+        self.records.append(msg)
+
+    def endMetric(self):
+        self.metrics[self.text_name] = self.endText()
+
+    def endMetrics(self):
+        # We usually handled metrics at the beginning of
+        # the parse, but not for compressed streams.
+        if not self.build.metrics:
+            self.build.metrics.update(self.metrics)
+
+    def endMake(self):
+        assert len(self.make_elems) > 0
+        self.make_elems.pop()
+
+
+class AnnoEventBodyParser(AnnoExpatBodyParser):
+    """Like AnnoExpatBodyParser, but parse() yields the events of
+    AnnotatedBuild.iterEvents() instead of whole Jobs. The timings,
+    ops and deps are handed out as they are parsed, and not added to
+    the Job. Events are yielded after each READ_SIZE of the file, so
+    only that much of a job is held at a time."""
+
+    def startJob(self, attrs):
+        AnnoExpatBodyParser.startJob(self, attrs)
+        self.job.setMakeProcess(self.make_elems[-1])
+        self.records.append((EVENT_JOB_START, self.job, None))
+        self.add_op = self.addOp
+
+    def addOp(self, attrs):
+        self.records.append((EVENT_OP, self.job,
+            Operation(attrs, self.path_table)))
+
+    def endJob(self):
+        job = self.job
+        AnnoExpatBodyParser.endJob(self)
+        # Replace the Job that endJob() added
+        self.records[-1] = (EVENT_JOB_END, job, None)
+
+    def startTiming(self, attrs):
+        self.records.append((EVENT_TIMING, self.job, Timing(attrs)))
+
+    def startDep(self, attrs):
+        self.records.append((EVENT_DEP, self.job,
+            Dependency(attrs, self.path_table)))
+
+
+# All the ASCII characters
+ASCII_CHARS = "".join([chr(i) for i in range(128)])
+
+def _has_non_ascii(data):
+    # Deleting the ASCII characters is much faster than a regex search
+    return len(data.translate(None, ASCII_CHARS)) > 0
+
+def _parse_time(text):
+    """Returns the float value of a time attribute, or None if
+    it is missing or not a number."""
+    if text is None:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+def format_time(seconds):
+    """Formats a time the way the annotation file does, with six
+    decimal places. None is returned as None."""
+    if seconds is None:
+        return None
+    return "%.6f" % (seconds,)
+
+def _decode_text(text):
+    """Returns the UTF-8 text as a str if it is ASCII, or as unicode
+    if not, as ElementTree does."""
+    try:
+        text.decode("ascii")
+        return text
+    except UnicodeDecodeError:
+        return text.decode("utf-8")
+
+
+# The body parser class for each backend
+BODY_PARSERS = {
+    BACKEND_ETREE : AnnoXMLBodyParser,
+    BACKEND_EXPAT : AnnoExpatBodyParser,
+    BACKEND_LXML : AnnoLxmlBodyParser,
+}
+
+
+def _mmap_file(fh):
+    """Returns a read-only mmap of the file open as fh, or None if
+    fh is not a plain file that can be mapped (a ConcatenatedFile,
+    or an empty file, for example)."""
+    try:
+        fileno = fh.fileno()
+    except (AttributeError, IOError, ValueError):
+        return None
+
+    try:
+        return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (mmap.error, ValueError, OverflowError):
+        return None
+
+
+def _is_random_access(fh):
+    """Can any position in fh be reached cheaply? Not if it is
+    a gzip or xz stream; see pyannolib/compressed.py"""
+    raw = getattr(fh, "raw", fh)
+    return getattr(raw, "random_access", True)
+
+
+def _parse_job_text(text, offset, ignore_unknown, skip_elements=(),
+        path_table=None):
+    """Parse the text of one <job> element into a Job."""
+    try:
+        elem = ET.fromstring(text)
+    except ET.ParseError as e:
+        msg = "Error parsing <job> at offset %d: %s" % (offset, e)
+        raise PyAnnolibError(msg)
+
+    return Job(elem, ignore_unknown, skip_elements, path_table)
+
+
+def _parse_make_text(text, offset, make_num):
+    """Parse the start tag of a <make> into a MakeProcess."""
+    # We have only the start tag, so close it to make it parseable.
+    if text.endswith("/>"):
+        text = text[:-2] + ">"
+    text += "</make>"
+
+    try:
+        elem = ET.fromstring(text)
+    except ET.ParseError as e:
+        msg = "Error parsing <make> at offset %d: %s" % (offset, e)
+        raise PyAnnolibError(msg)
+
+    return MakeProcess(elem, make_num, None)
+
+
+def _parse_chunk(chunk):
+    """Runs in a worker process for AnnoParallelBodyParser. Reads a chunk
+    of an annotation file and parses the records in it. Returns a list
+    of Job and Message objects, in file order. The Jobs have no
+    MakeProcess set, and their file names are in a PathTable of
+    their own; the parent process fixes both."""
+    (filename, chunk_offset, chunk_length, spans, ignore_unknown,
+            skip_elements) = chunk
+
+    fh = compressed.open_compressed(filename, read_ahead=False)
+    if fh is None:
+        fh = open(filename, "rb")
+    try:
+        fh.seek(chunk_offset, os.SEEK_SET)
+        data = fh.read(chunk_length)
+    finally:
+        fh.close()
+
+    # All the jobs in the chunk share one table, so it
+    # is pickled only once
+    path_table = pathtable.PathTable()
+
+    records = []
+    for (kind, offset, length) in spans:
+        text = data[offset:offset + length]
+        if kind == jobindex.REC_JOB:
+            records.append(_parse_job_text(text, chunk_offset + offset,
+                ignore_unknown, skip_elements, path_table))
+        else:
+            try:
+                elem = ET.fromstring(text)
+            except ET.ParseError as e:
+                msg = "Error parsing <message> at offset %d: %s" % \
+                        (chunk_offset + offset, e)
+                raise PyAnnolibError(msg)
+            records.append(Message(elem))
+
+    return records
+
+
+class AnnoParallelBodyParser:
+    """Parses the body of the annotation file with a pool of worker
+    processes. The job index (see pyannolib/jobindex.py) tells us where
+    every record is, and which <make> it belongs to, so the body can be
+    split into chunks at record boundaries. The chunks never cross from
+    one annotation file part to the next, so a worker can read its
+    chunk with a single seek and read."""
+
+    # The smallest and largest chunks we hand to a worker
+    MIN_CHUNK_SIZE = 256 * 1024
+    MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+    # How many chunks to create per worker, so that the workers
+    # stay busy even if some chunks are slower than others.
+    CHUNKS_PER_WORKER = 4
+
+    def __init__(self, build, ignore_unknown, workers, chunk_size=None,
+            skip_elements=frozenset()):
+        self.build = build
+        self.ignore_unknown = ignore_unknown
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.skip_elements = skip_elements
+
+    def _find_chunks(self, index):
+        """Returns a list of chunks. Each chunk is a tuple of:
+        (chunk, [(rec_num, make_num)])
+        where chunk is the argument for _parse_chunk()."""
+        parts = self.build._getParts()
+        total_size = sum([size for (_, _, size) in parts])
+
+        chunk_size = self.chunk_size
+        if not chunk_size:
+            chunk_size = total_size // (self.workers * self.CHUNKS_PER_WORKER)
+            chunk_size = max(self.MIN_CHUNK_SIZE,
+                    min(self.MAX_CHUNK_SIZE, chunk_size))
+
+        chunks = []
+        part_num = 0
+        cur_part = None
+        cur_start = cur_end = 0
+        cur_spans = []
+        cur_recs = []
+
+        def finish_chunk():
+            if cur_spans:
+                (filename, part_start, _) = cur_part
+                chunk = (filename, cur_start - part_start,
+                        cur_end - cur_start, cur_spans, self.ignore_unknown,
+                        self.skip_elements)
+                chunks.append((chunk, cur_recs))
+
+        for rec_num in range(index.getNumRecords()):
+            (kind, offset, length, make_num, _) = index.getRecord(rec_num)
+
+            while part_num < len(parts) - 1 and \
+                    offset >= parts[part_num + 1][1]:
+                part_num += 1
+
+            # A record that straddles two parts has to be read
+            # through the ConcatenatedFile, by the parent.
+            (_, part_start, part_size) = parts[part_num]
+            if offset + length > part_start + part_size:
+                finish_chunk()
+                chunks.append((None, [(rec_num, make_num)]))
+                cur_part = None
+                cur_spans = []
+                cur_recs = []
+                continue
+
+            if cur_part is not parts[part_num] or \
+                    offset + length - cur_start > chunk_size:
+                finish_chunk()
+                cur_part = parts[part_num]
+                cur_start = offset
+                cur_spans = []
+                cur_recs = []
+
+            cur_spans.append((kind, offset - cur_start, length))
+            cur_recs.append((rec_num, make_num))
+            cur_end = offset + length
+
+        finish_chunk()
+        return chunks
+
+    def _read_straddling_record(self, index, rec_num):
+        """Read a record that crosses from one file part to the next."""
+        (kind, offset, length, _, _) = index.getRecord(rec_num)
+        pos = self.build.fh.tell()
+        try:
+            text = self.build._readSpan(offset, length)
+        finally:
+            self.build.fh.seek(pos, os.SEEK_SET)
+
+        if kind == jobindex.REC_JOB:
+            return [_parse_job_text(text, offset, self.ignore_unknown,
+                self.skip_elements, self.build.path_table)]
+        else:
+            return [Message(ET.fromstring(text))]
+
+    def parse(self):
+        index = self.build.getJobIndex()
+
+        # The jobs that begat make processes
+        parent_job_ids = set(index.make_parent_job_ids)
+
+        # Create all the MakeProcesses up front
+        pos = self.build.fh.tell()
+        try:
+            for make_num in range(index.getNumMakes()):
+                self.build._getIndexedMakeProcess(make_num)
+        finally:
+            self.build.fh.seek(pos, os.SEEK_SET)
+
+        chunks = self._find_chunks(index)
+
+        pool = multiprocessing.Pool(self.workers)
+        try:
+            results = pool.imap(_parse_chunk,
+                    [chunk for (chunk, _) in chunks if chunk])
+
+            for (chunk, recs) in chunks:
+                if chunk:
+                    records = results.next()
+                else:
+                    records = self._read_straddling_record(index, recs[0][0])
+
+                for record, (rec_num, make_num) in zip(records, recs):
+                    if isinstance(record, Message):
+                        self.build.addMessage(record)
+                        continue
+
+                    record.setMakeProcess(
+                            self.build._getIndexedMakeProcess(make_num))
+                    record.setPathTable(self.build.path_table)
+
+                    if record.getID() in parent_job_ids:
+                        self.build.addMakeJob(record)
+
+                    yield record
+        finally:
+            pool.terminate()
+            pool.join()
+
+
+class AnnoPrefilterBodyParser(AnnoXMLNames):
+    """Parses only the jobs that a JobPrefilter lets through (see
+    pyannolib/prefilter.py). The body is scanned with
+    jobindex.scan_body(), which finds the <job>, <make> and <message>
+    elements in the raw bytes; only the jobs that match are handed to
+    the XML parser. The <make> start tags are parsed as they are found,
+    so the MakeProcesses, and their parent jobs, are the same as with
+    AnnoXMLBodyParser."""
+
+    def __init__(self, build, ignore_unknown, prefilter,
+            skip_elements=frozenset()):
+        self.build = build
+        self.ignore_unknown = ignore_unknown
+        self.prefilter = prefilter
+        self.skip_elements = skip_elements
+
+    def _parse_element(self, text, offset):
+        try:
+            return ET.fromstring(text)
+        except ET.ParseError as e:
+            msg = "Error parsing XML at offset %d: %s" % (offset, e)
+            raise PyAnnolibError(msg)
+
+    def parse(self):
+        build = self.build
+
+        # In local mode builds, make elements can nest,
+        # so this list of MakeProcesses is a stack.
+        make_stack = []
+        make_proc_num = 0
+
+        # The previous job, which is the parent job of the next <make>:
+        # (Job or None, text, offset, MakeProcess). It is parsed only
+        # if it didn't match the prefilter and a <make> follows it.
+        prev_job = None
+
+        events = jobindex.scan_body(build.fh, build.body_offset,
+                with_text=True)
+
+        for (kind, offset, length, attrs_text, text) in events:
+            if kind == jobindex.EVENT_JOB:
+                assert len(make_stack) > 0
+                if self.prefilter.match(attrs_text, text):
+                    job = _parse_job_text(text, offset, self.ignore_unknown,
+                            self.skip_elements, build._jobPathTable())
+                    job.setMakeProcess(make_stack[-1])
+                    prev_job = (job, None, offset, make_stack[-1])
+                    yield job
+                else:
+                    prev_job = (None, text, offset, make_stack[-1])
+
+            elif kind == jobindex.EVENT_MAKE:
+                make_proc = build.getMakeProcess("M%08x" % (make_proc_num,))
+                if not make_proc:
+                    make_proc = _parse_make_text(text, offset, make_proc_num)
+
+                # See AnnoXMLBodyParser.startMake()
+                parent_job = None
+                if make_proc_num > 0:
+                    assert prev_job
+                    (parent_job, job_text, job_offset, job_make) = prev_job
+                    if parent_job is None:
+                        parent_job = _parse_job_text(job_text, job_offset,
+                                self.ignore_unknown, self.skip_elements,
+                                build._jobPathTable())
+                        parent_job.setMakeProcess(job_make)
+                        prev_job = (parent_job, None, job_offset, job_make)
+
+                    if parent_job.getType() == JOB_TYPE_FOLLOW:
+                        make_proc.setParentJobID(parent_job.getPartOf())
+                    else:
+                        make_proc.setParentJobID(parent_job.getID())
+
+                make_proc_num += 1
+                make_stack.append(make_proc)
+                build.addMakeProcess(make_proc)
+                build.addMakeJob(parent_job)
+
+            elif kind == jobindex.EVENT_END_MAKE:
+                assert len(make_stack) > 0
+                make_stack.pop()
+
+            elif kind == jobindex.EVENT_MESSAGE:
+                build.addMessage(Message(self._parse_element(text, offset)))
+
+            elif kind == jobindex.EVENT_METRICS:
+                # We usually handled metrics at the beginning of
+                # the parse, but not for compressed streams.
+                if not build.metrics:
+                    build._store_metrics(self._parse_element(text, offset))
+
+
+def anno_open(filename, mode="rb", use_mmap=False):
     """Return either a Python file object, if there is only one
     annotation file, or a ConcatenatedFile object, which acts
-    like a single file object, but magically combines multiple files."""
+    like a single file object, but magically combines multiple files.
+    The ConcatenatedFile is wrapped in an io.BufferedReader, so
+    reads from the files are large. If use_mmap is True, the
+    ConcatenatedFile memory-maps each file instead of reading it.
+
+    A gzip, xz, or block-compressed file (see pyannolib/compressed.py)
+    is recognized by its first bytes, and is returned as an
+    io.BufferedReader that reads the uncompressed data."""
     # Fill in the array of file names
     filenames = [filename]
 
@@ -1391,9 +2988,23 @@ def anno_open(filename, mode="rb"):
             # No more files
             break
 
+    try:
+        raw = compressed.open_compressed(filename)
+    except compressed.CompressedFileError as e:
+        raise PyAnnolibError(e)
+
+    if raw is not None:
+        if len(filenames) > 1:
+            raw.close()
+            msg = "Multi-part compressed annotation files are not " \
+                    "supported: %s" % (filename,)
+            raise PyAnnolibError(msg)
+        return io.BufferedReader(raw, ANNO_BUFFER_SIZE)
+
     if len(filenames) == 1:
         return open(filename, mode)
     else:
         if not mode in [READ, READ_BINARY]:
             raise PyAnnolibError("Only read-only mode is supported.")
-        return concatfile.ConcatenatedFile(filenames, mode)
+        raw = concatfile.ConcatenatedFile(filenames, mode, use_mmap)
+        return io.BufferedReader(raw, ANNO_BUFFER_SIZE)
@@ -0,0 +1,412 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+A binary cache of the parsed body of an annotation file.
+
+Parsing the XML is the slow part of reading an annotation file. The
+cache stores the result of a complete parse (the jobs, with their
+timings, operations, dependencies, conflicts, commands and outputs,
+the make processes, and the messages) so that the next iterJobs()
+can re-create the same objects without any XML parsing.
+
+The data is stored in columns. Each record type (jobs, timings, ops,
+...) is a table, and each attribute of the record is a column: an
+array of integers. Strings are stored once, in a string table, and the
+columns hold their indices; index 0 is None. A job's child records
+are found by the "first_" columns of the job table: a job owns the
+rows of the timing table from its first_timing up to the next job's
+first_timing. The columns and the string table are written to a
+"sidecar" file next to the annotation file (see sidecar.py for the
+format), keyed, like the job index sidecar, by the size and
+modification time of each annotation file part.
+
+Creating Python objects is most of the cost of reading the cache, so
+a Job re-created from the cache has only its own attributes. Its child
+records (the attributes in JOB_CHILD_ATTRS) are created the first time
+one of them is used; see Job.__getattr__().
+"""
+
+import array
+from itertools import izip, imap, repeat, chain
+
+from pyannolib import sidecar
+
+# The suffix added to the annotation file name to make the cache name
+CACHE_SUFFIX = ".annocache"
+
+# The start of the cache file
+CACHE_MAGIC = "PYANNOBC"
+
+# Bump this if the contents of the cache, or the attributes of
+# the record classes, change
+CACHE_VERSION = 3
+
+# The array type code of the columns
+COLUMN_TYPE = "i"
+
+# How many records are re-created at a time
+RECORD_BATCH_SIZE = 1024
+
+# The string attributes stored for each kind of record
+MAKE_FIELDS = ("make_proc_id", "level", "cmd", "cwd", "owd", "mode",
+        "parent_job_id")
+JOB_FIELDS = ("job_id", "status", "thread", "type", "name", "needed_by",
+        "line", "file", "partof")
+TIMING_FIELDS = ("invoked", "completed", "node")
+OP_FIELDS = ("type", "file", "filetype", "found", "isdir")
+DEP_FIELDS = ("write_job", "file", "type")
+CONFLICT_FIELDS = ("type", "write_job", "file", "rerun_by")
+COMMIT_TIMES_FIELDS = ("start", "wait", "commit", "write")
+COMMAND_FIELDS = ("line", "argv")
+OUTPUT_FIELDS = ("text", "src")
+
+# The tables whose "file" column is kept in the build's PathTable;
+# the records get a file_id instead of the string. (The ops are
+# put in an OpList, which does the same.)
+PATH_TABLES = ("dep",)
+MESSAGE_FIELDS = ("thread", "time", "severity", "code", "text")
+WAITING_FIELDS = ("job_id",)
+VAR_FIELDS = ("name", "value")
+
+# The child tables of a job, in the order of the job table's
+# "first_" columns
+JOB_CHILD_TABLES = ("timing", "op", "dep", "conflict", "commit_times",
+        "command", "output", "waiting", "var")
+
+# The integer columns of the job table
+JOB_INT_FIELDS = ("make_num", "retval") + \
+        tuple(["first_" + table for table in JOB_CHILD_TABLES])
+
+# The Job attributes that are filled in from the child tables
+JOB_CHILD_ATTRS = ("timings", "oplist", "deplist", "conflict",
+        "commit_times", "commands", "outputs", "waiting_jobs", "vars")
+
+# A command owns rows in the command output table
+COMMAND_INT_FIELDS = ("first_output",)
+
+# A message knows how many jobs came before it
+MESSAGE_INT_FIELDS = ("after_jobs",)
+
+
+class BuildCache:
+    """The columns of a parsed annotation file body."""
+
+    def __init__(self, key=None):
+        # Identifies the annotation file(s) this cache was made from
+        self.key = key
+
+        # The string table; index 0 is None
+        self.strings = [None]
+        self.string_nums = {}
+
+        # Key = column name ("table.field"), Value = array
+        self.columns = {}
+
+        # Key = table name, Value = number of rows
+        self.table_sizes = {}
+
+        self.num_jobs = 0
+        self.metrics = {}
+
+        # The MakeProcesses, by make number, and the build's
+        # PathTable, while iterJobs() runs
+        self.makes = []
+        self.path_table = None
+
+    def _column(self, table, field):
+        name = table + "." + field
+        column = self.columns.get(name)
+        if column is None:
+            column = self.columns[name] = array.array(COLUMN_TYPE)
+        return column
+
+    def _string_num(self, text):
+        if text is None:
+            return 0
+        num = self.string_nums.get(text)
+        if num is None:
+            num = self.string_nums[text] = len(self.strings)
+            self.strings.append(text)
+        return num
+
+    def _add_row(self, table, fields, values, int_fields=(), ints=()):
+        for field, value in izip(fields, values):
+            self._column(table, field).append(self._string_num(value))
+        for field, value in izip(int_fields, ints):
+            self._column(table, field).append(value)
+        self.table_sizes[table] = self.table_sizes.get(table, 0) + 1
+
+    def _add_record(self, table, fields, record):
+        self._add_row(table, fields,
+                [getattr(record, field) for field in fields])
+
+    def addJob(self, job):
+        """Add a Job, and all its child records, to the cache."""
+        # The first row of each child table that this job owns
+        firsts = [self.table_sizes.get(table, 0)
+                for table in JOB_CHILD_TABLES]
+
+        for timing in job.timings:
+            self._add_record("timing", TIMING_FIELDS, timing)
+        for op in job.oplist:
+            self._add_record("op", OP_FIELDS, op)
+        for dep in job.deplist:
+            self._add_record("dep", DEP_FIELDS, dep)
+        if job.conflict:
+            self._add_record("conflict", CONFLICT_FIELDS, job.conflict)
+        if job.commit_times:
+            self._add_record("commit_times", COMMIT_TIMES_FIELDS,
+                    job.commit_times)
+        for command in job.commands:
+            self._add_row("command", COMMAND_FIELDS,
+                    [command.line, command.argv], COMMAND_INT_FIELDS,
+                    [self.table_sizes.get("command_output", 0)])
+            for output in command.outputs:
+                self._add_record("command_output", OUTPUT_FIELDS, output)
+        for output in job.outputs:
+            self._add_record("output", OUTPUT_FIELDS, output)
+        for job_id in job.waiting_jobs:
+            self._add_row("waiting", WAITING_FIELDS, [job_id])
+        for item in job.vars.items():
+            self._add_row("var", VAR_FIELDS, item)
+
+        if job.make:
+            make_num = int(job.make.getID()[1:], 16)
+        else:
+            make_num = -1
+
+        self._add_row("job", JOB_FIELDS,
+                [getattr(job, field) for field in JOB_FIELDS],
+                JOB_INT_FIELDS, [make_num, job.retval] + firsts)
+        self.num_jobs += 1
+
+    def addMessage(self, msg):
+        """Add a Message that came after the jobs added so far."""
+        self._add_row("message", MESSAGE_FIELDS,
+                [getattr(msg, field) for field in MESSAGE_FIELDS],
+                MESSAGE_INT_FIELDS, [self.num_jobs])
+
+    def addMakeProcesses(self, make_procs):
+        """Add the MakeProcesses, from a dictionary keyed by ID."""
+        for make_id in sorted(make_procs.keys()):
+            self._add_record("make", MAKE_FIELDS, make_procs[make_id])
+
+    def _iter_strings(self, table, field, start=0, end=None):
+        column = self.columns.get(table + "." + field, ())
+        if start or end is not None:
+            column = column[start:end]
+        return imap(self.strings.__getitem__, column)
+
+    def _iter_rows(self, table, fields, cls, start=0, end=None):
+        """Yield the records in a table, from row start up to row end,
+        as new objects of class cls, with the values set as the
+        attributes named in fields. The objects' __init__() is not
+        called. If cls is tuple, the rows are yielded as tuples."""
+        if end is None:
+            end = self.table_sizes.get(table, 0)
+
+        if cls is tuple:
+            return izip(*[self._iter_strings(table, field, start, end)
+                for field in fields])
+
+        return chain.from_iterable(self._new_records(table, fields, cls,
+            batch_start, min(end, batch_start + RECORD_BATCH_SIZE))
+            for batch_start in xrange(start, end, RECORD_BATCH_SIZE))
+
+    def _new_records(self, table, fields, cls, start, end):
+        """Returns the list of records for rows start up to end of a
+        table; see _iter_rows(). The records are created, and each
+        attribute is set on all of them, by map(), so no Python code
+        runs per record."""
+        num_records = end - start
+        records = map(cls.__new__, repeat(cls, num_records))
+        for field in fields:
+            values = self._iter_strings(table, field, start, end)
+            if field == "file" and table in PATH_TABLES:
+                map(setattr, records, repeat("file_id", num_records),
+                        imap(self.path_table.ids.__getitem__, values))
+                map(setattr, records, repeat("path_table", num_records),
+                        repeat(self.path_table, num_records))
+            else:
+                map(setattr, records, repeat(field, num_records), values)
+        return records
+
+    def _iter_ints(self, table, fields):
+        return izip(*[self.columns.get(table + "." + field, ())
+            for field in fields])
+
+    def _child_rows(self, table, row_num, first_field):
+        """Returns (start, end), the range of the rows in a child table
+        that belong to row number row_num of the parent table, whose
+        first_field column holds the first child row of each parent
+        row."""
+        column = self.columns[first_field]
+        start = column[row_num]
+        if row_num + 1 < len(column):
+            end = column[row_num + 1]
+        else:
+            end = self.table_sizes.get(table, 0)
+        return (start, end)
+
+    def _get_rows(self, table, fields, cls, row_num, first_field):
+        """Returns the list of the records in a child table that belong
+        to row number row_num of the parent table; see _child_rows()."""
+        (start, end) = self._child_rows(table, row_num, first_field)
+
+        if start == end:
+            return []
+        elif cls is tuple:
+            return list(self._iter_rows(table, fields, cls, start, end))
+        else:
+            return self._new_records(table, fields, cls, start, end)
+
+    def loadJobChildren(self, job, job_num):
+        """Fill in the child records (JOB_CHILD_ATTRS) of a Job that
+        was created by iterJobs()."""
+        from pyannolib import annolib
+
+        def get_rows(table, fields, cls):
+            return self._get_rows(table, fields, cls, job_num,
+                    "job.first_" + table)
+
+        job.timings = get_rows("timing", TIMING_FIELDS, annolib.Timing)
+        job.oplist = annolib.OpList(self.path_table)
+        (start, end) = self._child_rows("op", job_num, "job.first_op")
+        if start != end:
+            job.oplist.addColumns(*[self._iter_strings("op", field,
+                start, end) for field in OP_FIELDS])
+        job.deplist = get_rows("dep", DEP_FIELDS, annolib.Dependency)
+        job.conflict = (get_rows("conflict", CONFLICT_FIELDS,
+            annolib.Conflict) or [None])[0]
+        job.commit_times = (get_rows("commit_times", COMMIT_TIMES_FIELDS,
+            annolib.CommitTimes) or [None])[0]
+        job.outputs = get_rows("output", OUTPUT_FIELDS, annolib.Output)
+        job.waiting_jobs = [job_id for (job_id,) in get_rows("waiting",
+            WAITING_FIELDS, tuple)]
+        job.vars = dict(get_rows("var", VAR_FIELDS, tuple))
+
+        job.commands = get_rows("command", COMMAND_FIELDS, annolib.Command)
+        if job.commands:
+            command_num = self.columns["job.first_command"][job_num]
+            for command in job.commands:
+                command.outputs = self._get_rows("command_output",
+                        OUTPUT_FIELDS, annolib.Output, command_num,
+                        "command.first_output")
+                command_num += 1
+
+    def iterJobs(self, build):
+        """Re-create the Jobs and yield them, in file order. Like
+        AnnoXMLBodyParser, this adds the MakeProcesses, the jobs that
+        started them, and the Messages to the AnnotatedBuild."""
+        from pyannolib import annolib
+
+        self.makes = []
+        self.path_table = build.path_table
+        for make_proc in self._iter_rows("make", MAKE_FIELDS,
+                annolib.MakeProcess):
+            existing = build.getMakeProcess(make_proc.make_proc_id)
+            if existing:
+                make_proc = existing
+            else:
+                build.addMakeProcess(make_proc)
+            self.makes.append(make_proc)
+
+        parent_job_ids = set([make_proc.getParentJobID()
+            for make_proc in self.makes])
+
+        messages = izip(self._iter_rows("message", MESSAGE_FIELDS,
+            annolib.Message), self._iter_ints("message", MESSAGE_INT_FIELDS))
+        next_message = next(messages, None)
+
+        jobs = izip(self._iter_rows("job", JOB_FIELDS, annolib.Job),
+                self.columns.get("job.make_num", ()),
+                self.columns.get("job.retval", ()))
+
+        for job_num, (job, make_num, retval) in enumerate(jobs):
+            job.retval = retval
+            if make_num >= 0:
+                job.make = self.makes[make_num]
+            else:
+                job.make = None
+
+            # Job.__getattr__() calls loadJobChildren() when needed
+            job.cache_row = (self, job_num)
+
+            while next_message and next_message[1][0] <= job_num:
+                build.addMessage(next_message[0])
+                next_message = next(messages, None)
+
+            if job.job_id in parent_job_ids:
+                build.addMakeJob(job)
+
+            yield job
+
+        while next_message:
+            build.addMessage(next_message[0])
+            next_message = next(messages, None)
+
+        if not build.metrics:
+            build.metrics.update(self.metrics)
+
+    def save(self, filename):
+        """Write the cache to a file. The file is written under a
+        temporary name and renamed, so a reader never sees a partial
+        cache. Can raise IOError or OSError."""
+        sidecar.save(filename, self._write)
+
+    def _write(self, fh):
+        sidecar.write_header(fh, CACHE_MAGIC, CACHE_VERSION, self.key)
+        sidecar.write_array(fh, array.array("l", [self.num_jobs]))
+
+        metric_names = sorted(self.metrics.keys())
+        sidecar.write_strings(fh, metric_names)
+        sidecar.write_strings(fh, [self.metrics[name]
+            for name in metric_names])
+
+        sidecar.write_strings(fh, self.strings)
+
+        table_names = sorted(self.table_sizes.keys())
+        sidecar.write_strings(fh, table_names)
+        sidecar.write_array(fh, array.array("l", [self.table_sizes[name]
+            for name in table_names]))
+
+        column_names = sorted(self.columns.keys())
+        sidecar.write_strings(fh, column_names)
+        for name in column_names:
+            sidecar.write_array(fh, self.columns[name])
+
+    def load(self, filename):
+        """Read the cache from a file. Returns True if the cache was
+        loaded and its key matched our key, or False if not."""
+        return sidecar.load(filename, CACHE_MAGIC, CACHE_VERSION, self.key,
+                self._read)
+
+    def _read(self, fh):
+        # Nothing is changed until all of it has been read
+        num_jobs = sidecar.read_array(fh, "l")
+        metric_names = sidecar.read_strings(fh)
+        metric_values = sidecar.read_strings(fh)
+        strings = sidecar.read_strings(fh)
+        table_names = sidecar.read_strings(fh)
+        table_sizes = sidecar.read_array(fh, "l")
+        column_names = sidecar.read_strings(fh)
+        columns = [sidecar.read_array(fh, COLUMN_TYPE)
+                for name in column_names]
+
+        if len(num_jobs) != 1 or \
+                len(metric_names) != len(metric_values) or \
+                not strings or strings[0] is not None or \
+                len(table_names) != len(table_sizes):
+            raise sidecar.SidecarError("The cache is damaged")
+
+        self.num_jobs = num_jobs[0]
+        self.metrics = dict(izip(metric_names, metric_values))
+        self.strings = strings
+        self.string_nums = {}
+        self.table_sizes = dict(izip(table_names, table_sizes))
+        self.columns = dict(izip(column_names, columns))
+
+
+def cache_filename(filename):
+    """Return the name of the cache sidecar file for an
+    annotation file."""
+    return filename + CACHE_SUFFIX
@@ -0,0 +1,467 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+Reading compressed annotation files.
+
+Two kinds of compressed files are handled:
+
+gzip and xz files
+    These are ordinary compressed streams. They can only be read from
+    start to end, so seeking backwards means starting over, and seeking
+    to the end means decompressing the whole file. ReadAheadFile
+    decompresses them on a background thread so the parser is not
+    kept waiting. xz needs the lzma module (Python 3, or the
+    backports.lzma package on Python 2).
+
+Block-compressed files
+    Our own format: the annotation file is cut into blocks of a fixed
+    (uncompressed) size, each block is zlib-compressed on its own, and
+    a table of the block offsets is written at the end. Any byte can be
+    reached by decompressing one block, so the metrics footer, the
+    header and indexed job lookups stay cheap. Use write_block_file()
+    (or "tyranno archive") to create one.
+
+    The layout is:
+
+        header:  BLOCK_MAGIC, block size (uint32)
+        blocks:  zlib data, one after another
+        table:   for each block, its uncompressed offset (uint64),
+                 compressed offset (uint64), compressed length (uint32)
+        footer:  table offset (uint64), number of blocks (uint64),
+                 uncompressed size (uint64), BLOCK_END_MAGIC
+
+    All integers are big-endian.
+"""
+
+import io
+import os
+import bisect
+import gzip
+import struct
+import threading
+import zlib
+import Queue
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+GZIP_MAGIC = "\x1f\x8b"
+XZ_MAGIC = "\xfd7zXZ\x00"
+BLOCK_MAGIC = "PYANNOZ1"
+BLOCK_END_MAGIC = "PYANNOZE"
+
+# The kinds of files that file_type() can report
+TYPE_PLAIN = "plain"
+TYPE_GZIP = "gzip"
+TYPE_XZ = "xz"
+TYPE_BLOCK = "block"
+
+BLOCK_HEADER = struct.Struct(">8sI")
+BLOCK_TABLE_ENTRY = struct.Struct(">QQI")
+BLOCK_FOOTER = struct.Struct(">QQQ8s")
+
+# The default uncompressed size of each block
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+# How much ReadAheadFile decompresses at a time, and how many
+# of those chunks it can get ahead of the reader.
+READ_AHEAD_CHUNK_SIZE = 1024 * 1024
+READ_AHEAD_DEPTH = 4
+
+
+class CompressedFileError(Exception):
+    pass
+
+
+def file_type(filename):
+    """Returns TYPE_PLAIN, TYPE_GZIP, TYPE_XZ or TYPE_BLOCK, by looking
+    at the first bytes of the file."""
+    with open(filename, "rb") as fh:
+        magic = fh.read(len(BLOCK_MAGIC))
+
+    if magic.startswith(GZIP_MAGIC):
+        return TYPE_GZIP
+    elif magic.startswith(XZ_MAGIC):
+        return TYPE_XZ
+    elif magic == BLOCK_MAGIC:
+        return TYPE_BLOCK
+    else:
+        return TYPE_PLAIN
+
+
+def open_compressed(filename, read_ahead=True):
+    """If the file is compressed, returns a raw (unbuffered) file
+    object that reads the uncompressed data; otherwise returns None.
+    If read_ahead is True, decompression runs on a background thread.
+    Can raise IOError or CompressedFileError."""
+    ftype = file_type(filename)
+
+    if ftype == TYPE_GZIP:
+        return ReadAheadFile(lambda: gzip.open(filename, "rb"),
+                read_ahead)
+
+    elif ftype == TYPE_XZ:
+        if lzma is None:
+            msg = "%s is xz-compressed, but the lzma module is not " \
+                    "available" % (filename,)
+            raise CompressedFileError(msg)
+        return ReadAheadFile(lambda: lzma.LZMAFile(filename, "rb"),
+                read_ahead)
+
+    elif ftype == TYPE_BLOCK:
+        return BlockCompressedFile(filename, read_ahead)
+
+    else:
+        return None
+
+
+class ReadAheadFile(io.RawIOBase):
+    """Reads a compressed stream, which can only be read from start
+    to end. If read_ahead is True, a background thread decompresses
+    the stream into a queue of chunks, so decompression overlaps with
+    whatever the reader is doing.
+
+    Seeking forward skips data; seeking backward starts over from the
+    beginning; seeking relative to the end is not supported."""
+
+    # This class cannot seek to any byte cheaply
+    random_access = False
+
+    def __init__(self, opener, read_ahead=True):
+        io.RawIOBase.__init__(self)
+
+        # A function that opens the stream
+        self.opener = opener
+        self.read_ahead = read_ahead
+
+        # Our position in the uncompressed data
+        self.pos = 0
+
+        # Data that was decompressed but not yet returned
+        self.pending = ""
+
+        # For read_ahead=False, the stream; for read_ahead=True,
+        # the thread that reads it, the queue it fills, and the
+        # flag that tells it to stop.
+        self.stream = None
+        self.thread = None
+        self.queue = None
+        self.stop_event = None
+        self.at_eof = False
+
+        self._start()
+
+    def _start(self):
+        self.pos = 0
+        self.pending = ""
+        self.at_eof = False
+
+        stream = self.opener()
+        if not self.read_ahead:
+            self.stream = stream
+            return
+
+        self.queue = Queue.Queue(READ_AHEAD_DEPTH)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=_read_ahead,
+                args=(stream, self.queue, self.stop_event))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _stop(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+        if self.thread is not None:
+            self.stop_event.set()
+            # Let the thread finish any put() it is blocked in
+            while self.thread.is_alive():
+                try:
+                    self.queue.get(timeout=0.1)
+                except Queue.Empty:
+                    pass
+            self.thread = None
+
+    def _next_chunk(self):
+        """Returns the next chunk of decompressed data, or "" at EOF."""
+        if self.at_eof:
+            return ""
+
+        if self.stream is not None:
+            data = self.stream.read(READ_AHEAD_CHUNK_SIZE)
+        else:
+            data = self.queue.get()
+            if isinstance(data, Exception):
+                self.at_eof = True
+                raise IOError("Error decompressing: %s" % (data,))
+
+        if not data:
+            self.at_eof = True
+        return data
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            pos = self.pos + pos
+        elif whence == os.SEEK_END:
+            raise io.UnsupportedOperation(
+                    "Can't seek from the end of a compressed stream")
+
+        if pos < self.pos:
+            self._stop()
+            self._start()
+
+        # Skip forward
+        while self.pos < pos:
+            if not self.pending:
+                self.pending = self._next_chunk()
+                if not self.pending:
+                    break
+            skip = min(len(self.pending), pos - self.pos)
+            self.pending = self.pending[skip:]
+            self.pos += skip
+
+        return self.pos
+
+    def readinto(self, b):
+        if not self.pending:
+            self.pending = self._next_chunk()
+
+        count = min(len(b), len(self.pending))
+        memoryview(b)[:count] = self.pending[:count]
+        self.pending = self.pending[count:]
+        self.pos += count
+        return count
+
+    def close(self):
+        if not self.closed:
+            self._stop()
+        io.RawIOBase.close(self)
+
+
+def _read_ahead(stream, queue, stop_event):
+    """The thread for ReadAheadFile. Reads the stream into the queue,
+    finishing with "" at EOF, or the exception if there was an error."""
+    try:
+        while not stop_event.is_set():
+            try:
+                data = stream.read(READ_AHEAD_CHUNK_SIZE)
+            except Exception as e:
+                queue.put(e)
+                return
+
+            # Keep trying to put the data in the queue, unless
+            # we are told to stop.
+            while not stop_event.is_set():
+                try:
+                    queue.put(data, timeout=0.1)
+                    break
+                except Queue.Full:
+                    pass
+
+            if not data:
+                return
+    finally:
+        stream.close()
+
+
+class BlockCompressedFile(io.RawIOBase):
+    """Reads a block-compressed file (see the top of this file). Any
+    position can be reached by decompressing a single block. If
+    read_ahead is True, the block after the one being read is
+    decompressed on a background thread."""
+
+    # This class can seek to any byte cheaply
+    random_access = True
+
+    def __init__(self, filename, read_ahead=True):
+        io.RawIOBase.__init__(self)
+
+        self.filename = filename
+        self.read_ahead = read_ahead
+        self.fh = io.open(filename, "rb")
+
+        try:
+            self._read_table()
+        except:
+            self.fh.close()
+            raise
+
+        # Our position in the uncompressed data
+        self.pos = 0
+
+        # The block that was decompressed last
+        self.block_num = None
+        self.block_data = ""
+
+        # The block being decompressed in the background:
+        # (block_num, thread, result_list)
+        self.prefetch = None
+
+    def _read_table(self):
+        header = self.fh.read(BLOCK_HEADER.size)
+        if len(header) != BLOCK_HEADER.size:
+            raise CompressedFileError("%s: file is too short" %
+                    (self.filename,))
+        (magic, self.block_size) = BLOCK_HEADER.unpack(header)
+        if magic != BLOCK_MAGIC:
+            raise CompressedFileError("%s: not a block-compressed file" %
+                    (self.filename,))
+
+        self.fh.seek(-BLOCK_FOOTER.size, os.SEEK_END)
+        footer = self.fh.read(BLOCK_FOOTER.size)
+        (table_offset, num_blocks, self.size, magic) = \
+                BLOCK_FOOTER.unpack(footer)
+        if magic != BLOCK_END_MAGIC:
+            raise CompressedFileError("%s: block table is missing; "
+                    "the file may be truncated" % (self.filename,))
+
+        self.fh.seek(table_offset, os.SEEK_SET)
+        table = self.fh.read(num_blocks * BLOCK_TABLE_ENTRY.size)
+
+        # The uncompressed offset, compressed offset, and compressed
+        # length of each block
+        self.block_starts = []
+        self.block_offsets = []
+        self.block_lengths = []
+        for i in range(num_blocks):
+            (start, offset, length) = BLOCK_TABLE_ENTRY.unpack_from(table,
+                    i * BLOCK_TABLE_ENTRY.size)
+            self.block_starts.append(start)
+            self.block_offsets.append(offset)
+            self.block_lengths.append(length)
+
+    def _read_compressed(self, block_num):
+        self.fh.seek(self.block_offsets[block_num], os.SEEK_SET)
+        return self.fh.read(self.block_lengths[block_num])
+
+    def _start_prefetch(self, block_num):
+        """Start decompressing a block on a background thread. The
+        compressed data is read here, so only this thread uses fh."""
+        data = self._read_compressed(block_num)
+        result = []
+        thread = threading.Thread(target=lambda:
+                result.append(zlib.decompress(data)))
+        thread.daemon = True
+        thread.start()
+        self.prefetch = (block_num, thread, result)
+
+    def _load_block(self, block_num):
+        if block_num == self.block_num:
+            return
+
+        data = None
+        if self.prefetch:
+            (prefetch_num, thread, result) = self.prefetch
+            thread.join()
+            self.prefetch = None
+            if prefetch_num == block_num and result:
+                data = result[0]
+
+        if data is None:
+            try:
+                data = zlib.decompress(self._read_compressed(block_num))
+            except zlib.error as e:
+                raise IOError("%s: bad block %d: %s" % (self.filename,
+                    block_num, e))
+
+        self.block_num = block_num
+        self.block_data = data
+
+        # Reading is usually sequential, so get the next block ready
+        if self.read_ahead and block_num + 1 < len(self.block_starts):
+            self._start_prefetch(block_num + 1)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, pos, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            pos = self.pos + pos
+        elif whence == os.SEEK_END:
+            pos = self.size + pos
+
+        if pos < 0:
+            raise ValueError("Negative seek position %d" % (pos,))
+
+        self.pos = pos
+        return self.pos
+
+    def readinto(self, b):
+        view = memoryview(b)
+        num_bytes = len(view)
+        total = 0
+
+        while total < num_bytes and self.pos < self.size:
+            block_num = bisect.bisect_right(self.block_starts, self.pos) - 1
+            self._load_block(block_num)
+
+            offset = self.pos - self.block_starts[block_num]
+            count = min(num_bytes - total, len(self.block_data) - offset)
+            if count <= 0:
+                break
+
+            view[total:total + count] = \
+                    self.block_data[offset:offset + count]
+            total += count
+            self.pos += count
+
+        return total
+
+    def close(self):
+        if not self.closed:
+            if self.prefetch:
+                self.prefetch[1].join()
+                self.prefetch = None
+            self.fh.close()
+        io.RawIOBase.close(self)
+
+
+def write_block_file(in_fh, out_filename, block_size=DEFAULT_BLOCK_SIZE,
+        level=6):
+    """Read in_fh to the end, and write it as a block-compressed file.
+    Can raise IOError."""
+    table = []
+    uncompressed_offset = 0
+
+    with open(out_filename, "wb") as out_fh:
+        out_fh.write(BLOCK_HEADER.pack(BLOCK_MAGIC, block_size))
+        offset = BLOCK_HEADER.size
+
+        while True:
+            data = in_fh.read(block_size)
+            if not data:
+                break
+
+            compressed = zlib.compress(data, level)
+            out_fh.write(compressed)
+            table.append((uncompressed_offset, offset, len(compressed)))
+
+            uncompressed_offset += len(data)
+            offset += len(compressed)
+
+        table_offset = offset
+        for entry in table:
+            out_fh.write(BLOCK_TABLE_ENTRY.pack(*entry))
+
+        out_fh.write(BLOCK_FOOTER.pack(table_offset, len(table),
+            uncompressed_offset, BLOCK_END_MAGIC))
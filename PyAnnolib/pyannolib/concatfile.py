@@ -1,76 +1,122 @@
 """
 A file-like object that concatentes multiple files together
 in sequence, making them look like a single file.
+
+ConcatenatedFile is an io.RawIOBase; reads go straight into the
+caller's buffer with readinto(), so wrap it in an io.BufferedReader
+(as anno_open() does) to get large, efficient reads.
 """
 
 import os
-import stat
+import io
+import bisect
+import mmap
 
 READ = "r"
 READ_BINARY = "rb"
 
 ABSOLUTE = 0
 
-class ConcatenatedFile:
-    UNKNOWN = -1
-    IMPOSSIBLE = -1
+class ConcatenatedFile(io.RawIOBase):
+
+    def __init__(self, filenames, mode=READ_BINARY, use_mmap=False):
+        io.RawIOBase.__init__(self)
 
-    def __init__(self, filenames, mode):
         if len(filenames) == 0:
             raise ValueError("Need at least one file name.")
 
+        if mode not in [READ, READ_BINARY]:
+            raise ValueError("Only read-only mode is supported.")
+
         # Save the initiliaztion data for ourselves.
-        self.filenames = filenames
+        self.filenames = list(filenames)
         self.mode = mode
+        self.use_mmap = use_mmap
         self.num_files = len(self.filenames)
 
-        # Open the first file, so we can throw an exception
-        # _now_ if the file doesn't exist or there are permission problems
-        self.fh = open(self.filenames[0], mode)
-
-        # True if we are open, False if closed.
-        self.currently_open = True
-
-        # 'fh' is currently for the 0th file
-        self.fh_index = 0
-
         # We call our "position" the "super-position", which
         # has a maximum of the sum of the sizes of all the files.
         # It starts at 0, because start at the beginning of the 0th
         # file.
         self.super_pos = 0
 
-        # Analyze the file sizes
-        self.superpos_start = [self.UNKNOWN for f in self.filenames]
-        self.superpos_end = [self.UNKNOWN for f in self.filenames]
+        # Analyze the file sizes. superpos_start is sorted, so we
+        # can bisect it to find the file for a super-position.
+        self.superpos_start = []
+        self.sizes = []
+        start = 0
+        for filename in self.filenames:
+            size = os.stat(filename).st_size
+            self.superpos_start.append(start)
+            self.sizes.append(size)
+            start += size
 
-        # Start at 0.
-        self.superpos_start[0] = 0
+        # Our super-size
+        self.super_size = start
 
-        for i, filename in enumerate(self.filenames):
-            if i > 0:
-                self.superpos_start[i] = self.superpos_end[i-1] + 1
-            size = os.stat(filename)[stat.ST_SIZE]
-            self.superpos_end[i] = self.superpos_start[i] + size - 1
+        # Only one file is open at a time. 'fh' is the raw (unbuffered)
+        # file object for file number 'fh_index', and 'mm' is its
+        # mmap, if we are using mmap. 'fh_pos' is the position of 'fh',
+        # so we know when we need to seek it.
+        self.fh = None
+        self.mm = None
+        self.fh_index = None
+        self.fh_pos = 0
 
-        # Our super-size
-        self.super_size = self.superpos_end[self.num_files-1] + 1
+        # Open the first file, so we can throw an exception
+        # _now_ if the file doesn't exist or there are permission problems
+        self._open_file(0)
+
+    def _open_file(self, index):
+        """Make file number 'index' the open file."""
+        if index == self.fh_index:
+            return
+
+        self._close_file()
+
+        # Always open in binary mode; the text and binary modes
+        # are the same on the platforms we care about, and the
+        # offsets must be byte offsets.
+        self.fh = io.open(self.filenames[index], READ_BINARY, buffering=0)
+        self.fh_index = index
+        self.fh_pos = 0
+
+        if self.use_mmap and self.sizes[index] > 0:
+            self.mm = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _close_file(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.fh is not None:
+            self.fh.close()
+            self.fh = None
+        self.fh_index = None
 
     def _find_index_from_super_pos(self, super_pos):
-        for i in range(self.num_files):
-            if super_pos >= self.superpos_start[i] and \
-                    super_pos <= self.superpos_end[i]:
-                return i
-        # Beyond the end?
-        return self.IMPOSSIBLE
+        """Returns the index of the file that holds super_pos, skipping
+        over any empty files. Returns None if super_pos is at or
+        beyond the end."""
+        if super_pos >= self.super_size:
+            return None
+        index = bisect.bisect_right(self.superpos_start, super_pos) - 1
+        while self.sizes[index] == 0:
+            index += 1
+        return index
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
 
     def tell(self):
         return self.super_pos
 
     def close(self):
-        if self.currently_open:
-            self.fh.close()
-            self.currently_open = False
+        if not self.closed:
+            self._close_file()
+        io.RawIOBase.close(self)
 
     def seek(self, seek_super_pos, whence=os.SEEK_SET):
         if whence == os.SEEK_SET:
@@ -82,66 +128,53 @@ class ConcatenatedFile:
             if seek_super_pos > 0:
                 raise ValueError("Seek argument must be 0 or negative with SEEK_END")
             new_abs_super_pos = self.super_size + seek_super_pos
+        else:
+            raise ValueError("Invalid whence: %s" % (whence,))
 
-        # Which file?
-        seek_index = self._find_index_from_super_pos(new_abs_super_pos)
-        if seek_index == self.IMPOSSIBLE:
-            # If it's beyond our max length, we go to the last file
-            seek_index = self.num_files - 1
-
-        # Do we need to change files?
-        if seek_index != self.fh_index:
-            self.fh.close()
-            self.fh_index = seek_index
-            self.fh = open(self.filenames[self.fh_index])
+        if new_abs_super_pos < 0:
+            raise ValueError("Negative seek position %d" % (new_abs_super_pos,))
 
-        # seek to the absolute position in that file
-        offset = new_abs_super_pos - self.superpos_start[self.fh_index]
-        self.fh.seek(offset)
+        # The files are opened and positioned when we read
         self.super_pos = new_abs_super_pos
+        return self.super_pos
 
-
-    def read(self, num_bytes=UNKNOWN):
-        if num_bytes == self.UNKNOWN:
-            return self._read_everything()
-        else:
-            data = self.fh.read(num_bytes)
-            if len(data) < num_bytes:
-                while True:
-                    num_bytes -= len(data)
-                    if num_bytes == 0:
-                       break
-
-                    result = self._go_to_next_file()
-                    if result == False:
-                        break
-
-                    new_data = self.fh.read(num_bytes)
-                    data += new_data
-                    if len(new_data) == num_bytes:
-                        break
-            return data
-
-    def _read_everything(self):
-        # Read the rest of this filehandle
-        data = self.fh.read()
-
-        # Any more file handles?
-        while self.fh_index < self.num_files - 1:
-            self.fh.close()
-            self.fh_index += 1
-            self.fh = open(self.filenames[self.fh_index])
-            data += self.fh.read()
-
-        # Return the result
-        return data
-
-    def _go_to_next_file(self):
-        """Change fh to the next file. Returns True if successful,
-        or False if impossible."""
-        if self.fh_index + 1 >= self.num_files:
-            return False
-        self.fh.close()
-        self.fh_index += 1
-        self.fh = open(self.filenames[self.fh_index])
-        return True
+    def readinto(self, b):
+        """Read up to len(b) bytes into b, crossing from one file
+        into the next as needed. Returns the number of bytes read;
+        0 at EOF."""
+        view = memoryview(b)
+        num_bytes = len(view)
+        total = 0
+
+        while total < num_bytes:
+            index = self._find_index_from_super_pos(self.super_pos)
+            if index is None:
+                break
+
+            self._open_file(index)
+            offset = self.super_pos - self.superpos_start[index]
+            count = min(num_bytes - total, self.sizes[index] - offset)
+
+            if self.mm is not None:
+                view[total:total + count] = self.mm[offset:offset + count]
+            else:
+                if offset != self.fh_pos:
+                    self.fh.seek(offset)
+                count = self.fh.readinto(view[total:total + count])
+                if not count:
+                    # The file is shorter than it was when we stat'ed it.
+                    break
+                self.fh_pos = offset + count
+
+            total += count
+            self.super_pos += count
+
+        return total
+
+    def readall(self):
+        """Read from the current position to the end, with one
+        buffer allocation."""
+        buf = bytearray(max(0, self.super_size - self.super_pos))
+        num_bytes = self.readinto(buf)
+        del buf[num_bytes:]
+        return bytes(buf)
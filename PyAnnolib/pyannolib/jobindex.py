@@ -0,0 +1,416 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+A byte-offset index of the records in the body of an annotation file.
+
+The index is built with one pass over the raw bytes of the file; no
+XML parsing is done. For every <job> it records the byte offset and
+length of the element and the number of the <make> that owns it. For
+every <make> it records the offset and length of its start tag and the
+ID of its parent job. With that, a single job can be read by seeking
+straight to its span and parsing only that element.
+
+The index can be stored in a "sidecar" file next to the annotation
+file, so that it only has to be built once (see sidecar.py for the
+format). The sidecar is keyed by the size and modification time of
+each annotation file part; if they change, the sidecar is ignored and
+the index is rebuilt.
+"""
+
+import os
+import re
+import array
+
+from pyannolib import sidecar
+
+# The suffix added to the annotation file name to make the sidecar name
+SIDECAR_SUFFIX = ".jobidx"
+
+# The start of the sidecar file
+INDEX_MAGIC = "PYANNOJI"
+
+# Bump this if the contents of the sidecar change
+INDEX_VERSION = 2
+
+# The JobIndex arrays that are saved in the sidecar, in order
+SAVED_ARRAYS = ["rec_kinds", "rec_offsets", "rec_lengths", "rec_make_nums",
+        "make_offsets", "make_lengths"]
+
+# How much of the file to scan at a time
+SCAN_CHUNK_SIZE = 1024 * 1024
+
+# Record kinds, as stored in the index
+REC_JOB = 0
+REC_MESSAGE = 1
+
+# Event kinds produced by scan_body()
+EVENT_MAKE = "make"
+EVENT_END_MAKE = "/make"
+EVENT_JOB = "job"
+EVENT_MESSAGE = "message"
+EVENT_METRICS = "metrics"
+
+# The body element names we care about
+ELEMENT_JOB = "job"
+ELEMENT_MAKE = "make"
+ELEMENT_MESSAGE = "message"
+ELEMENT_METRICS = "metrics"
+
+# The event for each complete element that scan_body() reports
+ELEMENT_EVENTS = {
+    ELEMENT_JOB : EVENT_JOB,
+    ELEMENT_MESSAGE : EVENT_MESSAGE,
+    ELEMENT_METRICS : EVENT_METRICS,
+}
+
+# The job attributes needed to work out the parent job of a <make>
+ATTR_JOB_ID = "id"
+ATTR_JOB_TYPE = "type"
+ATTR_JOB_PARTOF = "partof"
+JOB_TYPE_FOLLOW = "follow"
+
+# Because XML escapes "<" in both text and attribute values, every "<"
+# in the file starts a piece of markup. That lets us find the elements
+# we want with a regex over the raw bytes.
+RE_MARKUP = re.compile(
+        r"<(?P<name>job|make|message|metrics)"
+        r"(?P<attrs>(?:\s+[^\s=/>]+\s*=\s*(?:\"[^\"]*\"|'[^']*'))*)"
+        r"\s*(?P<empty>/?)>"
+        r"|</(?P<end_name>job|make|message|metrics)\s*>")
+
+RE_ATTR = re.compile(r"([^\s=]+)\s*=\s*(?:\"([^\"]*)\"|'([^']*)')")
+
+XML_ENTITIES = [
+        ("&lt;", "<"),
+        ("&gt;", ">"),
+        ("&quot;", '"'),
+        ("&apos;", "'"),
+        ("&amp;", "&"),
+]
+
+
+def parse_attrs(attrs_text):
+    """Given the raw attribute text of a start tag, return a dictionary
+    of the attribute names and (unescaped) values."""
+    attrs = {}
+    for m in RE_ATTR.finditer(attrs_text):
+        value = m.group(2)
+        if value is None:
+            value = m.group(3)
+        if "&" in value:
+            for entity, char in XML_ENTITIES:
+                value = value.replace(entity, char)
+        attrs[m.group(1)] = value
+    return attrs
+
+
+def scan_body(fh, start=0, chunk_size=SCAN_CHUNK_SIZE, with_text=False):
+    """Scan the raw bytes of an annotation file, starting at 'start',
+    and yield one tuple per interesting piece of markup:
+
+        (EVENT_MAKE, offset, length, attrs_text)
+            The start tag of a <make>; length covers only the start tag.
+        (EVENT_END_MAKE, offset, length, None)
+            A </make>.
+        (EVENT_JOB, offset, length, attrs_text)
+            A complete <job> element, from "<job" to "</job>".
+        (EVENT_MESSAGE, offset, length, attrs_text)
+            A complete <message> element.
+        (EVENT_METRICS, offset, length, attrs_text)
+            The complete <metrics> footer.
+
+    attrs_text is the raw attribute text of the start tag; use
+    parse_attrs() to decode it.
+
+    If with_text is True, each tuple has a fifth item: the raw text
+    that offset and length cover."""
+
+    fh.seek(start, os.SEEK_SET)
+
+    # The file offset of buf[0]
+    buf_offset = start
+    buf = ""
+
+    # Where to start looking for markup in buf
+    scan_pos = 0
+
+    # The start of the <job> or <message> we are inside of, if any:
+    # (offset, attrs_text)
+    open_elem = None
+
+    while True:
+        data = fh.read(chunk_size)
+        if not data:
+            break
+
+        buf += data
+        last_end = scan_pos
+
+        for m in RE_MARKUP.finditer(buf, scan_pos):
+            name = m.group("name")
+            offset = buf_offset + m.start()
+            last_end = m.end()
+
+            if name == ELEMENT_MAKE:
+                event = (EVENT_MAKE, offset, m.end() - m.start(),
+                        m.group("attrs"))
+                if with_text:
+                    event += (m.group(),)
+                yield event
+
+                if m.group("empty"):
+                    event = (EVENT_END_MAKE, buf_offset + m.end(), 0, None)
+                    if with_text:
+                        event += ("",)
+                    yield event
+
+            elif name:
+                # <job>, <message> or <metrics>
+                if m.group("empty"):
+                    event = (ELEMENT_EVENTS[name], offset,
+                            m.end() - m.start(), m.group("attrs"))
+                    if with_text:
+                        event += (m.group(),)
+                    yield event
+                else:
+                    open_elem = (offset, m.group("attrs"))
+
+            else:
+                end_name = m.group("end_name")
+                if end_name == ELEMENT_MAKE:
+                    event = (EVENT_END_MAKE, offset, m.end() - m.start(),
+                            None)
+                    if with_text:
+                        event += (m.group(),)
+                    yield event
+
+                elif open_elem:
+                    elem_offset, attrs_text = open_elem
+                    event = (ELEMENT_EVENTS[end_name], elem_offset,
+                            buf_offset + m.end() - elem_offset, attrs_text)
+                    if with_text:
+                        event += (buf[elem_offset - buf_offset:m.end()],)
+                    yield event
+                    open_elem = None
+
+        # Keep any partial markup at the end of the buffer so that
+        # it can be completed by the next read. If the text of the
+        # element we are in is wanted, keep all of it.
+        i = buf.rfind("<", last_end)
+        if i == -1:
+            i = len(buf)
+
+        keep = i
+        if with_text and open_elem:
+            keep = min(i, open_elem[0] - buf_offset)
+
+        buf_offset += keep
+        buf = buf[keep:]
+        scan_pos = i - keep
+
+
+class JobIndex:
+    """The byte offsets of all the jobs, messages and make processes
+    in an annotation file."""
+
+    def __init__(self, key=None):
+        # Identifies the annotation file(s) this index was built from
+        self.key = key
+
+        # The records (jobs and messages), in file order.
+        self.rec_kinds = array.array("b")
+        self.rec_offsets = array.array("l")
+        self.rec_lengths = array.array("l")
+        self.rec_make_nums = array.array("l")
+
+        # The job ID for each record; None for messages
+        self.rec_job_ids = []
+
+        # The make processes, in the order of their make number
+        self.make_offsets = array.array("l")
+        self.make_lengths = array.array("l")
+        self.make_parent_job_ids = []
+
+        # Key = job ID, Value = record number
+        self.job_recs = {}
+
+    def __len__(self):
+        return len(self.job_recs)
+
+    def build(self, fh, start=0):
+        """Fill in the index by scanning fh."""
+        # The stack of open <make> numbers
+        make_stack = []
+
+        # The attributes of the previous <job>, needed to find the
+        # parent job of the next <make>
+        prev_job_attrs = None
+
+        for kind, offset, length, attrs_text in scan_body(fh, start):
+            if kind == EVENT_JOB:
+                attrs = parse_attrs(attrs_text)
+                job_id = attrs.get(ATTR_JOB_ID)
+                if make_stack:
+                    make_num = make_stack[-1]
+                else:
+                    make_num = -1
+                self._add_record(REC_JOB, offset, length, make_num, job_id)
+                prev_job_attrs = attrs
+
+            elif kind == EVENT_MESSAGE:
+                if make_stack:
+                    make_num = make_stack[-1]
+                else:
+                    make_num = -1
+                self._add_record(REC_MESSAGE, offset, length, make_num, None)
+
+            elif kind == EVENT_MAKE:
+                # The same rule that AnnoXMLBodyParser.startMake() uses:
+                # the job just before a <make> is its parent, except
+                # that a follow job points to its real parent.
+                parent_job_id = None
+                if len(self.make_offsets) > 0 and prev_job_attrs:
+                    if prev_job_attrs.get(ATTR_JOB_TYPE) == JOB_TYPE_FOLLOW:
+                        parent_job_id = prev_job_attrs.get(ATTR_JOB_PARTOF)
+                    else:
+                        parent_job_id = prev_job_attrs.get(ATTR_JOB_ID)
+
+                make_stack.append(len(self.make_offsets))
+                self.make_offsets.append(offset)
+                self.make_lengths.append(length)
+                self.make_parent_job_ids.append(parent_job_id)
+
+            elif kind == EVENT_END_MAKE:
+                if make_stack:
+                    make_stack.pop()
+
+    def _add_record(self, kind, offset, length, make_num, job_id):
+        rec_num = len(self.rec_offsets)
+        self.rec_kinds.append(kind)
+        self.rec_offsets.append(offset)
+        self.rec_lengths.append(length)
+        self.rec_make_nums.append(make_num)
+        self.rec_job_ids.append(job_id)
+        if job_id is not None and job_id not in self.job_recs:
+            self.job_recs[job_id] = rec_num
+
+    def getNumRecords(self):
+        return len(self.rec_offsets)
+
+    def getNumMakes(self):
+        return len(self.make_offsets)
+
+    def getRecord(self, rec_num):
+        """Returns (kind, offset, length, make_num, job_id)"""
+        return (self.rec_kinds[rec_num], self.rec_offsets[rec_num],
+                self.rec_lengths[rec_num], self.rec_make_nums[rec_num],
+                self.rec_job_ids[rec_num])
+
+    def getJobRecord(self, job_id):
+        """Returns the record number of the job, or None."""
+        return self.job_recs.get(job_id)
+
+    def getJobSpan(self, job_id):
+        """Returns (offset, length, make_num) for the job, or None."""
+        rec_num = self.job_recs.get(job_id)
+        if rec_num is None:
+            return None
+        return (self.rec_offsets[rec_num], self.rec_lengths[rec_num],
+                self.rec_make_nums[rec_num])
+
+    def getMakeSpan(self, make_num):
+        """Returns (offset, length, parent_job_id) for the start tag
+        of the make process."""
+        return (self.make_offsets[make_num], self.make_lengths[make_num],
+                self.make_parent_job_ids[make_num])
+
+    def save(self, filename):
+        """Write the index to a file. The file is written under a
+        temporary name and renamed, so a reader never sees a partial
+        index. Can raise IOError or OSError."""
+        sidecar.save(filename, self._write)
+
+    def _write(self, fh):
+        sidecar.write_header(fh, INDEX_MAGIC, INDEX_VERSION, self.key)
+        for name in SAVED_ARRAYS:
+            sidecar.write_array(fh, getattr(self, name))
+        sidecar.write_strings(fh, self.rec_job_ids)
+        sidecar.write_strings(fh, self.make_parent_job_ids)
+
+    def load(self, filename):
+        """Read the index from a file. Returns True if the index was
+        loaded and its key matched our key, or False if not."""
+        return sidecar.load(filename, INDEX_MAGIC, INDEX_VERSION, self.key,
+                self._read)
+
+    def _read(self, fh):
+        # Nothing is changed until all of it has been read
+        arrays = [sidecar.read_array(fh, getattr(self, name).typecode)
+                for name in SAVED_ARRAYS]
+        rec_job_ids = sidecar.read_strings(fh)
+        make_parent_job_ids = sidecar.read_strings(fh)
+
+        num_recs = len(arrays[0])
+        num_makes = len(arrays[4])
+        if [len(values) for values in arrays] != [num_recs] * 4 + \
+                [num_makes] * 2 or len(rec_job_ids) != num_recs or \
+                len(make_parent_job_ids) != num_makes:
+            raise sidecar.SidecarError("The index columns differ in length")
+
+        for (name, values) in zip(SAVED_ARRAYS, arrays):
+            setattr(self, name, values)
+        self.rec_job_ids = rec_job_ids
+        self.make_parent_job_ids = make_parent_job_ids
+
+        for rec_num, job_id in enumerate(self.rec_job_ids):
+            if job_id is not None and job_id not in self.job_recs:
+                self.job_recs[job_id] = rec_num
+
+
+def sidecar_filename(filename):
+    """Return the name of the index sidecar file for an
+    annotation file."""
+    return filename + SIDECAR_SUFFIX
+
+
+def file_key(filenames):
+    """Return the key that identifies the current contents of the
+    annotation file parts."""
+    key = []
+    for filename in filenames:
+        st = os.stat(filename)
+        key.append((st.st_size, st.st_mtime))
+    return tuple(key)
+
+
+def load_or_build(fh, filenames=None, start=0, write_sidecar=True):
+    """Return a JobIndex for the file open as fh.
+
+    If filenames (the list of annotation file parts) is given, the
+    sidecar index file is used if it is up to date. Otherwise the index
+    is built by scanning fh, and the sidecar is written for next time.
+    Failure to write the sidecar (read-only directory, etc.) is not an
+    error; the index is still returned.
+
+    The position of fh is not preserved."""
+    if not filenames:
+        index = JobIndex()
+        index.build(fh, start)
+        return index
+
+    index_filename = sidecar_filename(filenames[0])
+    key = file_key(filenames)
+
+    index = JobIndex(key)
+    if index.load(index_filename):
+        return index
+
+    index = JobIndex(key)
+    index.build(fh, start)
+
+    if write_sidecar:
+        try:
+            index.save(index_filename)
+        except (IOError, OSError):
+            pass
+
+    return index
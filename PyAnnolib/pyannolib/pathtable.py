@@ -0,0 +1,66 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+A table of the file paths in a build.
+
+The same paths appear in the <op> and <dep> records of many jobs:
+every compile reads the same headers. A PathTable gives each path an
+integer ID, and keeps one copy of its string. Operations and
+Dependencies store only the ID, so a path costs one string per build
+instead of one per record, and a report can key its dictionaries on
+the small integer IDs instead of long strings.
+
+ID 0 is always None, for records that have no file.
+"""
+
+class _PathIDs(dict):
+    """Key = path, Value = ID. A missing path is added to the table,
+    so a lookup by ids[path], or map(ids.__getitem__, paths), both
+    finds and adds paths without any Python code for the found ones."""
+
+    __slots__ = ("paths",)
+
+    def __init__(self, paths):
+        dict.__init__(self)
+        self.paths = paths
+
+    def __missing__(self, path):
+        path_id = self[path] = len(self.paths)
+        self.paths.append(path)
+        return path_id
+
+
+class PathTable(object):
+
+    __slots__ = ("paths", "ids")
+
+    def __init__(self):
+        # Index = ID, Value = path
+        self.paths = [None]
+
+        # Key = path, Value = ID
+        self.ids = _PathIDs(self.paths)
+        self.ids[None] = 0
+
+    def __len__(self):
+        """The number of paths, not counting None."""
+        return len(self.paths) - 1
+
+    def __getstate__(self):
+        return self.paths
+
+    def __setstate__(self, paths):
+        self.paths = paths
+        self.ids = _PathIDs(paths)
+        self.ids.update(zip(paths, xrange(len(paths))))
+
+    def getID(self, path):
+        """Returns the ID of a path, adding it if it is new."""
+        return self.ids[path]
+
+    def getPath(self, path_id):
+        """Returns the path with an ID."""
+        return self.paths[path_id]
+
+    def getIDs(self, paths):
+        """Returns the list of the IDs of a list of paths."""
+        return map(self.ids.__getitem__, paths)
@@ -0,0 +1,56 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+A prefilter that decides, from the raw bytes of a <job> element,
+whether the job is worth parsing.
+
+Most reports want only a few of the jobs in a build: the failed ones,
+the conflicts, the parse jobs. With a prefilter, iterJobs() finds the
+jobs by scanning the raw bytes of the file (see jobindex.scan_body()),
+which is much faster than XML parsing, and parses only the jobs that
+match. The <make> nesting is still followed, so every Job has the right
+MakeProcess, and the messages are all read.
+
+A job matches if any of the byte patterns is in its text (the whole
+element, from "<job" to "</job>"), or if the predicate, given the
+attributes of its start tag as a dictionary, returns True.
+
+A prefilter only lets iterJobs() pass over jobs; it does not promise
+that every job it returns matches. Jobs read from the cache file are
+not filtered at all, as that is faster still. So the caller must still
+check the jobs it gets.
+"""
+
+from pyannolib import jobindex
+
+class JobPrefilter:
+
+    def __init__(self, patterns=(), predicate=None):
+        """patterns is a list of strings to look for in the raw text
+        of each job. predicate is a function that is called with the
+        dictionary of the job's attributes (id, type, status, etc.),
+        and returns True if the job is wanted."""
+        self.patterns = list(patterns)
+        self.predicate = predicate
+
+    def match(self, attrs_text, text):
+        """Is the job wanted? attrs_text is the raw attribute text of
+        its start tag, and text is the raw text of the whole element."""
+        for pattern in self.patterns:
+            if pattern in text:
+                return True
+
+        if self.predicate:
+            return bool(self.predicate(jobindex.parse_attrs(attrs_text)))
+
+        return False
+
+
+def attr_equals(name, *values):
+    """Returns a predicate for JobPrefilter that is True for jobs
+    whose attribute 'name' has one of the values."""
+    values = set(values)
+
+    def predicate(attrs):
+        return attrs.get(name) in values
+
+    return predicate
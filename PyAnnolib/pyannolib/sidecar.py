@@ -0,0 +1,188 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+The file format of the "sidecar" files that are saved next to an
+annotation file: the job index (see jobindex.py) and the build cache
+(see buildcache.py).
+
+A sidecar holds only numbers and strings, in a fixed binary format;
+nothing in it is unpickled or executed, so a sidecar that someone else
+put next to an annotation file can't run code. The format is:
+
+    header:   magic (8 bytes), version (uint32), byte order ("<" or
+              ">"), number of key parts (uint32)
+    key:      per annotation file part, its size (uint64) and
+              modification time (double)
+    arrays:   type code, item size (uint8), number of items (uint64),
+              then the items, as written by array.tofile()
+    strings:  an array of the kind of each string (None, str,
+              unicode or float), an array of their lengths, then their
+              bytes; unicode strings are UTF-8, and floats are written
+              with repr().
+
+The arrays are in the byte order of the machine that wrote them, which
+is recorded in the header. read_header() checks the magic, version,
+byte order and key before anything else is read, and a sidecar that
+doesn't match is ignored.
+"""
+
+import array
+import os
+import struct
+import sys
+from itertools import izip
+
+HEADER = struct.Struct(">8sIcI")
+KEY_PART = struct.Struct(">Qd")
+ARRAY_HEADER = struct.Struct(">cBQ")
+
+if sys.byteorder == "little":
+    BYTE_ORDER = "<"
+else:
+    BYTE_ORDER = ">"
+
+# The kinds of the strings in a string list
+STRING_NONE = 0
+STRING_STR = 1
+STRING_UNICODE = 2
+STRING_FLOAT = 3
+
+class SidecarError(Exception):
+    """The sidecar file is damaged, or is not a sidecar file."""
+    pass
+
+def _read(fh, size):
+    data = fh.read(size)
+    if len(data) != size:
+        raise SidecarError("The sidecar file is truncated")
+    return data
+
+def _check_remaining(fh, size):
+    """Make sure the file has size more bytes, before allocating
+    room for them."""
+    if size > os.fstat(fh.fileno()).st_size - fh.tell():
+        raise SidecarError("The sidecar file is truncated")
+
+def write_header(fh, magic, version, key):
+    """Write the header, for an annotation file key from
+    jobindex.file_key()."""
+    key = key or ()
+    fh.write(HEADER.pack(magic, version, BYTE_ORDER, len(key)))
+    for (size, mtime) in key:
+        fh.write(KEY_PART.pack(size, mtime))
+
+def read_header(fh, magic, version, key):
+    """Read the header, and return True if it has the given magic,
+    version and key, and the arrays are in our byte order."""
+    (file_magic, file_version, byte_order, num_parts) = \
+            HEADER.unpack(_read(fh, HEADER.size))
+    if file_magic != magic or file_version != version or \
+            byte_order != BYTE_ORDER:
+        return False
+
+    key = tuple(key or ())
+    if num_parts != len(key):
+        return False
+    file_key = tuple([KEY_PART.unpack(_read(fh, KEY_PART.size))
+        for i in xrange(num_parts)])
+    return file_key == key
+
+def write_array(fh, values):
+    fh.write(ARRAY_HEADER.pack(values.typecode, values.itemsize,
+        len(values)))
+    values.tofile(fh)
+
+def read_array(fh, typecode):
+    """Returns an array that was written by write_array(). It must
+    have the given type code."""
+    (file_typecode, itemsize, num_items) = \
+            ARRAY_HEADER.unpack(_read(fh, ARRAY_HEADER.size))
+    values = array.array(typecode)
+    if file_typecode != typecode or itemsize != values.itemsize:
+        raise SidecarError("Expected an array of type %s" % (typecode,))
+    _check_remaining(fh, num_items * itemsize)
+    values.fromfile(fh, num_items)
+    return values
+
+def write_strings(fh, strings):
+    """Write a list of strings, any of which can be None, or a float
+    (as the build cache keeps the times with the strings)."""
+    kinds = array.array("b")
+    lengths = array.array("l")
+    pieces = []
+    for text in strings:
+        if text is None:
+            kinds.append(STRING_NONE)
+            lengths.append(0)
+            continue
+        if isinstance(text, unicode):
+            kinds.append(STRING_UNICODE)
+            text = text.encode("utf-8")
+        elif isinstance(text, float):
+            kinds.append(STRING_FLOAT)
+            text = repr(text)
+        else:
+            kinds.append(STRING_STR)
+        lengths.append(len(text))
+        pieces.append(text)
+
+    write_array(fh, kinds)
+    write_array(fh, lengths)
+    fh.write("".join(pieces))
+
+def read_strings(fh):
+    """Returns the list of strings written by write_strings()."""
+    kinds = read_array(fh, "b")
+    lengths = read_array(fh, "l")
+    if len(kinds) != len(lengths) or (lengths and min(lengths) < 0):
+        raise SidecarError("The string lengths are damaged")
+    total = sum(lengths)
+    _check_remaining(fh, total)
+    data = _read(fh, total)
+
+    strings = []
+    pos = 0
+    try:
+        for (kind, length) in izip(kinds, lengths):
+            if kind == STRING_STR:
+                strings.append(data[pos:pos + length])
+            elif kind == STRING_NONE:
+                strings.append(None)
+            elif kind == STRING_UNICODE:
+                strings.append(data[pos:pos + length].decode("utf-8"))
+            elif kind == STRING_FLOAT:
+                strings.append(float(data[pos:pos + length]))
+            else:
+                raise SidecarError("Unknown string kind %d" % (kind,))
+            pos += length
+    except UnicodeDecodeError:
+        raise SidecarError("A string is not valid UTF-8")
+    except ValueError:
+        raise SidecarError("A float is not valid")
+    return strings
+
+def save(filename, write_func):
+    """Call write_func with a filehandle, to write the sidecar file.
+    The file is written under a temporary name and renamed, so a
+    reader never sees a partial sidecar. Can raise IOError or
+    OSError."""
+    tmp_filename = "%s.%d.tmp" % (filename, os.getpid())
+    try:
+        with open(tmp_filename, "wb") as fh:
+            write_func(fh)
+        os.rename(tmp_filename, filename)
+    finally:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+
+def load(filename, magic, version, key, read_func):
+    """Open a sidecar file, check its header, and call read_func with
+    the filehandle to read the rest. Returns True, or False if the
+    file can't be read, is damaged, or doesn't match."""
+    try:
+        with open(filename, "rb") as fh:
+            if not read_header(fh, magic, version, key):
+                return False
+            read_func(fh)
+    except (IOError, EOFError, MemoryError, SidecarError):
+        return False
+    return True
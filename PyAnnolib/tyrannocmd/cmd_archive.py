@@ -0,0 +1,41 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import sys
+
+from pyannolib import annolib
+from pyannolib import compressed
+
+def SubParser(subparsers):
+
+    help = "Write a block-compressed copy of the annotation file"
+
+    parser = subparsers.add_parser("archive", help=help)
+    parser.set_defaults(func=Run)
+
+    parser.add_argument("--block-size", metavar="BYTES", type=int,
+            default=compressed.DEFAULT_BLOCK_SIZE,
+            help="Uncompressed size of each block (default %(default)s)")
+
+    parser.add_argument("--level", type=int, default=6,
+            help="zlib compression level, 1-9 (default %(default)s)")
+
+    parser.add_argument("anno_file")
+
+    parser.add_argument("output_file")
+
+
+def Run(args):
+    # anno_open() finds the "_1", etc. parts, and reads
+    # gzip and xz files, so any of those can be archived.
+    try:
+        fh = annolib.anno_open(args.anno_file)
+    except (IOError, annolib.PyAnnolibError) as e:
+        sys.exit(e)
+
+    try:
+        compressed.write_block_file(fh, args.output_file,
+                args.block_size, args.level)
+    except IOError as e:
+        sys.exit(e)
+    finally:
+        fh.close()
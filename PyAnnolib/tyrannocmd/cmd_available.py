@@ -0,0 +1,87 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+Compare the parallelism that the job dependencies allowed with the
+parallelism that the cluster achieved.
+"""
+
+import csv
+import sys
+
+from pyannolib import annolib
+from tyrannolib import available
+from tyrannolib import jobgraph
+from tyrannolib import sequencing
+
+PERCENTILES = [10, 50, 90]
+
+def SubParser(subparsers):
+
+    help = "Compare the available and achieved parallelism in a build"
+
+    parser = subparsers.add_parser("available", help=help)
+    parser.set_defaults(func=Run)
+
+    parser.add_argument("--series", metavar="FILE",
+            help="Store the time series, as CSV, in FILE")
+
+    parser.add_argument("anno_file")
+
+
+def print_summary(label, steps):
+    durations = available.get_durations(steps)
+    print "%-10s %6.1f %s %5d" % (label, available.get_mean(durations),
+            " ".join(["%5d" % (available.get_percentile(durations, pct),)
+                for pct in PERCENTILES]),
+            max(durations.keys() or [0]))
+
+def Run(args):
+    graph = jobgraph.JobGraph()
+    cluster = sequencing.Cluster()
+    try:
+        build = annolib.AnnotatedBuild(args.anno_file)
+        for job in build.iterJobs(args.jobs, fields=jobgraph.JOB_FIELDS):
+            graph.addJob(job)
+            for timing in job.getTimings():
+                cluster.addTiming(timing)
+        build.close()
+
+    except annolib.PyAnnolibError, e:
+        sys.exit(e)
+
+    available_steps = available.calculate_available_steps(graph)
+    achieved_steps = cluster.calculateSteps()
+    merged = available.merge_steps(available_steps, achieved_steps)
+
+    if args.series:
+        try:
+            with open(args.series, "wb") as fh:
+                writer = csv.writer(fh)
+                writer.writerow(["time", "available", "achieved"])
+                for (time, available_N, achieved_N) in merged:
+                    writer.writerow([annolib.format_time(time),
+                        available_N, achieved_N])
+        except IOError, e:
+            sys.exit(e)
+
+    (waiting, running, idle) = available.classify(merged)
+    tot_time = waiting + running + idle
+
+    print
+    print "Available vs. Achieved Parallelism for:"
+    print args.anno_file
+    print
+    print "             MEAN %s   MAX" % (" ".join(["  P%02d" % (pct,)
+        for pct in PERCENTILES]),)
+    print_summary("AVAILABLE", available_steps)
+    print_summary("ACHIEVED", achieved_steps)
+    print
+
+    for (label, N_time) in [
+            ("Jobs waiting for agents:", waiting),
+            ("All available jobs running:", running),
+            ("No jobs available:", idle)]:
+        if tot_time > 0:
+            pct = 100.0 * N_time / tot_time
+        else:
+            pct = 0.0
+        print "%-28s %12s %5.1f %%" % (label, sequencing.hms(N_time), pct)
@@ -0,0 +1,65 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+Report the chain of jobs that bounds the build's wall-clock time.
+"""
+
+import sys
+
+from pyannolib import annolib
+from tyrannolib import jobgraph
+from tyrannolib import sequencing
+
+def SubParser(subparsers):
+
+    help = "Show the critical path of jobs in a build"
+
+    parser = subparsers.add_parser("critical-path", help=help)
+    parser.set_defaults(func=Run)
+
+    parser.add_argument("anno_file")
+
+
+def Run(args):
+    try:
+        build = annolib.AnnotatedBuild(args.anno_file)
+        graph = jobgraph.build_graph(build, args.jobs)
+        path = graph.getCriticalPath()
+
+        # Read the path's jobs again, for their names and makefiles
+        jobs = build.getJobs([graph.job_ids[job_num] for job_num in path])
+        jobs = dict([(job.getID(), job) for job in jobs])
+
+    except (annolib.PyAnnolibError, jobgraph.JobGraphError), e:
+        sys.exit(e)
+
+    path_length = graph.getPathLength(path)
+    build_time = graph.getBuildTime()
+
+    print
+    print "Critical Path for:"
+    print args.anno_file
+    print
+    print "JOBS IN BUILD:      ", graph.getNumJobs()
+    print "DEPENDENCIES:       ", graph.getNumEdges()
+    print "BUILD TIME:         ", sequencing.hms(build_time)
+    print "CRITICAL PATH TIME: ", sequencing.hms(path_length)
+    print "JOBS ON PATH:       ", len(path)
+    print
+    print "       START     DURATION PERCENT JOB"
+
+    for job_num in path:
+        job_id = graph.job_ids[job_num]
+        duration = graph.durations[job_num]
+        if path_length > 0:
+            pct = 100.0 * duration / path_length
+        else:
+            pct = 0.0
+        print "%12s %12s %5.1f %% %s" % (
+                sequencing.hms(graph.earliest_start[job_num]),
+                sequencing.hms(duration), pct, job_id)
+
+        job = jobs.get(job_id)
+        if job:
+            print "%33s %s %s" % ("", job.getType(), job.getName())
+            if job.getFile():
+                print "%33s %s:%s" % ("", job.getFile(), job.getLine())
@@ -71,7 +71,11 @@ WRITE_OPS = [
 #================================================= start of child process
 def read_annofile(build, roots_hash, anno_queue):
     """Read an annotation file and feed the file operations
-    into the queue. The records put into the queue are tuples of
+    into the queue. The operations are streamed from the parser
+    (see AnnotatedBuild.iterEvents()), so a job with a huge list
+    of operations is never held in memory all at once, only
+    the (small) tuples below. The records put into the queue
+    are tuples of
 
     (job_id, [read_ops], [write_ops])
 
@@ -82,12 +86,13 @@ def read_annofile(build, roots_hash, anno_queue):
     and the function finishes, causing the child process to
     terminate."""
 
-    def op_tuple(op):
-        """Given an Operation object from PyAnnolib,
-        return a tuple of (op, relpath), where relpath
-        is relative to one of the emake roots."""
-        op_type = op.getType()
-        abspath = op.getFile()
+    # The same files are read by many jobs, so remember
+    # the relative path of each one.
+    # Key = file ID in the build's PathTable, Value = relpath
+    relpaths = {}
+
+    def find_relpath(abspath):
+        """Return abspath relative to one of the emake roots."""
         for root_path, label in roots_hash.items():
             if abspath[:len(root_path)] == root_path:
                 if label:
@@ -101,28 +106,33 @@ def read_annofile(build, roots_hash, anno_queue):
             # not appear in the annotation file. But stil...
             relpath = abspath
 
-        return (op_type, relpath)
+        return relpath
 
-    for job in build.iterJobs():
-        # Find the interesting rule jobs.
+    def op_tuple(op):
+        """Given an Operation object from PyAnnolib,
+        return a tuple of (op, relpath), where relpath
+        is relative to one of the emake roots."""
+        op_type = op.getType()
+        relpath = relpaths.get(op.getFileID())
+        if relpath is None:
+            relpath = relpaths[op.getFileID()] = find_relpath(op.getFile())
 
-        # We only want jobs of certain types
-        job_type = job.getType()
-        if job_type != annolib.JOB_TYPE_RULE and \
-                job_type != annolib.JOB_TYPE_CONTINUATION:
-            continue
+        return (op_type, relpath)
+
+    # Items are (op, relpath) tuples
+    read_ops = []
+    write_ops = []
 
-        # And only successful jobs
-        if job.getRetval() != 0:
-            continue
+    # Is the current job one we want?
+    wanted = False
 
-        # Divide all the file operations into 2 groups,
-        # one for reading, and one for writing
-        # Items are (op, relpath) tuples
-        read_ops = []
-        write_ops = []
+    for (event, job, op) in build.iterEvents(fields=[annolib.JOB_FIELD_OPS]):
+        if event == annolib.EVENT_OP:
+            if not wanted:
+                continue
 
-        for op in job.getOperations():
+            # Divide all the file operations into 2 groups,
+            # one for reading, and one for writing
             op_type = op.getType()
 
             if op_type in READ_OPS:
@@ -135,11 +145,20 @@ def read_annofile(build, roots_hash, anno_queue):
                 # Ignore all other op types
                 pass
 
-        # Proceed only if we have both read and write operations
-        if (not read_ops) or (not write_ops):
-            continue
-
-        anno_queue.put((job.getID(), read_ops, write_ops))
+        elif event == annolib.EVENT_JOB_START:
+            # Find the interesting rule jobs.
+            # We only want jobs of certain types
+            job_type = job.getType()
+            wanted = job_type == annolib.JOB_TYPE_RULE or \
+                    job_type == annolib.JOB_TYPE_CONTINUATION
+            read_ops = []
+            write_ops = []
+
+        elif event == annolib.EVENT_JOB_END:
+            # And only successful jobs. Proceed only if we
+            # have both read and write operations
+            if wanted and job.getRetval() == 0 and read_ops and write_ops:
+                anno_queue.put((job.getID(), read_ops, write_ops))
 
     # Indicate it's the end of the stream
     anno_queue.put(None)
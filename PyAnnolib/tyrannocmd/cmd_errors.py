@@ -3,6 +3,7 @@
 import os
 import sys
 from pyannolib import annolib
+from pyannolib import prefilter
 import datetime
 
 TYPE_JOB = 0
@@ -28,13 +29,23 @@ def SubParser(subparsers):
     parser.add_argument("anno_file")
 
 def find_error_jobs(build):
-    """Returns all the Jobs that were not successful."""
+    """Returns all the Jobs that were not successful. The prefilter
+    scans the file serially, so this doesn't use worker processes."""
 
     job_errors = []
     make_errors = []
     end_job = None
 
-    for job in build.iterJobs():
+    # These are the parts of the job that print_error_job() reports
+    fields = [annolib.JOB_FIELD_TIMING, annolib.JOB_FIELD_COMMANDS,
+            annolib.JOB_FIELD_OUTPUTS]
+
+    # Only failed jobs have a <failed> element, so don't bother
+    # parsing the others; but we want the end job, too.
+    job_filter = prefilter.JobPrefilter(["<failed "],
+            prefilter.attr_equals("type", annolib.JOB_TYPE_END))
+
+    for job in build.iterJobs(fields=fields, prefilter=job_filter):
         if job.getType() == annolib.JOB_TYPE_END:
             end_job = job
             continue
@@ -82,21 +93,19 @@ def print_error_job(out_fh, n, show_summary, build, job, report_type):
     for timing in job.getTimings():
 
         if build_start_dt:
-            job_start = float(timing.getInvoked())
-            job_end = float(timing.getCompleted())
             job_start_dt = build_start_dt + \
-                    datetime.timedelta(seconds=job_start)
+                    datetime.timedelta(seconds=timing.getInvoked())
             job_end_dt = build_start_dt + \
-                    datetime.timedelta(seconds=job_end)
+                    datetime.timedelta(seconds=timing.getCompleted())
         else:
             job_start_dt = ""
             job_end_dt = ""
 
         print >> out_fh, "Node: %s  Start: %s (%s)" % (timing.getNode(),
-                job_start_dt, timing.getInvoked())
+                job_start_dt, annolib.format_time(timing.getInvoked()))
         print >> out_fh, "      %s  End:   %s (%s)" % \
                 (" " * len(timing.getNode()),
-                job_end_dt, timing.getCompleted())
+                job_end_dt, annolib.format_time(timing.getCompleted()))
     print >> out_fh
 
     for cmd in job.getCommands():
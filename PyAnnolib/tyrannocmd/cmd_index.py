@@ -0,0 +1,30 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+Load the annotation file into an SQLite database.
+"""
+
+import sys
+
+from pyannolib import annolib
+from tyrannolib import sqlexport
+
+def SubParser(subparsers):
+
+    help = "Load the annotation file into an SQLite database"
+
+    parser = subparsers.add_parser("index", help=help)
+    parser.set_defaults(func=Run)
+
+    parser.add_argument("anno_file")
+
+    parser.add_argument("db_file")
+
+
+def Run(args):
+    try:
+        build = annolib.AnnotatedBuild(args.anno_file)
+        num_jobs = sqlexport.export(build, args.db_file, args.jobs)
+    except (annolib.PyAnnolibError, sqlexport.SQLExportError), e:
+        sys.exit(e)
+
+    print "Loaded %d jobs into %s" % (num_jobs, args.db_file)
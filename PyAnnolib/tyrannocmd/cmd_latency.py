@@ -0,0 +1,66 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+Report how long jobs waited between becoming ready and being started.
+"""
+
+import sys
+
+from pyannolib import annolib
+from tyrannolib import latency
+from tyrannolib import sequencing
+
+def SubParser(subparsers):
+
+    help = "Show how long jobs waited to be started after they were ready"
+
+    parser = subparsers.add_parser("latency", help=help)
+    parser.set_defaults(func=Run)
+
+    parser.add_argument("--worst", metavar="N", type=int,
+            default=latency.DEFAULT_NUM_WORST,
+            help="Show the N jobs that waited longest "
+            "(default is %(default)s)")
+
+    parser.add_argument("anno_file")
+
+
+def print_table(label, dispatch, groups):
+    print "%-20s %7s %12s %12s %12s %12s" % (label, "JOBS", "MEAN",
+            "P50", "P90", "MAX")
+    for name in sorted(groups.keys()):
+        (count, mean, median, p90, maximum) = \
+                dispatch.getSummary(groups[name])
+        print "%-20s %7d %12s %12s %12s %12s" % (name, count,
+                sequencing.hms(mean), sequencing.hms(median),
+                sequencing.hms(p90), sequencing.hms(maximum))
+    print
+
+def Run(args):
+    dispatch = latency.DispatchLatency(args.worst)
+    try:
+        build = annolib.AnnotatedBuild(args.anno_file)
+        for job in build.iterJobs(args.jobs, fields=latency.JOB_FIELDS):
+            dispatch.addJob(job)
+        build.close()
+
+    except annolib.PyAnnolibError, e:
+        sys.exit(e)
+
+    print
+    print "Dispatch Latency for:"
+    print args.anno_file
+    print
+    print "JOBS MEASURED:", dispatch.getNumJobs()
+    print "JOBS STARTED BEFORE THEIR DEPENDENCIES COMPLETED:", \
+            dispatch.num_early
+    print
+
+    print_table("NODE", dispatch, dispatch.by_node)
+    print_table("JOB TYPE", dispatch, dispatch.by_type)
+
+    worst = dispatch.getWorst()
+    if worst:
+        print "WORST:"
+        for (job_latency, job_id, job_type, node, name) in worst:
+            print "%12s %s %s %s %s" % (sequencing.hms(job_latency),
+                    job_id, job_type, node, name)
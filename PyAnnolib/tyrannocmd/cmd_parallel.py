@@ -15,6 +15,8 @@ def SubParser(subparsers):
     parser = subparsers.add_parser("parallel", help=help)
     parser.set_defaults(func=Run)
 
+    parser.add_argument("--steps", action="store_true",
+            help="Also show the number of agents running over time")
 
     parser.add_argument("anno_file")
 
@@ -26,8 +28,9 @@ def Run(args):
     try:
         build = annolib.AnnotatedBuild(args.anno_file)
         
-        # Collect all the jobs in a hash, and look for conflict jobs
-        for job in build.iterJobs():
+        # Only the timings are needed
+        for job in build.iterJobs(args.jobs,
+                fields=[annolib.JOB_FIELD_TIMING]):
             timings = job.getTimings()
             for timing in timings:
                 cluster.addTiming(timing)
@@ -35,9 +38,6 @@ def Run(args):
     except annolib.PyAnnolibError, e:
         sys.exit(e)
 
-#    print "Merging Overlaps", time.ctime()
-    cluster.mergeOverlaps()
-
 #    print "Calculating Histogram", time.ctime()
     concurrency = cluster.calculateHistogram()
 
@@ -63,8 +63,8 @@ def Run(args):
     print
     print "TOTAL TIME:", sequencing.hms(tot_time)
 
-
-
-
-
-
+    if args.steps:
+        print
+        print "        TIME AGENTS"
+        for (time, N) in cluster.calculateSteps():
+            print "%12s %6d" % (annolib.format_time(time), N)
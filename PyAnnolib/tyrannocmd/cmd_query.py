@@ -0,0 +1,47 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+Run SQL against a database made by "tyranno index".
+"""
+
+import sys
+
+from tyrannolib import sqlexport
+
+def SubParser(subparsers):
+
+    help = "Run SQL against a database made by 'tyranno index'"
+
+    parser = subparsers.add_parser("query", help=help)
+    parser.set_defaults(func=Run)
+
+    parser.add_argument("--separator", metavar="SEP", default="\t",
+            help="Separate the columns with SEP (default is a tab)")
+
+    parser.add_argument("--no-header", action="store_true",
+            help="Don't print the column names")
+
+    parser.add_argument("db_file")
+
+    parser.add_argument("sql")
+
+
+def format_value(value):
+    if value is None:
+        return ""
+    elif isinstance(value, unicode):
+        return value.encode("utf-8")
+    else:
+        return str(value)
+
+def Run(args):
+    try:
+        columns, rows = sqlexport.query(args.db_file, args.sql)
+
+        if columns and not args.no_header:
+            print args.separator.join(columns)
+
+        for row in rows:
+            print args.separator.join([format_value(v) for v in row])
+
+    except sqlexport.SQLExportError, e:
+        sys.exit(e)
@@ -1,5 +1,7 @@
 # Copyright (c) 2014 by Cisco Systems, Inc.
 
+import sys
+
 from pyannolib import annolib
 
 def SubParser(subparsers):
@@ -20,15 +22,16 @@ def SubParser(subparsers):
 
 def print_jobs(build, job_ids):
 
-    for job in build.iterJobs():
-        if job.getID() in job_ids:
+    # Use the job index to read only the jobs we want
+    jobs = { job.getID() : job for job in build.getJobs(job_ids) }
+
+    for job_id in job_ids:
+        job = jobs.get(job_id)
+        if job:
             print job.getTextReport()
             print
-            job_ids.remove(job.getID())
-
-            # We're done; stop the search
-            if len(job_ids) == 0:
-                break
+        else:
+            print >> sys.stderr, "No such job:", job_id
 
 def Run(args):
     build = annolib.AnnotatedBuild(args.anno_file)
@@ -0,0 +1,110 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+Predict the build time with different numbers of agents.
+"""
+
+import sys
+
+from pyannolib import annolib
+from tyrannolib import jobgraph
+from tyrannolib import sequencing
+from tyrannolib import simulate
+
+def SubParser(subparsers):
+
+    help = "Predict the build time with different numbers of agents"
+
+    parser = subparsers.add_parser("simulate", help=help)
+    parser.set_defaults(func=Run)
+
+    parser.add_argument("--agents", metavar="N,N,...", required=True,
+            help="The numbers of agents to simulate")
+
+    parser.add_argument("--policy", default=simulate.POLICY_FIFO,
+            choices=sorted(simulate.POLICIES.keys()),
+            help="Which ready job to run first (default is %(default)s)")
+
+    parser.add_argument("--histogram", action="store_true",
+            help="Compare the parallelism histograms of the real "
+            "and simulated builds")
+
+    parser.add_argument("anno_file")
+
+
+def percentages(concurrency):
+    """Returns a dictionary of the percentage of the time spent
+    at each concurrency."""
+    tot_time = sum(concurrency.values())
+    if tot_time == 0:
+        return {}
+    return dict([(N, 100.0 * N_time / tot_time)
+        for (N, N_time) in concurrency.items()])
+
+def Run(args):
+    try:
+        agent_counts = [int(n) for n in args.agents.split(",")]
+    except ValueError:
+        sys.exit("--agents needs a list of numbers: %s" % (args.agents,))
+
+    graph = jobgraph.JobGraph()
+    cluster = sequencing.Cluster()
+    try:
+        build = annolib.AnnotatedBuild(args.anno_file)
+        for job in build.iterJobs(args.jobs, fields=jobgraph.JOB_FIELDS):
+            graph.addJob(job)
+            for timing in job.getTimings():
+                cluster.addTiming(timing)
+        build.close()
+        graph.finish()
+
+        sims = [simulate.Simulation(graph, num_agents, args.policy,
+            record=args.histogram) for num_agents in agent_counts]
+
+    except (annolib.PyAnnolibError, jobgraph.JobGraphError,
+            simulate.SimulationError), e:
+        sys.exit(e)
+
+    real_time = graph.getBuildTime()
+    real_agents = len(cluster.agents)
+    if real_time > 0 and real_agents > 0:
+        real_util = 100.0 * sum(graph.durations) / (real_agents * real_time)
+    else:
+        real_util = 0.0
+
+    print
+    print "Simulated Builds for:"
+    print args.anno_file
+    print
+    print "POLICY:              ", args.policy
+    print "CRITICAL PATH TIME:  ", sequencing.hms(graph.getEndTime())
+    print
+    print "AGENTS   BUILD TIME   BUSY SPEEDUP"
+    print "%6s %12s %5.1f %% %7s (real build, %d agents)" % ("",
+            sequencing.hms(real_time), real_util, "", real_agents)
+
+    for sim in sims:
+        if sim.getMakespan() > 0:
+            speedup = "%6.2fx" % (real_time / sim.getMakespan(),)
+        else:
+            speedup = ""
+        print "%6d %12s %5.1f %% %7s" % (sim.num_agents,
+                sequencing.hms(sim.getMakespan()),
+                100.0 * sim.getUtilization(), speedup)
+
+    if args.histogram:
+        real_pcts = percentages(cluster.calculateHistogram())
+        sim_pcts = [percentages(sim.cluster.calculateHistogram())
+                for sim in sims]
+
+        print
+        print "Parallelism Histogram (percent of time)"
+        print
+        print "AGENTS   REAL " + " ".join(["%6s" % (sim.num_agents,)
+            for sim in sims])
+        discrete_Ns = set(real_pcts.keys())
+        for pcts in sim_pcts:
+            discrete_Ns.update(pcts.keys())
+        for N in sorted(discrete_Ns):
+            print "%3d: %6.1f %s" % (N, real_pcts.get(N, 0.0),
+                    " ".join(["%6.1f" % (pcts.get(N, 0.0),)
+                        for pcts in sim_pcts]))
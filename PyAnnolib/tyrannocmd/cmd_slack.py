@@ -0,0 +1,49 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+Report how long each job could have been delayed without making
+the build longer, as a ranked list of targets.
+"""
+
+import sys
+
+from pyannolib import annolib
+from tyrannolib import jobgraph
+
+def SubParser(subparsers):
+
+    help = "Show the slack of each target, most urgent first"
+
+    parser = subparsers.add_parser("slack", help=help)
+    parser.set_defaults(func=Run)
+
+    parser.add_argument("--type", metavar="JOB_TYPE", action="append",
+            help="Only list jobs of JOB_TYPE (can be given more than once)")
+
+    parser.add_argument("-o", metavar="FILE",
+            help="Store the CSV output in FILE (stdout is default)")
+
+    parser.add_argument("anno_file")
+
+
+def Run(args):
+    try:
+        build = annolib.AnnotatedBuild(args.anno_file)
+        graph = jobgraph.build_graph(build, args.jobs)
+        build.close()
+        graph.calculateLatestStarts()
+
+    except (annolib.PyAnnolibError, jobgraph.JobGraphError), e:
+        sys.exit(e)
+
+    if args.o:
+        try:
+            out_fh = open(args.o, "wb")
+        except IOError, e:
+            sys.exit(e)
+    else:
+        out_fh = sys.stdout
+
+    graph.writePriorities(out_fh, args.type)
+
+    if args.o:
+        out_fh.close()
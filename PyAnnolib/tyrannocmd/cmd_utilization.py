@@ -0,0 +1,55 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+Report the utilization of the cluster over time.
+"""
+
+import sys
+
+from pyannolib import annolib
+from tyrannolib import utilization
+
+def SubParser(subparsers):
+
+    help = "Show the utilization of each agent and job type over time"
+
+    parser = subparsers.add_parser("utilization", help=help)
+    parser.set_defaults(func=Run)
+
+    parser.add_argument("-b", "--bucket", metavar="SECONDS", type=float,
+            default=utilization.DEFAULT_BUCKET_SIZE,
+            help="The length of each time bucket (default is %(default)s)")
+
+    parser.add_argument("-o", metavar="FILE",
+            help="Store the CSV output in FILE (stdout is default)")
+
+    parser.add_argument("anno_file")
+
+
+def Run(args):
+    try:
+        usage = utilization.Utilization(args.bucket)
+        build = annolib.AnnotatedBuild(args.anno_file)
+
+        # Only the timings are needed
+        for job in build.iterJobs(args.jobs,
+                fields=[annolib.JOB_FIELD_TIMING]):
+            usage.addJob(job)
+        build.close()
+
+        usage.calculate()
+
+    except (annolib.PyAnnolibError, utilization.UtilizationError), e:
+        sys.exit(e)
+
+    if args.o:
+        try:
+            out_fh = open(args.o, "wb")
+        except IOError, e:
+            sys.exit(e)
+    else:
+        out_fh = sys.stdout
+
+    usage.writeCSV(out_fh)
+
+    if args.o:
+        out_fh.close()
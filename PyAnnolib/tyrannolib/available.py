@@ -0,0 +1,121 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+Compare the parallelism that the job dependencies allowed with the
+parallelism that the cluster achieved.
+
+A job is available from the time the last of the jobs it depends on
+completed, in the real build, until it completed itself; during that
+time it was either waiting for an agent or running. The number of
+available jobs over time is the width of the ready set. Where it is
+bigger than the number of busy agents, jobs were waiting for the
+cluster; where it is not, the build was held back by its dependencies.
+
+Both are step functions, made with sequencing.calculate_steps(), so
+the work is a sort and a linear sweep.
+"""
+
+import array
+from itertools import izip
+
+from tyrannolib import jobgraph
+from tyrannolib import sequencing
+
+def get_ready_times(graph):
+    """Returns an array of the time at which each job's dependencies
+    had all completed in the real build, or jobgraph.NO_TIME for jobs
+    without timings. A job that started before its dependencies
+    completed is counted as ready when it started."""
+    ready = array.array("d", [0.0]) * graph.getNumJobs()
+    last_completed = graph.last_completed
+    for (from_num, to_num) in izip(graph.edge_from, graph.edge_to):
+        if last_completed[from_num] > ready[to_num]:
+            ready[to_num] = last_completed[from_num]
+
+    first_invoked = graph.first_invoked
+    for job_num in xrange(graph.getNumJobs()):
+        if first_invoked[job_num] == jobgraph.NO_TIME:
+            ready[job_num] = jobgraph.NO_TIME
+        elif ready[job_num] > first_invoked[job_num]:
+            ready[job_num] = first_invoked[job_num]
+    return ready
+
+def calculate_available_steps(graph):
+    """Returns the number of available jobs over time, as a step
+    function like sequencing.calculate_steps()."""
+    ready = get_ready_times(graph)
+    invoked = []
+    completed = []
+    for (ready_time, completed_time) in izip(ready, graph.last_completed):
+        if ready_time != jobgraph.NO_TIME:
+            invoked.append(ready_time)
+            completed.append(completed_time)
+    return sequencing.calculate_steps(invoked, completed)
+
+def merge_steps(a_steps, b_steps):
+    """Combine two step functions into one list of (time, a_N, b_N)
+    tuples, with a tuple wherever either one changes."""
+    merged = []
+    a_N = 0
+    b_N = 0
+    i_a = 0
+    i_b = 0
+    while i_a < len(a_steps) or i_b < len(b_steps):
+        if i_b == len(b_steps) or (i_a < len(a_steps) and
+                a_steps[i_a][0] <= b_steps[i_b][0]):
+            time = a_steps[i_a][0]
+        else:
+            time = b_steps[i_b][0]
+
+        while i_a < len(a_steps) and a_steps[i_a][0] == time:
+            a_N = a_steps[i_a][1]
+            i_a += 1
+        while i_b < len(b_steps) and b_steps[i_b][0] == time:
+            b_N = b_steps[i_b][1]
+            i_b += 1
+        merged.append((time, a_N, b_N))
+    return merged
+
+def get_durations(steps):
+    """Returns a dictionary of the total time spent at each N
+    of a step function."""
+    durations = {}
+    for (i, (time, N)) in enumerate(steps[:-1]):
+        durations[N] = durations.get(N, 0.0) + steps[i + 1][0] - time
+    return durations
+
+def get_percentile(durations, pct):
+    """Given the durations from get_durations(), returns the smallest
+    N for which at least pct percent of the time was spent at N or
+    less."""
+    tot_time = sum(durations.values())
+    so_far = 0.0
+    for N in sorted(durations.keys()):
+        so_far += durations[N]
+        if so_far >= tot_time * pct / 100.0:
+            return N
+    return 0
+
+def get_mean(durations):
+    """Given the durations from get_durations(), returns the
+    time-weighted mean N."""
+    tot_time = sum(durations.values())
+    if tot_time == 0:
+        return 0.0
+    return sum([N * N_time for (N, N_time) in durations.items()]) / tot_time
+
+def classify(merged):
+    """Given the (time, available, achieved) tuples from merge_steps(),
+    returns the total time in which (jobs were waiting for agents,
+    every available job was running, no jobs were available)."""
+    waiting = 0.0
+    running = 0.0
+    idle = 0.0
+    for (i, (time, available, achieved)) in enumerate(merged[:-1]):
+        duration = merged[i + 1][0] - time
+        if available == 0:
+            idle += duration
+        elif available > achieved:
+            waiting += duration
+        else:
+            running += duration
+    return (waiting, running, idle)
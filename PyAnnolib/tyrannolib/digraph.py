@@ -1,54 +1,70 @@
-"""Directed Acyclic Graph"""
+"""Directed Acyclic Graph
+
+The nodes and edges are stored in a tyrannolib.graph.Graph, by node
+number; the Node objects here are handles onto it, so that the edges
+don't have to be kept, and searched, in per-node lists.
+"""
 
 import types
 
+from tyrannolib import graph
+
 # Indices for the edge tuples
 EDGE_LABEL = 0
 EDGE_NODE = 1
 
 class Node:
-    def __init__(self, name):
+    def __init__(self, name, dag, node_num):
         self.name = name
-
-        # We keep track of edges going in
-        # both directions, so that we can walk
-        # the tree in both directions if we need to.
-        # Items are tuples: (label, Node)
-        #
-        # I use "out" and "in" in the sense of the
-        # way in which I usually draw DAGS for build systems.
-        # Arrows pointing "out" refer to what we depend on.
-        # That's backwards if you think if "out" as what
-        # we produce. Deal with it. :)
-        self.out_edges = [] # what we depend on
-        self.in_edges = []  # what depends on us
+        self.dag = dag
+        self.node_num = node_num
 
     def get_name(self):
         return self.name
 
+    def get_num(self):
+        return self.node_num
+
+    # We keep track of edges going in
+    # both directions, so that we can walk
+    # the tree in both directions if we need to.
+    # Edges are tuples: (label, Node)
+    #
+    # I use "out" and "in" in the sense of the
+    # way in which I usually draw DAGS for build systems.
+    # Arrows pointing "out" refer to what we depend on.
+    # That's backwards if you think if "out" as what
+    # we produce. Deal with it. :)
+
     def get_out_edges(self):
-        return self.out_edges
+        """What we depend on"""
+        return self.dag._edges_to_nodes(
+                self.dag.graph.getOutEdges(self.node_num))
 
     def get_in_edges(self):
-        return self.in_edges
+        """What depends on us"""
+        return self.dag._edges_to_nodes(
+                self.dag.graph.getInEdges(self.node_num))
 
     def get_num_out_edges(self):
-        return len(self.out_edges)
+        return self.dag.graph.getOutDegree(self.node_num)
 
     def get_num_in_edges(self):
-        return len(self.in_edges)
+        return self.dag.graph.getInDegree(self.node_num)
 
     def add_out_edge(self, label, other_node):
-        return self.out_edges.append( (label, other_node) )
+        self.dag.graph.addEdge(self.node_num, other_node.node_num, label)
 
     def add_in_edge(self, label, other_node):
-        return self.in_edges.append( (label, other_node) )
+        self.dag.graph.addEdge(other_node.node_num, self.node_num, label)
 
     def has_out_edge(self, label, other_node):
-        return (label, other_node) in self.out_edges
+        return self.dag.graph.hasEdge(self.node_num, other_node.node_num,
+                label)
 
     def has_in_edge(self, label, other_node):
-        return (label, other_node) in self.in_edges
+        return self.dag.graph.hasEdge(other_node.node_num, self.node_num,
+                label)
 
 
 class DAG:
@@ -58,17 +74,25 @@ class DAG:
         # Key = node name, Value = Node object
         self.nodes = {}
 
-        # Nodes with no parents
-        self.root_nodes = set()
-        
-        # Nodes with no children
-        self.leaf_nodes = set()
+        # The Node objects, by node number
+        self.node_list = []
+
+        self.graph = graph.Graph()
+
+    def _edges_to_nodes(self, edges):
+        return [(label, self.node_list[node_num])
+                for (label, node_num) in edges]
+
+    def _nums_to_nodes(self, node_nums):
+        return [self.node_list[node_num] for node_num in node_nums]
 
     def get_leaf_nodes(self):
-        return list(self.leaf_nodes)
+        """Nodes with no children"""
+        return self._nums_to_nodes(self.graph.getLeaves())
 
     def get_root_nodes(self):
-        return list(self.root_nodes)
+        """Nodes with no parents"""
+        return self._nums_to_nodes(self.graph.getRoots())
 
     def get_node(self, name):
         return self.nodes.get(name)
@@ -83,12 +107,9 @@ class DAG:
             msg = "A node with name '%s' already exists" % (name,)
             raise ValueError(msg)
 
-        new_node = self.nodes[name] = Node(name)
-
-        # No connections means it is both a leaf and a root
-        self.leaf_nodes.add(new_node)
-        self.root_nodes.add(new_node)
-
+        node_num = self.graph.addNode()
+        new_node = self.nodes[name] = Node(name, self, node_num)
+        self.node_list.append(new_node)
         return new_node
 
     def set_node(self, name):
@@ -102,32 +123,25 @@ class DAG:
     def add_edge(self, node_a, edge_label, node_b):
         """Creates a new edge between two nodes. If that
         edge already exists, raises ValueError. Returns nothing."""
-        # Does the edge already exists?
-        if node_a.has_out_edge(edge_label, node_b):
+        if not self.graph.addEdge(node_a.node_num, node_b.node_num,
+                edge_label):
             msg = "Node %s alrady has edge (%s, %s)" % \
                     (node_a.get_name(), edge_label, node_b.get_name())
             raise ValueError(msg)
 
-        # There is no need to check node_b for its in-edges,
-        # because our algorithm always sets both node_a/out and node_b/in
-
-        # Add the edges to both nodes
-        node_a.add_out_edge(edge_label, node_b)
-        node_b.add_in_edge(edge_label, node_a)
-
-        # Now that node_a has an out-edge, it cannot be a leaf node.
-        if node_a.get_num_out_edges() == 1:
-            self.leaf_nodes.remove(node_a)
-
-        # Now that node_b has an in-edge, it cannot be a root node.
-        if node_b.get_num_in_edges() == 1:
-            self.root_nodes.remove(node_b)
-
     def set_edge(self, node_a, edge_label, node_b):
         """Creates the edge between two nodes. If that edge
         already exists, it's a no-op."""
-        if node_a.has_out_edge(edge_label, node_b):
-            return
-        else:
-            self.add_edge(node_a, edge_label, node_b)
-
+        self.graph.addEdge(node_a.node_num, node_b.node_num, edge_label)
+
+    def get_topological_order(self):
+        """Returns the nodes, each after the nodes it has edges from.
+        Raises graph.GraphError if there is a cycle."""
+        return self._nums_to_nodes(self.graph.topologicalSort())
+
+    def find_cycle(self):
+        """Returns a list of the nodes in a cycle, or None."""
+        cycle = self.graph.findCycle()
+        if cycle is None:
+            return None
+        return self._nums_to_nodes(cycle)
@@ -0,0 +1,382 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+A directed graph whose nodes are the integers 0 to N-1.
+
+The edges are appended to arrays, and a set of their hashed keys
+keeps them unique. When the graph is queried, the edges are sorted
+into compressed (CSR) form: for the out-edges, the successors of node
+i are succs[succ_start[i]:succ_start[i + 1]], and likewise for the
+in-edges. Adding an edge after that drops the compressed form, and it
+is rebuilt when it is next needed.
+
+Each edge can have a label, which can be any hashable value; None is
+the default. Two edges between the same nodes with different labels
+are different edges.
+"""
+
+import array
+from itertools import izip
+
+# Node numbers must fit in this many bits, for the edge keys
+NODE_BITS = 31
+MAX_NODES = 1 << NODE_BITS
+
+class GraphError(Exception):
+    pass
+
+class Graph(object):
+    """A directed graph with integer nodes and labeled edges."""
+
+    def __init__(self, num_nodes=0):
+        self.num_nodes = num_nodes
+
+        # One entry per edge
+        self.edge_from = array.array("i")
+        self.edge_to = array.array("i")
+        self.edge_labels = array.array("i")
+
+        # The edge labels, by number, and the numbers, by label
+        self.labels = [None]
+        self._label_num = { None : 0 }
+
+        # The keys of the edges, from _edgeKey()
+        self._edge_keys = set()
+
+        # Set by _compress()
+        self._out = None
+        self._in = None
+
+    @classmethod
+    def fromEdges(cls, num_nodes, edge_from, edge_to, label=None):
+        """Returns a new Graph with num_nodes nodes, and an edge from
+        each node in edge_from to the node in edge_to at the same
+        position."""
+        new_graph = cls(num_nodes)
+        new_graph.addEdges(edge_from, edge_to, label)
+        return new_graph
+
+    def getNumNodes(self):
+        return self.num_nodes
+
+    def getNumEdges(self):
+        return len(self.edge_from)
+
+    def addNode(self):
+        """Adds a node, and returns its number."""
+        return self.addNodes(1)
+
+    def addNodes(self, count):
+        """Adds count nodes, and returns the number of the first one."""
+        first = self.num_nodes
+        if first + count > MAX_NODES:
+            raise GraphError("Too many nodes: %d" % (first + count,))
+        self.num_nodes += count
+        self._out = self._in = None
+        return first
+
+    def _getLabelNum(self, label):
+        label_num = self._label_num.get(label)
+        if label_num is None:
+            label_num = self._label_num[label] = len(self.labels)
+            self.labels.append(label)
+        return label_num
+
+    def _edgeKey(self, from_node, to_node, label_num):
+        # This is a small int, unless the edge has a label
+        return (((label_num << NODE_BITS) | from_node) << NODE_BITS) | \
+                to_node
+
+    def _checkNode(self, node):
+        if not 0 <= node < self.num_nodes:
+            raise GraphError("No such node: %s" % (node,))
+
+    def hasEdge(self, from_node, to_node, label=None):
+        label_num = self._label_num.get(label)
+        if label_num is None:
+            return False
+        return self._edgeKey(from_node, to_node, label_num) in \
+                self._edge_keys
+
+    def addEdge(self, from_node, to_node, label=None):
+        """Adds an edge. Returns True, or False if the graph
+        already has that edge."""
+        self._checkNode(from_node)
+        self._checkNode(to_node)
+        label_num = self._getLabelNum(label)
+        key = self._edgeKey(from_node, to_node, label_num)
+        if key in self._edge_keys:
+            return False
+
+        self._edge_keys.add(key)
+        self.edge_from.append(from_node)
+        self.edge_to.append(to_node)
+        self.edge_labels.append(label_num)
+        self._out = self._in = None
+        return True
+
+    def addEdges(self, edge_from, edge_to, label=None):
+        """Adds an edge from each node in edge_from to the node in edge_to
+        at the same position, all with the same label. Returns the number
+        of edges that were added; the rest were already in the graph."""
+        if len(edge_from) != len(edge_to):
+            raise GraphError("There are %d from-nodes but %d to-nodes" %
+                    (len(edge_from), len(edge_to)))
+        if len(edge_from) == 0:
+            return 0
+        if min(min(edge_from), min(edge_to)) < 0 or \
+                max(max(edge_from), max(edge_to)) >= self.num_nodes:
+            raise GraphError("An edge refers to a node that does not exist")
+
+        label_num = self._getLabelNum(label)
+        edge_keys = self._edge_keys
+        label_bits = label_num << NODE_BITS
+        num_added = 0
+        for (from_node, to_node) in izip(edge_from, edge_to):
+            key = ((label_bits | from_node) << NODE_BITS) | to_node
+            if key in edge_keys:
+                continue
+            edge_keys.add(key)
+            self.edge_from.append(from_node)
+            self.edge_to.append(to_node)
+            num_added += 1
+
+        self.edge_labels.extend(array.array("i", [label_num]) * num_added)
+        self._out = self._in = None
+        return num_added
+
+    def _compressEdges(self, key_nodes, other_nodes):
+        """Returns (start, nodes, labels) arrays for the edges grouped by
+        key_nodes, keeping them in the order in which they were added."""
+        start = array.array("i", [0]) * (self.num_nodes + 1)
+        for node in key_nodes:
+            start[node + 1] += 1
+        for i in xrange(self.num_nodes):
+            start[i + 1] += start[i]
+
+        nodes = array.array("i", [0]) * len(key_nodes)
+        labels = array.array("i", [0]) * len(key_nodes)
+        next_pos = start[:-1]
+        for (key_node, other_node, label_num) in izip(key_nodes,
+                other_nodes, self.edge_labels):
+            pos = next_pos[key_node]
+            nodes[pos] = other_node
+            labels[pos] = label_num
+            next_pos[key_node] = pos + 1
+        return (start, nodes, labels)
+
+    def _getOut(self):
+        if self._out is None:
+            self._out = self._compressEdges(self.edge_from, self.edge_to)
+        return self._out
+
+    def _getIn(self):
+        if self._in is None:
+            self._in = self._compressEdges(self.edge_to, self.edge_from)
+        return self._in
+
+    def getSuccessorArrays(self):
+        """Returns the (start, successors) arrays of the compressed
+        out-edges, for walking the graph quickly."""
+        (start, nodes, _) = self._getOut()
+        return (start, nodes)
+
+    def getSuccessors(self, node):
+        (start, nodes, _) = self._getOut()
+        return nodes[start[node]:start[node + 1]]
+
+    def getPredecessors(self, node):
+        (start, nodes, _) = self._getIn()
+        return nodes[start[node]:start[node + 1]]
+
+    def getOutEdges(self, node):
+        """Returns a list of the (label, node) of the node's out-edges."""
+        (start, nodes, labels) = self._getOut()
+        return [(self.labels[label_num], other_node)
+                for (label_num, other_node) in izip(
+                    labels[start[node]:start[node + 1]],
+                    nodes[start[node]:start[node + 1]])]
+
+    def getInEdges(self, node):
+        """Returns a list of the (label, node) of the node's in-edges."""
+        (start, nodes, labels) = self._getIn()
+        return [(self.labels[label_num], other_node)
+                for (label_num, other_node) in izip(
+                    labels[start[node]:start[node + 1]],
+                    nodes[start[node]:start[node + 1]])]
+
+    def getOutDegree(self, node):
+        (start, _, _) = self._getOut()
+        return start[node + 1] - start[node]
+
+    def getInDegree(self, node):
+        (start, _, _) = self._getIn()
+        return start[node + 1] - start[node]
+
+    def getRoots(self):
+        """Returns the nodes with no in-edges."""
+        (start, _, _) = self._getIn()
+        return [node for node in xrange(self.num_nodes)
+                if start[node] == start[node + 1]]
+
+    def getLeaves(self):
+        """Returns the nodes with no out-edges."""
+        (start, _, _) = self._getOut()
+        return [node for node in xrange(self.num_nodes)
+                if start[node] == start[node + 1]]
+
+    def _kahnOrder(self):
+        """Returns the nodes in topological order, as far as it goes;
+        the nodes in or after a cycle are left out."""
+        (start, succs, _) = self._getOut()
+        num_preds = array.array("i", [0]) * self.num_nodes
+        for node in succs:
+            num_preds[node] += 1
+
+        order = array.array("i", [node for node in xrange(self.num_nodes)
+            if num_preds[node] == 0])
+        i = 0
+        while i < len(order):
+            node = order[i]
+            i += 1
+            for succ in succs[start[node]:start[node + 1]]:
+                num_preds[succ] -= 1
+                if num_preds[succ] == 0:
+                    order.append(succ)
+        return order
+
+    def topologicalSort(self):
+        """Returns an array of the nodes, in which every node comes
+        after the nodes with edges to it. Raises GraphError if the
+        graph has a cycle."""
+        order = self._kahnOrder()
+        if len(order) != self.num_nodes:
+            msg = "The graph has a cycle: %s" % (self.findCycle(),)
+            raise GraphError(msg)
+        return order
+
+    def isAcyclic(self):
+        return len(self._kahnOrder()) == self.num_nodes
+
+    def findCycle(self):
+        """Returns a list of the nodes in a cycle, in edge order,
+        or None if there is no cycle."""
+        (start, succs, _) = self._getOut()
+
+        # 0 = not visited, 1 = on the DFS stack, 2 = done
+        state = array.array("b", [0]) * self.num_nodes
+        for root in xrange(self.num_nodes):
+            if state[root]:
+                continue
+
+            # (node, position of its next successor)
+            stack = [(root, start[root])]
+            state[root] = 1
+            while stack:
+                (node, pos) = stack[-1]
+                if pos == start[node + 1]:
+                    state[node] = 2
+                    stack.pop()
+                    continue
+
+                stack[-1] = (node, pos + 1)
+                succ = succs[pos]
+                if state[succ] == 0:
+                    state[succ] = 1
+                    stack.append((succ, start[succ]))
+                elif state[succ] == 1:
+                    cycle = [stack_node for (stack_node, _) in stack]
+                    return cycle[cycle.index(succ):]
+        return None
+
+    def getReachable(self, sources, reverse=False):
+        """Returns a sorted list of the nodes that can be reached from
+        any of the source nodes, including themselves. If reverse is
+        True, the edges are followed backwards."""
+        if reverse:
+            (start, nodes, _) = self._getIn()
+        else:
+            (start, nodes, _) = self._getOut()
+
+        seen = array.array("b", [0]) * self.num_nodes
+        todo = []
+        for node in sources:
+            self._checkNode(node)
+            if not seen[node]:
+                seen[node] = 1
+                todo.append(node)
+
+        while todo:
+            node = todo.pop()
+            for other_node in nodes[start[node]:start[node + 1]]:
+                if not seen[other_node]:
+                    seen[other_node] = 1
+                    todo.append(other_node)
+
+        return [node for node in xrange(self.num_nodes) if seen[node]]
+
+    def getLongestPath(self, weights=None):
+        """Returns (length, [nodes]) of the path with the biggest total
+        weight, where weights has the weight of each node. By default
+        every node weighs 1, so the path with the most nodes is found.
+        Raises GraphError if the graph has a cycle."""
+        if self.num_nodes == 0:
+            return (0, [])
+        if weights is None:
+            weights = [1] * self.num_nodes
+
+        (start, succs, _) = self._getOut()
+        # The length of the longest path ending at each node,
+        # and the node before it on that path
+        length = [weights[node] for node in xrange(self.num_nodes)]
+        pred = array.array("i", [-1]) * self.num_nodes
+        for node in self.topologicalSort():
+            for succ in succs[start[node]:start[node + 1]]:
+                if length[node] + weights[succ] > length[succ]:
+                    length[succ] = length[node] + weights[succ]
+                    pred[succ] = node
+
+        node = max(xrange(self.num_nodes), key=length.__getitem__)
+        path = []
+        while node != -1:
+            path.append(node)
+            node = pred[node]
+        path.reverse()
+        return (length[path[-1]], path)
+
+    def getTransitiveReduction(self):
+        """Returns a new Graph with the same nodes, without the edges
+        from a to b where b can also be reached from a by a longer
+        path. Raises GraphError if the graph has a cycle. This is
+        O(nodes * edges) in the worst case."""
+        order = self.topologicalSort()
+        position = array.array("i", [0]) * self.num_nodes
+        for (i, node) in enumerate(order):
+            position[node] = i
+
+        (start, succs, labels) = self._getOut()
+        reduced = Graph(self.num_nodes)
+        for node in xrange(self.num_nodes):
+            # A successor is redundant if an earlier one, in
+            # topological order, leads to it
+            node_succs = sorted(set(succs[start[node]:start[node + 1]]),
+                    key=position.__getitem__)
+            reached = set()
+            kept = set()
+            for succ in node_succs:
+                if succ in reached:
+                    continue
+                kept.add(succ)
+                todo = [succ]
+                while todo:
+                    other_node = todo.pop()
+                    for next_node in succs[start[other_node]:
+                            start[other_node + 1]]:
+                        if next_node not in reached:
+                            reached.add(next_node)
+                            todo.append(next_node)
+
+            for pos in xrange(start[node], start[node + 1]):
+                if succs[pos] in kept:
+                    reduced.addEdge(node, succs[pos],
+                            self.labels[labels[pos]])
+        return reduced
@@ -0,0 +1,302 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+The graph of the dependencies between the jobs of a build.
+
+A job depends on:
+
+    * the jobs that wrote the files it read (the "writejob" of each
+      <dep> in its <depList>)
+    * the parent job of its make process; that is, the job that ran
+      the sub-make
+    * the jobs that list it in their <waitingJobs>
+
+Each job is a node, numbered in the order in which it is first seen,
+and is weighted with the total duration of its timings. The per-job
+values are kept in arrays, and the edges in compressed (CSR) form, so
+that builds with hundreds of thousands of jobs can be analyzed; every
+calculation is linear in the number of jobs plus edges.
+
+A forward pass over the jobs, in topological order, gives the earliest
+time each job could have started, and the critical path. A backward
+pass gives the latest time each job could have started without making
+the build longer; the difference is the job's slack.
+"""
+
+import array
+import csv
+
+from pyannolib import annolib
+from tyrannolib import graph
+
+# The parts of each Job that addJob() needs
+JOB_FIELDS = [
+    annolib.JOB_FIELD_TIMING,
+    annolib.JOB_FIELD_DEPS,
+    annolib.JOB_FIELD_WAITING_JOBS,
+]
+
+# The first_invoked and last_completed of a job without timings
+NO_TIME = -1.0
+
+class JobGraphError(Exception):
+    pass
+
+class JobGraph:
+    """Collects the jobs of a build and the dependencies between them,
+    and finds the critical path and the slack of each job."""
+
+    def __init__(self):
+        # The job IDs, by job number, and the job numbers, by ID
+        self.job_ids = []
+        self._job_num = {}
+
+        # One entry per job number
+        self.durations = array.array("d")
+        # The times of the job's first and last timings,
+        # or NO_TIME if it has none
+        self.first_invoked = array.array("d")
+        self.last_completed = array.array("d")
+        # Whether the <job> itself was added, instead of only
+        # being referred to by another job
+        self.seen = array.array("b")
+        # The job names and types, or None for jobs not seen
+        self.names = []
+        self.job_types = []
+
+        # The edges, as pairs of job numbers. A job in
+        # edge_to depends on the job in edge_from.
+        self.edge_from = array.array("i")
+        self.edge_to = array.array("i")
+
+        # Set by finish(); the edges, without duplicates,
+        # in a graph.Graph, and its compressed successor lists
+        self.graph = None
+        self.succ_start = None
+        self.succs = None
+        self.topo_order = None
+
+        # Set by calculateEarliestStarts()
+        self.earliest_start = None
+        self.critical_pred = None
+
+        # Set by calculateLatestStarts()
+        self.latest_start = None
+
+    def getJobNum(self, job_id):
+        """Returns the number of a job, adding it if needed."""
+        job_num = self._job_num.get(job_id)
+        if job_num is None:
+            job_num = self._job_num[job_id] = len(self.job_ids)
+            self.job_ids.append(job_id)
+            self.durations.append(0.0)
+            self.first_invoked.append(NO_TIME)
+            self.last_completed.append(NO_TIME)
+            self.seen.append(0)
+            self.names.append(None)
+            self.job_types.append(None)
+        return job_num
+
+    def getNumJobs(self):
+        return len(self.job_ids)
+
+    def getNumEdges(self):
+        return len(self.edge_from)
+
+    def getBuildTime(self):
+        """Returns the time at which the last job completed
+        in the real build."""
+        if not self.last_completed:
+            return 0.0
+        return max(0.0, max(self.last_completed))
+
+    def addEdge(self, from_job_id, to_job_id):
+        """Record that to_job_id depends on from_job_id."""
+        if from_job_id == to_job_id:
+            return
+        self.edge_from.append(self.getJobNum(from_job_id))
+        self.edge_to.append(self.getJobNum(to_job_id))
+
+    def addJob(self, job):
+        """Add a Job, which needs the fields in JOB_FIELDS, and the
+        edges to the jobs it depends on, and that depend on it."""
+        job_id = job.getID()
+        job_num = self.getJobNum(job_id)
+        self.seen[job_num] = 1
+        self.names[job_num] = job.getName()
+        self.job_types[job_num] = job.getType()
+        self.durations[job_num] = job.getAgentTime()
+
+        first_invoked = job.getFirstInvoked()
+        if first_invoked is not None:
+            self.first_invoked[job_num] = first_invoked
+        last_completed = job.getLastCompleted()
+        if last_completed is not None:
+            self.last_completed[job_num] = last_completed
+
+        for dep in job.getDependencies():
+            write_job_id = dep.getWriteJob()
+            if write_job_id:
+                self.addEdge(write_job_id, job_id)
+
+        parent_job_id = job.getMakeProcess().getParentJobID()
+        if parent_job_id:
+            self.addEdge(parent_job_id, job_id)
+
+        for waiting_job_id in job.getWaitingJobs():
+            self.addEdge(job_id, waiting_job_id)
+
+    def finish(self):
+        """Build the compressed successor lists, and the topological
+        order of the jobs. Call this after all the jobs are added."""
+        self.graph = graph.Graph.fromEdges(len(self.job_ids),
+                self.edge_from, self.edge_to)
+        (self.succ_start, self.succs) = self.graph.getSuccessorArrays()
+
+        try:
+            self.topo_order = self.graph.topologicalSort()
+        except graph.GraphError:
+            cycle_ids = [self.job_ids[job_num]
+                    for job_num in self.graph.findCycle()]
+            msg = "The job dependencies have a cycle: %s" % \
+                    (" ".join(cycle_ids[:10]),)
+            raise JobGraphError(msg)
+
+    def getSuccessors(self, job_num):
+        """Returns the numbers of the jobs that depend on job_num."""
+        return self.graph.getSuccessors(job_num)
+
+    def calculateEarliestStarts(self):
+        """Calculate the earliest time each job could have started,
+        if every job started as soon as the jobs it depends on
+        finished. The times are relative to the start of the first
+        jobs. critical_pred has the job that determined each job's
+        earliest start, or -1."""
+        num_jobs = len(self.job_ids)
+        earliest_start = array.array("d", [0.0]) * num_jobs
+        critical_pred = array.array("i", [-1]) * num_jobs
+
+        succ_start = self.succ_start
+        succs = self.succs
+        durations = self.durations
+        for job_num in self.topo_order:
+            finish = earliest_start[job_num] + durations[job_num]
+            for to_num in succs[succ_start[job_num]:succ_start[job_num + 1]]:
+                if finish > earliest_start[to_num] or \
+                        critical_pred[to_num] == -1:
+                    earliest_start[to_num] = finish
+                    critical_pred[to_num] = job_num
+
+        self.earliest_start = earliest_start
+        self.critical_pred = critical_pred
+
+    def getCriticalPath(self):
+        """Returns the job numbers along the longest path through
+        the graph, weighted by the jobs' durations, in order."""
+        if self.earliest_start is None:
+            self.calculateEarliestStarts()
+
+        if not self.job_ids:
+            return []
+
+        earliest_start = self.earliest_start
+        durations = self.durations
+        last_num = max(xrange(len(self.job_ids)),
+                key=lambda i: earliest_start[i] + durations[i])
+
+        path = []
+        job_num = last_num
+        while job_num != -1:
+            path.append(job_num)
+            job_num = self.critical_pred[job_num]
+        path.reverse()
+        return path
+
+    def getPathLength(self, path):
+        """Returns the length of a path, which is the earliest time at
+        which its last job could have finished."""
+        if not path:
+            return 0.0
+        if self.earliest_start is None:
+            self.calculateEarliestStarts()
+        return self.earliest_start[path[-1]] + self.durations[path[-1]]
+
+    def getEndTime(self):
+        """Returns the earliest time at which all the jobs could
+        have finished; that is, the length of the critical path."""
+        return self.getPathLength(self.getCriticalPath())
+
+    def calculateLatestStarts(self):
+        """Calculate the latest time each job could have started
+        without delaying the end of the build, if every job started
+        as soon as the jobs it depends on finished."""
+        end_time = self.getEndTime()
+        num_jobs = len(self.job_ids)
+        latest_start = array.array("d", [0.0]) * num_jobs
+
+        succ_start = self.succ_start
+        succs = self.succs
+        durations = self.durations
+        for job_num in reversed(self.topo_order):
+            latest_finish = end_time
+            for to_num in succs[succ_start[job_num]:succ_start[job_num + 1]]:
+                if latest_start[to_num] < latest_finish:
+                    latest_finish = latest_start[to_num]
+            # Don't let rounding make it negative
+            latest_start[job_num] = max(0.0,
+                    latest_finish - durations[job_num])
+
+        self.latest_start = latest_start
+
+    def getSlack(self, job_num):
+        """Returns how long a job could have been delayed without
+        delaying the end of the build."""
+        if self.latest_start is None:
+            self.calculateLatestStarts()
+        return max(0.0, self.latest_start[job_num] -
+                self.earliest_start[job_num])
+
+    def getPriorities(self, job_types=None):
+        """Returns the numbers of the jobs that were seen, of the given
+        types (or all types), most urgent first: by slack, then by
+        latest start."""
+        if self.latest_start is None:
+            self.calculateLatestStarts()
+
+        job_nums = [job_num for job_num in xrange(len(self.job_ids))
+                if self.seen[job_num] and (job_types is None or
+                    self.job_types[job_num] in job_types)]
+        latest_start = self.latest_start
+        job_nums.sort(key=lambda job_num: (self.getSlack(job_num),
+            latest_start[job_num]))
+        return job_nums
+
+    def writePriorities(self, fh, job_types=None):
+        """Write a CSV file of the targets, most urgent first. A target
+        that was built by several jobs is listed once, with its most
+        urgent job. Returns the number of targets written."""
+        writer = csv.writer(fh)
+        writer.writerow(["rank", "target", "slack", "earliest_start",
+            "latest_start", "duration", "job_id"])
+
+        names_seen = set()
+        for job_num in self.getPriorities(job_types):
+            name = self.names[job_num]
+            if name is None or name in names_seen:
+                continue
+            names_seen.add(name)
+            writer.writerow([len(names_seen), name,
+                "%.3f" % (self.getSlack(job_num),),
+                "%.3f" % (self.earliest_start[job_num],),
+                "%.3f" % (self.latest_start[job_num],),
+                "%.3f" % (self.durations[job_num],),
+                self.job_ids[job_num]])
+        return len(names_seen)
+
+
+def build_graph(build, workers=None):
+    """Read the jobs of an AnnotatedBuild into a new JobGraph."""
+    job_graph = JobGraph()
+    for job in build.iterJobs(workers, fields=JOB_FIELDS):
+        job_graph.addJob(job)
+    job_graph.finish()
+    return job_graph
@@ -0,0 +1,120 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+Measure how long each job waited between becoming ready and being
+started on an agent.
+
+A job is ready when the last of the jobs it depends on has completed:
+the writejob of each of its <dep>s, and the parent job of its make
+process. Those jobs come earlier in the annotation file, so the jobs
+can be read one at a time from iterJobs(); only the completion time
+of each job is kept, in an array, instead of the Job objects.
+"""
+
+import array
+import heapq
+
+from pyannolib import annolib
+
+# The parts of each Job that addJob() needs
+JOB_FIELDS = [
+    annolib.JOB_FIELD_TIMING,
+    annolib.JOB_FIELD_DEPS,
+]
+
+DEFAULT_NUM_WORST = 20
+
+def get_percentile(sorted_values, pct):
+    """Returns the value below which pct percent of the values fall,
+    given a sorted sequence, or 0.0 if it is empty."""
+    if not sorted_values:
+        return 0.0
+    i = int(len(sorted_values) * pct / 100.0)
+    return sorted_values[min(i, len(sorted_values) - 1)]
+
+class DispatchLatency:
+    """Collects the dispatch latency of each job, by agent node and by
+    job type, and the jobs with the worst latencies."""
+
+    def __init__(self, num_worst=DEFAULT_NUM_WORST):
+        # The completion time of each job, by the number
+        # in job_nums
+        self.job_nums = {}
+        self.completed = array.array("d")
+
+        # Key = node or job type, Value = array of latencies
+        self.by_node = {}
+        self.by_type = {}
+
+        # A heap of (latency, job ID, job type, node, job name)
+        # of the worst jobs
+        self.num_worst = num_worst
+        self.worst = []
+
+        # Jobs that started before the jobs they depend on completed;
+        # this happens when emake runs a job before it knows about
+        # a dependency, and reruns it later.
+        self.num_early = 0
+
+    def getNumJobs(self):
+        """Returns the number of jobs whose latency is known."""
+        return sum([len(latencies) for latencies in self.by_node.values()])
+
+    def getReadyTime(self, job):
+        """Returns the time at which the last job that the Job depends
+        on completed, or None if it depends on no earlier job."""
+        ready = None
+        dep_job_ids = [dep.getWriteJob() for dep in job.getDependencies()]
+        if job.getMakeProcess():
+            dep_job_ids.append(job.getMakeProcess().getParentJobID())
+        for dep_job_id in dep_job_ids:
+            job_num = self.job_nums.get(dep_job_id)
+            if job_num is None:
+                continue
+            if ready is None or self.completed[job_num] > ready:
+                ready = self.completed[job_num]
+        return ready
+
+    def addJob(self, job):
+        """Add a Job, which needs the fields in JOB_FIELDS. The jobs
+        must be added in the order in which they are in the file."""
+        timings = job.getTimings()
+        if job.getFirstInvoked() is None or job.getLastCompleted() is None:
+            return
+
+        ready = self.getReadyTime(job)
+        self.job_nums[job.getID()] = len(self.completed)
+        self.completed.append(job.getLastCompleted())
+
+        if ready is None:
+            return
+
+        latency = job.getFirstInvoked() - ready
+        if latency < 0:
+            self.num_early += 1
+            return
+
+        node = timings[0].getNode()
+        self.by_node.setdefault(node, array.array("d")).append(latency)
+        self.by_type.setdefault(job.getType(),
+                array.array("d")).append(latency)
+
+        record = (latency, job.getID(), job.getType(), node, job.getName())
+        if len(self.worst) < self.num_worst:
+            heapq.heappush(self.worst, record)
+        elif self.num_worst > 0 and latency > self.worst[0][0]:
+            heapq.heapreplace(self.worst, record)
+
+    def getWorst(self):
+        """Returns the (latency, job ID, job type, node, job name)
+        of the jobs with the worst latencies, worst first."""
+        return sorted(self.worst, reverse=True)
+
+    def getSummary(self, latencies):
+        """Returns (count, mean, median, 90th percentile, maximum)
+        of an array of latencies."""
+        if not latencies:
+            return (0, 0.0, 0.0, 0.0, 0.0)
+        values = sorted(latencies)
+        return (len(values), sum(values) / len(values),
+                get_percentile(values, 50), get_percentile(values, 90),
+                values[-1])
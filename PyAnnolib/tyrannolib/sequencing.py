@@ -15,7 +15,47 @@ NUM_DECIMAL_PLACES = 4
 class SequencingError(Exception):
     pass
 
-class Agent:
+def calculate_steps(invoked, completed):
+    """Given the invoked and completed times of some intervals, as two
+    lists, return the number of intervals that overlap, over time, as a
+    step function. This is a list of (time, N) tuples, in time order;
+    N intervals were open from that time until the time of the next
+    tuple. The last tuple has N = 0. The lists are sorted in place."""
+    # Each interval adds 1 to the concurrency at its invoked time,
+    # and takes 1 away at its completed time. Sorting the two kinds
+    # of event separately lets us sweep across them both at once.
+    invoked.sort()
+    completed.sort()
+
+    steps = []
+    N = 0
+    num_frags = len(invoked)
+    i_invoked = 0
+    i_completed = 0
+    while i_completed < num_frags:
+        if i_invoked < num_frags:
+            time = min(invoked[i_invoked], completed[i_completed])
+        else:
+            time = completed[i_completed]
+
+        # Apply all the events at this time before
+        # recording the new concurrency
+        while i_invoked < num_frags and invoked[i_invoked] == time:
+            N += 1
+            i_invoked += 1
+        while i_completed < num_frags and \
+                completed[i_completed] == time:
+            N -= 1
+            i_completed += 1
+
+        # An interval with no duration doesn't change anything
+        if not steps or steps[-1][1] != N:
+            steps.append((time, N))
+
+    return steps
+
+
+class Agent(object):
     """Represents one agent, which can only run one job at a time.
     Thus, an agent is also a single timeline along which jobs run serially.
     """
@@ -24,27 +64,38 @@ class Agent:
         # A time fragment is a tuple of (start, end), or in
         # Electric Accelerator parlance, (invoked, completed)
         #
-        # This is sorted in descending order by end time.
-        self.fragments = []
+        # New fragments are appended in any order; the list is
+        # sorted, in descending order by end time, when it is asked for.
+        self._fragments = []
+        self._sorted = True
 
-        # The start of our first fragment, and end of our last fragment,
-        # for error checking.
-        self.absolute_invoked = None
-        self.absolute_completed = None
+    def getFragments(self):
+        """Return the fragments, sorted in descending order by
+        end time."""
+        if not self._sorted:
+            self._fragments.sort(reverse=True)
+            self._sorted = True
+        return self._fragments
+
+    def setFragments(self, fragments):
+        self._fragments = fragments
+        self._sorted = False
+
+    fragments = property(getFragments, setFragments)
 
     def pop(self):
-        if len(self.fragments) >= 1:
-            frag = self.fragments[0]
-            del self.fragments[0]
+        """Remove and return the latest fragment, or None."""
+        fragments = self.getFragments()
+        if len(fragments) >= 1:
+            frag = fragments[0]
+            del fragments[0]
             return frag
         else:
             return None
 
     def addTiming(self, timing):
         """Add a new timing object's time fragment to our list."""
-        invoked = float(timing.getInvoked())
-        completed = float(timing.getCompleted())
-        self.addTimingTuple(invoked, completed)
+        self.addTimingTuple(timing.getInvoked(), timing.getCompleted())
 
     def addTimingTuple(self, invoked, completed):
         """Add a new fragment to our list."""
@@ -61,135 +112,35 @@ class Agent:
         new_frag = (round(completed, NUM_DECIMAL_PLACES),
                 round(invoked, NUM_DECIMAL_PLACES))
 
-        # Are we empty?
-        if len(self.fragments) == 0:
-            self.fragments.append(new_frag)
-
-        # Does the fragment come after the last fragment completed??
-        elif invoked > self.fragments[0][COMPLETED]:
-            self.fragments.insert(0, new_frag)
-
-        # No? Does the fragement start inside the last fragment?
-        elif invoked > self.fragments[0][INVOKED]:
-            self.fragments.insert(0, new_frag)
-
-        # Does the fragment come before all other fragments?
-        elif invoked < self.fragments[-1][INVOKED]:
-            self.fragments.append(new_frag)
-
-        # Find the gap where we can insert the fragment. Because some
-        # jobs can overlap, there may not be a gap where we can place it.
-        # Be make our best effort; we will deal with merging the fragments
-        # later. 
-        else:
-            # Find the fragments surrounding this fragment's start time
-            prev_frag = None
-            for i, next_frag in enumerate(self.fragments):
-                # Skip the first fragment; we already checked that boundary
-                if i == 0:
-                    prev_frag = next_frag
-                    continue
-
-                #prev_completed = prev_frag[COMPLETED]
-                prev_invoked = prev_frag[INVOKED]
-                next_completed = next_frag[COMPLETED]
-                next_invoked = next_frag[INVOKED]
-
-                # Did the fragment start in this middle of this frag?
-                if next_completed >= invoked >= next_invoked:
-        
-                    # Did it end inside the next frag (this frag
-                    # would be a 'subset' of next_frag)? if so,
-                    # we can just drop this frag, since next_frag
-                    # accounts for its time
-                    if next_completed >= completed:
-                        break
-                    else:
-                        # This frag finished elsewhere; perhaps in a gap,
-                        # or in the middle of another frag. Just place
-                        # it in the list for now.
-                        self.fragments.insert(i, new_frag)
-                        break
-
-                # Did the fragment start in the gap between the
-                # previous frag and this next one?
-                elif prev_invoked >= invoked >= next_completed:
-                    # Just insert the frag; it doesn't matter if
-                    # it ends in the gap, or if it ends in another
-                    # gap, or in the middle of another fragment.
-                    # We'll clean that up later.
-                    self.fragments.insert(i, new_frag)
-                    break
-
-                # We haven't found a place yet; keep iterating
-                prev_frag = next_frag
-            else:
-                # We couldn't find any place to put it.
-                # Our algorithm should never fail like this!
-                msg = "Could not place fragment %s in %s" % \
-                        (new_frag, self.fragments)
-                raise SequencingError(msg)
-
-        # After we insert the fragment, adjust our boundary times
-        self.absolute_start = self.fragments[-1][INVOKED]
-        self.absolute_end = self.fragments[0][COMPLETED]
+        # Overlaps are dealt with in mergeOverlaps()
+        self._fragments.append(new_frag)
+        self._sorted = False
 
     def mergeOverlaps(self):
-        # We start with a mostly-ordered set of time-fragment
-        # tuples, except of the fact that neighbors can overlap
-        # each other.
-        #
-        # Look at each node; if it overlaps with its neighbor
-        # to the right, merge the two, and keep comparing.
-        len_fragments = len(self.fragments)
-
+        """Merge the fragments which overlap, or touch, each other,
+        so that the agent's timeline has no overlaps."""
         # One or no fragments? Nothing to merge! Return now.
-        if len_fragments < 2:
+        if len(self._fragments) < 2:
             return
 
-        def overlaps(a, b):
-            return b[COMPLETED] >= a[INVOKED]
-
-        def merge(a, b):
-            return (max(a[COMPLETED], b[COMPLETED]),
-                    min(a[INVOKED], b[INVOKED]))
-
-        i_examining = 0
-        while i_examining < len_fragments - 1:
-            this_frag = self.fragments[i_examining]
-
-            i_comparison = i_examining + 1
-            next_frag = self.fragments[i_comparison]
-
-            # If there is no overlap, we can forget about this one.
-            if not overlaps(this_frag, next_frag):
-                i_examining += 1
-                continue
-
-            # There is an overlap; merge them
-            new_frag = merge(this_frag, next_frag)
-
-            # Delete this frag
-            del self.fragments[i_examining]
-
-            # Delete the next frag
-            del self.fragments[i_examining]
-
-            # Insertthe new frag
-            self.fragments.insert(i_examining, new_frag)
-
-            # Reduce the total length by 1
-            len_fragments -= 1
-
-            # Don't increment i_examining because we want
-            # compare this newly merged fragment with its
-            # new neighbor
-            # I don't need this 'continue' here, but it's 
-            # so far down from the 'while' that it's a nice
-            # visual reminder that I'm iterating
-            continue
-
+        # Walk the fragments in order of their start times; each
+        # one either extends the merged fragment we are building,
+        # or starts a new one.
+        by_invoked = sorted([(frag[INVOKED], frag[COMPLETED])
+            for frag in self._fragments])
+        merged = []
+        (this_invoked, this_completed) = by_invoked[0]
+        for (invoked, completed) in by_invoked:
+            if invoked <= this_completed:
+                this_completed = max(this_completed, completed)
+            else:
+                merged.append((this_completed, this_invoked))
+                (this_invoked, this_completed) = (invoked, completed)
+        merged.append((this_completed, this_invoked))
 
+        merged.reverse()
+        self._fragments = merged
+        self._sorted = True
 
 
 class Cluster:
@@ -232,121 +183,39 @@ class Cluster:
             end = max(end, latest_frag[COMPLETED])
         return end
 
+    def calculateSteps(self):
+        """Return the number of agents running concurrently, over
+        time, as a step function. This is a list of (time, N)
+        tuples, in time order; N agents were running from that time
+        until the time of the next tuple. The last tuple has N = 0,
+        at the time the last agent finished."""
+        self.mergeOverlaps()
+
+        invoked = []
+        completed = []
+        for agent in self.agents.values():
+            for frag in agent.fragments:
+                invoked.append(frag[INVOKED])
+                completed.append(frag[COMPLETED])
+
+        return calculate_steps(invoked, completed)
+
     def calculateHistogram(self):
         # This is the histogram data we want.
         # Each key is the number of agents running concurrently,
         # and each value is the total time spent running at that
-        # "concurrency"
+        # "concurrency". Gaps in which no agent was running are
+        # not counted.
         # Key = N, Value = Total Time
         #
         self.concurrency = {}
 
-        # This magic dictionary will hold the latest single
-        # time fragement from each agent. It allows us to scan
-        # across all agents. If we pop a fragment from an agent
-        # but there are no more fragments, we remove the agent name
-        # from the dictionary.
-        #
-        # Key = agent name, Value = Time Frag (COMPLETED, INVOKED)
-        self.frag_pops = {}
-
-        def pop_agent_frag(name):
-            frag = self.agents[name].pop()
-            if frag == None:
-                del self.frag_pops[name]
-            else:
-                self.frag_pops[name] = frag
-
-        # Initialize!
-        for name, agent in self.agents.items():
-            frag = agent.pop()
-            if frag:
-                self.frag_pops[name] = frag
-
-        def chop(time_slice_start, time_slice_end, frag):
-            """See if a frag can be chopped into two pieces,
-            if it overlaps with the time slice. Returns:
-                (overlap_boolean, new_frag)
-
-            If there is any overlap, overlap_boolean is True,
-            otherwise False.
-
-            If it overlaps completely, new_frag is None.
-
-            If the old frag was chopped, the new, smaller
-            frag is returned as new_frag.
-            """
-
-            # Is the time slice the same as this frag?
-            if time_slice_start == frag[INVOKED] and \
-                    time_slice_end == frag[COMPLETED]:
-                return True, None
-
-            # Do they overlap? XXX check this logic
-            if time_slice_end >= frag[COMPLETED] > time_slice_start >= frag[INVOKED]:
-                new_frag = (time_slice_start, frag[INVOKED])
-
-                return True, new_frag
-
-            # No overlap.
-            return False, None
-
-        # Run our algorithm until there are no more fragments
-        # to analyze
-        tot_time = 0.0
-
-        minimum_slice_duration = pow(0.1, NUM_DECIMAL_PLACES)
-
-        while self.frag_pops:
-            # Look at all the frags and find the latest one
-            # to complete, and the latest in invoked.
-            # If some frags have times that match exactly
-            # (either invoked or started), just pick one arbitrarily.
-            latest_completed_frag = (-1.0, -1.0)
-            latest_invoked_frag = (-1.0, -1.0)
-
-            for name, frag in self.frag_pops.items():
-                if frag[COMPLETED] > latest_completed_frag[COMPLETED]:
-                    latest_completed_frag = frag
-
-                if frag[INVOKED] > latest_invoked_frag[INVOKED]:
-                    latest_invoked_frag = frag
-
-            # We now have the latest time slice we want to chop off
-            # from the end of all agents, where possible.
-            time_slice_end = latest_completed_frag[COMPLETED]
-            time_slice_start = latest_invoked_frag[INVOKED]
-            slice_duration = time_slice_end - time_slice_start + \
-                    minimum_slice_duration
-
-            N = 0
-            tot_time += slice_duration
-
-            for name, frag in self.frag_pops.items():
-                overlapped, smaller_frag = chop(time_slice_start,
-                        time_slice_end, frag)
-
-                if overlapped:
-                    N += 1
-                    if smaller_frag == None:
-                        # We exhausted this agent's frag; pop a new one.
-                        # (possible deleting the agent from the
-                        # frag_pops hash, if its frags are depleted)
-                        pop_agent_frag(name)
-                    else:
-                        # Replace the fag
-                        self.frag_pops[name] = smaller_frag
-
-            # Add to the bin
-            if self.concurrency.has_key(N):
-                self.concurrency[N] += slice_duration
-            else:
-                self.concurrency[N] = slice_duration
-
-            # I don't need this 'continue', but it's a nice
-            # visual reminder
-            continue
-
+        steps = self.calculateSteps()
+        for (i, (time, N)) in enumerate(steps[:-1]):
+            if N == 0:
+                continue
+            duration = steps[i + 1][0] - time
+            self.concurrency[N] = self.concurrency.get(N, 0.0) + duration
 
         return self.concurrency
 
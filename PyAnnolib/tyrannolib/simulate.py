@@ -0,0 +1,136 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+Predict how long a build would take with a different number of agents.
+
+The jobs in a JobGraph are replayed through a list scheduler: whenever
+an agent is free, it is given the most urgent job whose dependencies
+have all finished, and the job takes as long as it did in the real
+build. The ready jobs are kept in a heap ordered by a priority policy,
+and the running jobs in a heap ordered by their completion times, so
+each job costs a few heap operations.
+"""
+
+import heapq
+
+from tyrannolib import sequencing
+
+POLICY_FIFO = "fifo"
+POLICY_LONGEST_PATH = "longest-path"
+POLICY_LARGEST_DURATION = "largest-duration"
+
+class SimulationError(Exception):
+    pass
+
+def fifo_priorities(graph):
+    """The jobs run in the order in which they are in the build."""
+    return range(graph.getNumJobs())
+
+def longest_path_priorities(graph):
+    """The jobs with the longest chain of jobs after them, including
+    themselves, run first. That is the same as the earliest latest
+    start."""
+    if graph.latest_start is None:
+        graph.calculateLatestStarts()
+    return graph.latest_start
+
+def largest_duration_priorities(graph):
+    """The longest jobs run first."""
+    return [-duration for duration in graph.durations]
+
+# Key = policy name, Value = function which returns a list of the
+# jobs' priorities from a JobGraph; lower values run first
+POLICIES = {
+    POLICY_FIFO : fifo_priorities,
+    POLICY_LONGEST_PATH : longest_path_priorities,
+    POLICY_LARGEST_DURATION : largest_duration_priorities,
+}
+
+class Simulation:
+    """The result of replaying a JobGraph on some number of agents."""
+
+    def __init__(self, graph, num_agents, policy=POLICY_FIFO,
+            record=False):
+        if num_agents < 1:
+            msg = "The number of agents must be positive: %s" % \
+                    (num_agents,)
+            raise SimulationError(msg)
+
+        priority_func = POLICIES.get(policy)
+        if priority_func is None:
+            msg = "Unknown policy %s; use one of %s" % (policy,
+                    ", ".join(sorted(POLICIES.keys())))
+            raise SimulationError(msg)
+
+        self.num_agents = num_agents
+        self.policy = policy
+
+        # The total time that the agents were running jobs
+        self.busy_time = sum(graph.durations)
+
+        # If record is True, a sequencing.Cluster with the
+        # simulated timings, one agent per simulated agent
+        self.cluster = None
+        if record:
+            self.cluster = sequencing.Cluster()
+
+        self.makespan = self._run(graph, priority_func(graph))
+
+    def _run(self, graph, priorities):
+        """Replay the jobs, and return the time the last one finished."""
+        succ_start = graph.succ_start
+        succs = graph.succs
+        durations = graph.durations
+
+        num_preds = [0] * graph.getNumJobs()
+        for to_num in succs:
+            num_preds[to_num] += 1
+
+        # (priority, job number) of the jobs that can run
+        ready = [(priorities[job_num], job_num)
+                for job_num in xrange(graph.getNumJobs())
+                if num_preds[job_num] == 0]
+        heapq.heapify(ready)
+
+        # (completion time, job number, agent number) of the running jobs
+        running = []
+        free_agents = range(self.num_agents - 1, -1, -1)
+        now = 0.0
+
+        while ready or running:
+            while ready and free_agents:
+                (_, job_num) = heapq.heappop(ready)
+                agent_num = free_agents.pop()
+                completed = now + durations[job_num]
+                heapq.heappush(running, (completed, job_num, agent_num))
+                if self.cluster is not None:
+                    self._recordTiming(agent_num, now, completed)
+
+            # Finish all the jobs that end at the next completion time
+            now = running[0][0]
+            while running and running[0][0] == now:
+                (_, job_num, agent_num) = heapq.heappop(running)
+                free_agents.append(agent_num)
+                for to_num in succs[succ_start[job_num]:
+                        succ_start[job_num + 1]]:
+                    num_preds[to_num] -= 1
+                    if num_preds[to_num] == 0:
+                        heapq.heappush(ready, (priorities[to_num], to_num))
+
+        return now
+
+    def _recordTiming(self, agent_num, invoked, completed):
+        agent = self.cluster.agents.get(agent_num)
+        if agent is None:
+            agent = self.cluster.agents[agent_num] = sequencing.Agent()
+        agent.addTimingTuple(invoked, completed)
+
+    def getMakespan(self):
+        """Returns the time at which the last job finished."""
+        return self.makespan
+
+    def getUtilization(self):
+        """Returns the fraction of the agents' time that was spent
+        running jobs."""
+        if self.makespan == 0:
+            return 0.0
+        return self.busy_time / (self.num_agents * self.makespan)
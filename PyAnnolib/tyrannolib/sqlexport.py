@@ -0,0 +1,333 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+Load an annotated build into an SQLite database, so that ad-hoc
+questions can be answered with SQL instead of another script.
+
+The jobs are read with iterJobs(), and the rows are inserted in
+batches with executemany(), so memory use stays bounded no matter how
+big the annotation file is. Everything is loaded in one transaction,
+and the indexes are created after the data is loaded, which is much
+faster than updating them row by row.
+
+The tables are listed in SCHEMA. Every table that holds a job's child
+records has a job_id column, so it can be joined with the jobs table.
+Times are stored as REAL seconds from the start of the build; in the
+jobs table, "invoked" and "completed" are those of the job's first
+and last timing, and "duration" is the sum of all its timings.
+"""
+
+import os
+import sqlite3
+
+from pyannolib import annolib
+
+# The number of rows collected before they are inserted
+BATCH_SIZE = 10000
+
+SCHEMA = [
+    """CREATE TABLE metrics (
+        name TEXT,
+        value TEXT)""",
+
+    """CREATE TABLE properties (
+        name TEXT,
+        value TEXT)""",
+
+    """CREATE TABLE makes (
+        make_id TEXT PRIMARY KEY,
+        parent_job_id TEXT,
+        level INTEGER,
+        cmd TEXT,
+        cwd TEXT,
+        owd TEXT,
+        mode TEXT)""",
+
+    """CREATE TABLE jobs (
+        job_num INTEGER PRIMARY KEY,
+        job_id TEXT,
+        make_id TEXT,
+        type TEXT,
+        status TEXT,
+        name TEXT,
+        thread TEXT,
+        needed_by TEXT,
+        file TEXT,
+        line TEXT,
+        partof TEXT,
+        retval INTEGER,
+        node TEXT,
+        invoked REAL,
+        completed REAL,
+        duration REAL)""",
+
+    """CREATE TABLE timings (
+        job_id TEXT,
+        invoked REAL,
+        completed REAL,
+        node TEXT)""",
+
+    """CREATE TABLE ops (
+        job_id TEXT,
+        type TEXT,
+        file TEXT,
+        filetype TEXT,
+        found INTEGER,
+        isdir INTEGER)""",
+
+    """CREATE TABLE deps (
+        job_id TEXT,
+        write_job TEXT,
+        file TEXT,
+        type TEXT)""",
+
+    """CREATE TABLE conflicts (
+        job_id TEXT,
+        type TEXT,
+        write_job TEXT,
+        file TEXT,
+        rerun_by TEXT)""",
+
+    """CREATE TABLE commands (
+        job_id TEXT,
+        line TEXT,
+        argv TEXT)""",
+
+    """CREATE TABLE messages (
+        thread TEXT,
+        time REAL,
+        severity TEXT,
+        code TEXT,
+        text TEXT)""",
+]
+
+# Created after the data is loaded
+INDEXES = [
+    "CREATE INDEX jobs_job_id ON jobs (job_id)",
+    "CREATE INDEX jobs_make_id ON jobs (make_id)",
+    "CREATE INDEX jobs_type ON jobs (type)",
+    "CREATE INDEX timings_job_id ON timings (job_id)",
+    "CREATE INDEX ops_job_id ON ops (job_id)",
+    "CREATE INDEX ops_file ON ops (file)",
+    "CREATE INDEX deps_job_id ON deps (job_id)",
+    "CREATE INDEX deps_file ON deps (file)",
+    "CREATE INDEX conflicts_job_id ON conflicts (job_id)",
+    "CREATE INDEX conflicts_file ON conflicts (file)",
+    "CREATE INDEX commands_job_id ON commands (job_id)",
+]
+
+# The parts of each Job that are loaded
+JOB_FIELDS = [
+    annolib.JOB_FIELD_TIMING,
+    annolib.JOB_FIELD_OPS,
+    annolib.JOB_FIELD_DEPS,
+    annolib.JOB_FIELD_CONFLICT,
+    annolib.JOB_FIELD_COMMANDS,
+]
+
+# The number of columns in each table, for the INSERT statements
+NUM_COLUMNS = {
+    "metrics" : 2,
+    "properties" : 2,
+    "makes" : 7,
+    "jobs" : 16,
+    "timings" : 4,
+    "ops" : 6,
+    "deps" : 4,
+    "conflicts" : 5,
+    "commands" : 3,
+    "messages" : 5,
+}
+
+
+class SQLExportError(Exception):
+    pass
+
+
+def _float(text):
+    if text is None:
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+def _int(text):
+    if text is None:
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        return None
+
+
+class Loader:
+    """Collects rows for each table, and inserts them in batches."""
+
+    def __init__(self, conn, batch_size=BATCH_SIZE):
+        self.conn = conn
+        self.batch_size = batch_size
+
+        # Key = table name, Value = list of row tuples
+        self.rows = dict([(table, []) for table in NUM_COLUMNS])
+
+    def add(self, table, row):
+        rows = self.rows[table]
+        rows.append(row)
+        if len(rows) >= self.batch_size:
+            self.flush(table)
+
+    def flush(self, table):
+        rows = self.rows[table]
+        if rows:
+            sql = "INSERT INTO %s VALUES (%s)" % (table,
+                    ",".join(["?"] * NUM_COLUMNS[table]))
+            self.conn.executemany(sql, rows)
+            del rows[:]
+
+    def flushAll(self):
+        for table in self.rows:
+            self.flush(table)
+
+    def addJob(self, job_num, job):
+        job_id = job.getID()
+
+        make = job.getMakeProcess()
+        if make:
+            make_id = make.getID()
+        else:
+            make_id = None
+
+        invoked = completed = node = None
+        duration = 0.0
+        for timing in job.getTimings():
+            t_invoked = timing.getInvoked()
+            t_completed = timing.getCompleted()
+            self.add("timings", (job_id, t_invoked, t_completed,
+                timing.getNode()))
+
+            if invoked is None:
+                invoked = t_invoked
+                node = timing.getNode()
+            completed = t_completed
+            if t_invoked is not None and t_completed is not None:
+                duration += t_completed - t_invoked
+
+        self.add("jobs", (job_num, job_id, make_id, job.getType(),
+            job.getStatus(), job.getName(), job.getThread(),
+            job.getNeededBy(), job.getFile(), job.getLine(),
+            job.getPartOf(), job.getRetval(), node, invoked, completed,
+            duration))
+
+        for op in job.getOperations():
+            self.add("ops", (job_id, op.getType(), op.getFile(),
+                op.getFileType(), _int(op.getFound()),
+                _int(op.getIsDir())))
+
+        for dep in job.getDependencies():
+            self.add("deps", (job_id, dep.getWriteJob(), dep.getFile(),
+                dep.getType()))
+
+        conflict = job.getConflict()
+        if conflict:
+            self.add("conflicts", (job_id, conflict.getType(),
+                conflict.getWriteJob(), conflict.getFile(),
+                conflict.getRerunBy()))
+
+        for command in job.getCommands():
+            self.add("commands", (job_id, command.getLine(),
+                command.getArgv()))
+
+
+def export(build, db_filename, workers=None, batch_size=BATCH_SIZE):
+    """Load the AnnotatedBuild into a new SQLite database. If the
+    database file exists, it is replaced. Returns the number of jobs.
+    Can raise PyAnnolibError or SQLExportError."""
+    if os.path.exists(db_filename):
+        try:
+            os.remove(db_filename)
+        except OSError as e:
+            raise SQLExportError(e)
+
+    try:
+        conn = sqlite3.connect(db_filename)
+    except sqlite3.Error as e:
+        raise SQLExportError("%s: %s" % (db_filename, e))
+
+    try:
+        # This is a bulk load of a new database; if it fails, the
+        # database is useless anyway, so don't pay for a journal.
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+
+        for sql in SCHEMA:
+            conn.execute(sql)
+
+        loader = Loader(conn, batch_size)
+
+        num_jobs = 0
+        for job in build.iterJobs(workers, JOB_FIELDS):
+            loader.addJob(num_jobs, job)
+            num_jobs += 1
+
+        for make_id, make in sorted(build.make_procs.items()):
+            loader.add("makes", (make_id, make.getParentJobID(),
+                _int(make.getLevel()), make.getCmd(), make.getCWD(),
+                make.getOWD(), make.getMode()))
+
+        for msg in build.getMessages():
+            loader.add("messages", (msg.getThread(), _float(msg.getTime()),
+                msg.getSeverity(), msg.getCode(), msg.getText()))
+
+        # The metrics are known after iterJobs(), even for
+        # gzip'ed annotation files
+        for name, value in sorted(build.getMetrics().items()):
+            loader.add("metrics", (name, value))
+
+        for name, value in sorted(build.getProperties().items()):
+            loader.add("properties", (name, value))
+
+        loader.flushAll()
+
+        for sql in INDEXES:
+            conn.execute(sql)
+
+        conn.commit()
+
+    except sqlite3.Error as e:
+        raise SQLExportError("%s: %s" % (db_filename, e))
+
+    finally:
+        conn.close()
+
+    return num_jobs
+
+
+def query(db_filename, sql, params=()):
+    """Run an SQL statement against the database. Returns the
+    list of column names, and an iterator over the rows.
+    Can raise SQLExportError."""
+    if not os.path.exists(db_filename):
+        raise SQLExportError("%s: no such database" % (db_filename,))
+
+    try:
+        conn = sqlite3.connect(db_filename)
+        cursor = conn.execute(sql, params)
+    except sqlite3.Error as e:
+        raise SQLExportError(e)
+
+    if cursor.description:
+        columns = [desc[0] for desc in cursor.description]
+    else:
+        columns = []
+
+    return columns, _iter_rows(conn, cursor)
+
+
+def _iter_rows(conn, cursor):
+    try:
+        for row in cursor:
+            yield row
+    except sqlite3.Error as e:
+        raise SQLExportError(e)
+    finally:
+        conn.close()
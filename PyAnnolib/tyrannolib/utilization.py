@@ -0,0 +1,203 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+"""
+Time-bucketed utilization of the cluster.
+
+The build is divided into buckets of a fixed number of seconds,
+starting at time 0.0. For each agent, the busy fraction of each bucket
+is calculated; overlapping timings on one agent are only counted once.
+For each job type, the average number of jobs of that type running in
+each bucket is calculated.
+
+The timings are kept in flat arrays, not as Timing objects, so that a
+build with a million timings fits easily in memory. Each interval adds
+a partial amount to the buckets it starts and ends in, and a +1/-1 to a
+difference array for the whole buckets in between; a running sum then
+fills those in, so the work is linear in the number of timings plus
+the number of buckets.
+"""
+
+import array
+import csv
+import math
+from itertools import izip
+
+DEFAULT_BUCKET_SIZE = 60.0
+
+class UtilizationError(Exception):
+    pass
+
+def accumulate(intervals, bucket_size, num_buckets):
+    """Given an iterable of (invoked, completed) intervals, return an
+    array of num_buckets floats. Each value is the time covered by
+    the intervals in that bucket, divided by bucket_size. Intervals
+    that overlap each other are counted twice."""
+    totals = array.array("d", [0.0]) * num_buckets
+    # The number of intervals that cover the whole bucket
+    deltas = array.array("i", [0]) * (num_buckets + 1)
+
+    for (invoked, completed) in intervals:
+        first = invoked / bucket_size
+        last = completed / bucket_size
+        i_first = int(first)
+        i_last = int(last)
+        if i_first == i_last:
+            if i_first < num_buckets:
+                totals[i_first] += last - first
+            continue
+
+        totals[i_first] += i_first + 1 - first
+        if i_last < num_buckets:
+            totals[i_last] += last - i_last
+        else:
+            i_last = num_buckets
+        deltas[i_first + 1] += 1
+        deltas[i_last] -= 1
+
+    N = 0
+    for i in xrange(num_buckets):
+        N += deltas[i]
+        if N:
+            totals[i] += N
+    return totals
+
+def merge_intervals(intervals):
+    """Return the (invoked, completed) intervals with the overlapping,
+    or touching, ones merged together, in time order."""
+    merged = []
+    for (invoked, completed) in sorted(intervals):
+        if merged and invoked <= merged[-1][1]:
+            if completed > merged[-1][1]:
+                merged[-1] = (merged[-1][0], completed)
+        else:
+            merged.append((invoked, completed))
+    return merged
+
+
+class Utilization:
+    """Collects timings, and calculates the utilization of each agent
+    and job type over time."""
+
+    def __init__(self, bucket_size=DEFAULT_BUCKET_SIZE):
+        if bucket_size <= 0:
+            msg = "The bucket size must be positive: %s" % (bucket_size,)
+            raise UtilizationError(msg)
+        self.bucket_size = float(bucket_size)
+
+        # One entry per timing
+        self.invoked = array.array("d")
+        self.completed = array.array("d")
+        self.agent_nums = array.array("i")
+        self.type_nums = array.array("i")
+
+        # The agent (node) names and job types, by number
+        self.agents = []
+        self.job_types = []
+        self._agent_num = {}
+        self._type_num = {}
+
+        # Set by calculate()
+        self.num_buckets = 0
+        self.agent_busy = {}
+        self.type_running = {}
+
+    def addJob(self, job):
+        """Add all of a Job's timings."""
+        for timing in job.getTimings():
+            self.addTiming(timing, job.getType())
+
+    def addTiming(self, timing, job_type):
+        """Add one Timing, for a job of job_type."""
+        self.addTimingTuple(timing.getNode(), job_type,
+                timing.getInvoked(), timing.getCompleted())
+
+    def addTimingTuple(self, node, job_type, invoked, completed):
+        """Add one timing. A timing which is missing its times
+        is ignored."""
+        if invoked is None or completed is None:
+            return
+
+        if completed < invoked:
+            msg = "Invoked time is after Completed time: %s > %s on %s" % \
+                    (invoked, completed, node)
+            raise UtilizationError(msg)
+
+        agent_num = self._agent_num.get(node)
+        if agent_num is None:
+            agent_num = self._agent_num[node] = len(self.agents)
+            self.agents.append(node)
+
+        type_num = self._type_num.get(job_type)
+        if type_num is None:
+            type_num = self._type_num[job_type] = len(self.job_types)
+            self.job_types.append(job_type)
+
+        self.invoked.append(invoked)
+        self.completed.append(completed)
+        self.agent_nums.append(agent_num)
+        self.type_nums.append(type_num)
+
+    def getNumTimings(self):
+        return len(self.invoked)
+
+    def getBucketStart(self, i):
+        """Returns the start time of bucket i."""
+        return i * self.bucket_size
+
+    def calculate(self):
+        """Calculate the utilization of each bucket. Afterwards,
+        agent_busy has the busy fraction of each bucket, as an array,
+        for each agent name, and type_running has the average number
+        of running jobs in each bucket for each job type."""
+        if self.completed:
+            self.num_buckets = int(math.ceil(max(self.completed) /
+                self.bucket_size))
+        else:
+            self.num_buckets = 0
+
+        # Group the intervals by agent and by job type
+        agent_intervals = [[] for _ in self.agents]
+        type_intervals = [[] for _ in self.job_types]
+        for (invoked, completed, agent_num, type_num) in izip(self.invoked,
+                self.completed, self.agent_nums, self.type_nums):
+            interval = (invoked, completed)
+            agent_intervals[agent_num].append(interval)
+            type_intervals[type_num].append(interval)
+
+        self.agent_busy = {}
+        for (name, intervals) in izip(self.agents, agent_intervals):
+            self.agent_busy[name] = accumulate(merge_intervals(intervals),
+                    self.bucket_size, self.num_buckets)
+
+        self.type_running = {}
+        for (job_type, intervals) in izip(self.job_types, type_intervals):
+            self.type_running[job_type] = accumulate(intervals,
+                    self.bucket_size, self.num_buckets)
+
+    def getBusyAgents(self):
+        """Returns an array with the number of busy agents in each
+        bucket; that is, the sum of the agents' busy fractions."""
+        busy = array.array("d", [0.0]) * self.num_buckets
+        for fractions in self.agent_busy.values():
+            for (i, fraction) in enumerate(fractions):
+                busy[i] += fraction
+        return busy
+
+    def writeCSV(self, fh):
+        """Write the utilization as CSV, with one row per bucket."""
+        agents = sorted(self.agents)
+        job_types = sorted(self.job_types)
+
+        writer = csv.writer(fh)
+        writer.writerow(["start", "end", "busy_agents"] +
+                ["agent:%s" % (name,) for name in agents] +
+                ["type:%s" % (job_type,) for job_type in job_types])
+
+        columns = [self.getBusyAgents()] + \
+                [self.agent_busy[name] for name in agents] + \
+                [self.type_running[job_type] for job_type in job_types]
+
+        for i in xrange(self.num_buckets):
+            row = ["%.3f" % (self.getBucketStart(i),),
+                    "%.3f" % (self.getBucketStart(i + 1),)]
+            row.extend(["%.4f" % (column[i],) for column in columns])
+            writer.writerow(row)
@@ -0,0 +1,74 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import os
+import unittest
+
+from pyannolib import annolib
+from tyrannolib import available
+from tyrannolib import jobgraph
+from tyrannolib import sequencing
+from utlib import util
+from utlib.jobgraph import _graph
+
+# Key = job ID, Value = (node, invoked, completed)
+TIMINGS = {
+    "A" : ("n1", 0.0, 2.0),
+    "B" : ("n1", 3.0, 5.0),
+    "C" : ("n2", 2.0, 4.0),
+    "D" : ("n3", 1.0, 6.0),
+}
+
+class AvailableTests(unittest.TestCase):
+    """Test the available parallelism."""
+
+    def setUp(self):
+        # E has no timings
+        self.graph = _graph({ "A" : 2.0, "B" : 2.0, "C" : 2.0, "D" : 5.0,
+            "E" : 0.0 }, [ ("A", "B"), ("A", "C"), ("C", "E") ])
+        self.cluster = sequencing.Cluster()
+        for (job_id, (node, invoked, completed)) in TIMINGS.items():
+            job_num = self.graph.getJobNum(job_id)
+            self.graph.first_invoked[job_num] = invoked
+            self.graph.last_completed[job_num] = completed
+            self.cluster.agents.setdefault(node, sequencing.Agent())
+            self.cluster.agents[node].addTimingTuple(invoked, completed)
+
+    def test_ready(self):
+        self.assertEqual(list(available.get_ready_times(self.graph)),
+                [0.0, 2.0, 2.0, 0.0, jobgraph.NO_TIME])
+
+    def test_steps(self):
+        available_steps = available.calculate_available_steps(self.graph)
+        self.assertEqual(available_steps,
+                [(0.0, 2), (2.0, 3), (4.0, 2), (5.0, 1), (6.0, 0)])
+
+        merged = available.merge_steps(available_steps,
+                self.cluster.calculateSteps())
+        self.assertEqual(merged, [(0.0, 2, 1), (1.0, 2, 2), (2.0, 3, 2),
+            (3.0, 3, 3), (4.0, 2, 2), (5.0, 1, 1), (6.0, 0, 0)])
+        self.assertEqual(available.classify(merged), (2.0, 4.0, 0.0))
+
+        durations = available.get_durations(available_steps)
+        self.assertEqual(durations, { 1 : 1.0, 2 : 3.0, 3 : 2.0 })
+        self.assertEqual(available.get_mean(durations), 13.0 / 6.0)
+        self.assertEqual([available.get_percentile(durations, pct)
+            for pct in (10, 50, 90, 100)], [1, 2, 3, 3])
+
+    def test_build(self):
+        filename = os.path.join(util.UTFILES_DIR,
+                "make-3.82-emake-7.0.0.xml")
+        build = annolib.AnnotatedBuild(filename)
+        graph = jobgraph.build_graph(build)
+        build.close()
+
+        # Every running job was available, and the time adds up
+        ready = available.get_ready_times(graph)
+        for job_num in xrange(graph.getNumJobs()):
+            self.assertTrue(ready[job_num] <= graph.first_invoked[job_num])
+        steps = available.calculate_available_steps(graph)
+        self.assertEqual(steps[-1], (graph.getBuildTime(), 0))
+        self.assertAlmostEqual(sum([N * N_time for (N, N_time)
+            in available.get_durations(steps).items()]),
+            sum([graph.last_completed[i] - ready[i]
+                for i in xrange(graph.getNumJobs())
+                if ready[i] != jobgraph.NO_TIME]))
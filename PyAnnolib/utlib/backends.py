@@ -0,0 +1,87 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import glob
+import os
+import unittest
+
+from pyannolib import annolib
+from pyannolib import pathtable
+from utlib import util
+
+def _slots(obj):
+    names = []
+    for cls in type(obj).__mro__:
+        names.extend(getattr(cls, "__slots__", ()))
+    return names
+
+def _dump(obj):
+    """Turn the objects into lists, dicts and (type, value) tuples,
+    so that two parses can be compared, including the types of the
+    strings (str vs. unicode)."""
+    if isinstance(obj, (list, annolib.OpList)):
+        return [_dump(item) for item in obj]
+    elif isinstance(obj, dict):
+        return dict([(key, _dump(value)) for (key, value) in obj.items()])
+    elif hasattr(obj, "__slots__"):
+        items = []
+        for key in sorted(_slots(obj)):
+            if not hasattr(obj, key):
+                continue
+            value = getattr(obj, key)
+            if isinstance(value, annolib.MakeProcess):
+                value = value.getID()
+            elif isinstance(value, pathtable.PathTable):
+                # The IDs depend on the order of parsing
+                continue
+            elif key == "file_id":
+                value = obj.getFile()
+            items.append((key, _dump(value)))
+        return (obj.__class__.__name__, items)
+    else:
+        return (type(obj).__name__, obj)
+
+class BackendTests(unittest.TestCase):
+    """Check that all the parser backends give the same results."""
+
+    def _parse(self, filename, backend):
+        build = annolib.AnnotatedBuild(filename, backend=backend)
+        jobs = _dump(build.getAllJobs())
+        result = (jobs, _dump(build.getMessages()),
+                _dump(build.getMetrics()), _dump(build.make_procs),
+                sorted(build.make_jobs.keys()))
+        build.close()
+        return result
+
+    def _check_backend(self, backend):
+        filenames = glob.glob(os.path.join(util.UTFILES_DIR, "*.xml"))
+        self.assertTrue(filenames)
+        for filename in filenames:
+            expected = self._parse(filename, annolib.BACKEND_ETREE)
+            self.assertEqual(self._parse(filename, backend), expected,
+                    "%s differs with %s" % (filename, backend))
+
+    def test_expat(self):
+        self._check_backend(annolib.BACKEND_EXPAT)
+
+    @unittest.skipUnless(annolib.lxml_etree, "lxml is not installed")
+    def test_lxml(self):
+        self._check_backend(annolib.BACKEND_LXML)
+
+    def test_small_reads(self):
+        # Elements and text that are split between reads
+        filename = os.path.join(util.UTFILES_DIR, "job-error.xml")
+        expected = self._parse(filename, annolib.BACKEND_ETREE)
+
+        read_size = annolib.AnnoExpatBodyParser.READ_SIZE
+        annolib.AnnoExpatBodyParser.READ_SIZE = 100
+        try:
+            result = self._parse(filename, annolib.BACKEND_EXPAT)
+        finally:
+            annolib.AnnoExpatBodyParser.READ_SIZE = read_size
+
+        self.assertEqual(result, expected)
+
+    def test_unknown_backend(self):
+        filename = os.path.join(util.UTFILES_DIR, "emake8.xml")
+        self.assertRaises(annolib.PyAnnolibError, annolib.AnnotatedBuild,
+                filename, backend="no-such-backend")
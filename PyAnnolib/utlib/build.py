@@ -1,6 +1,7 @@
 # Copyright (c) 2013 by Cisco Systems, Inc.
 
 import os
+import StringIO
 import unittest
 
 from pyannolib import annolib
@@ -70,3 +71,34 @@ class BuildTests(unittest.TestCase):
         self.assertEqual(metrics["elapsed"], "3.539654")
 
         # Last metric
+
+    def test_body_offset(self):
+        # The body parser starts where the header ends
+        annofile = os.path.join(util.UTFILES_DIR, "make-3.82-emake-5.3.0.xml")
+        with open(annofile, "rb") as fh:
+            fh.seek(self.build.body_offset)
+            self.assertEqual(fh.read(len("<make ")), "<make ")
+
+        self.assertEqual(self.build.xml_decl,
+                '<?xml version="1.0" encoding="UTF-8"?>')
+        self.assertEqual(len(self.jobs), 266)
+
+    def test_body_stream(self):
+        fh = StringIO.StringIO("<job></job></build>")
+        stream = annolib.BodyStream("<build>", fh)
+        self.assertEqual(stream.read(4), "<bui")
+        self.assertEqual(stream.read(8), "ld><job>")
+        self.assertEqual(stream.read(), "</job></build>")
+
+    def test_chunked_scanners(self):
+        # A filehandle that can't be mmap'ed gets the same header
+        # and metrics as one that can.
+        annofile = os.path.join(util.UTFILES_DIR, "make-3.82-emake-5.3.0.xml")
+        with open(annofile, "rb") as fh:
+            data = fh.read()
+
+        build = annolib.AnnotatedBuild(None, fh=StringIO.StringIO(data))
+        self.assertEqual(build.body_offset, self.build.body_offset)
+        self.assertEqual(build.getProperties(), self.build.getProperties())
+        self.assertEqual(build.getVars(), self.build.getVars())
+        self.assertEqual(build.getMetrics(), self.build.getMetrics())
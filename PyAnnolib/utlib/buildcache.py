@@ -0,0 +1,135 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyannolib import annolib
+from pyannolib import buildcache
+from utlib import util
+from utlib.jobindex import plant_pickle
+
+class BuildCacheTests(unittest.TestCase):
+    """Test the binary cache of the parsed annotation file."""
+
+    def setUp(self):
+        # Work in a temp directory so the cache files don't
+        # litter utfiles
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _copy(self, anno_file):
+        filename = os.path.join(self.tmp_dir, anno_file)
+        shutil.copy(os.path.join(util.UTFILES_DIR, anno_file), filename)
+        return filename
+
+    def _reports(self, build):
+        reports = []
+        for job in build.iterJobs():
+            report = job.getTextReport()
+            report += repr(job.getVars()) + repr(job.getWaitingJobs())
+            if job.getMakeProcess():
+                report += job.getMakeProcess().getTextReport()
+            reports.append(report)
+        messages = [(msg.getTime(), msg.getText())
+                for msg in build.getMessages()]
+        return (reports, messages, build.getMetrics())
+
+    def _check_file(self, anno_file):
+        filename = self._copy(anno_file)
+
+        build = annolib.AnnotatedBuild(filename)
+        expected = self._reports(build)
+        build.close()
+
+        build = annolib.AnnotatedBuild(filename)
+        build.writeCache()
+        build.close()
+        self.assertTrue(os.path.exists(buildcache.cache_filename(filename)))
+
+        build = annolib.AnnotatedBuild(filename)
+        self.assertEqual(self._reports(build), expected)
+        self.assertNotEqual(build._getCache(), None)
+        build.close()
+
+    def test_emake7(self):
+        self._check_file("make-3.82-emake-7.0.0.xml")
+
+    def test_emake5(self):
+        self._check_file("make-3.82-emake-5.3.0.xml")
+
+    def test_job_error(self):
+        self._check_file("job-error.xml")
+
+    def test_messages(self):
+        self._check_file("message-record.xml")
+
+    def test_job_path(self):
+        # The MakeProcess tree is restored, too
+        filename = self._copy("make-3.82-emake-7.0.0.xml")
+        annolib.AnnotatedBuild(filename).writeCache()
+
+        build = annolib.AnnotatedBuild(filename)
+        jobs = build.getAllJobs()
+        self.assertNotEqual(build._getCache(), None)
+
+        job = [j for j in jobs if j.getID() == "J0000000012067840"][0]
+        job_path = [obj.getID() for obj in build.getJobPath(job)]
+        expected = ["M00000000", "J0000000012012f50",
+                    "M00000001", "J0000000012028170",
+                    "M00000006", "J0000000012067840"]
+        self.assertEqual(job_path, expected)
+
+    def test_write_cache_option(self):
+        # With write_cache=True, a complete iterJobs() writes the cache,
+        # but an incomplete one does not
+        filename = self._copy("make-3.82-emake-7.0.0.xml")
+        cache_file = buildcache.cache_filename(filename)
+
+        build = annolib.AnnotatedBuild(filename, write_cache=True)
+        for job in build.iterJobs():
+            break
+        self.assertFalse(os.path.exists(cache_file))
+
+        build.getAllJobs()
+        self.assertTrue(os.path.exists(cache_file))
+
+    def test_stale(self):
+        filename = self._copy("make-3.82-emake-7.0.0.xml")
+        annolib.AnnotatedBuild(filename).writeCache()
+
+        # The cache is not used when the file has changed
+        with open(filename, "ab") as fh:
+            fh.write("\n")
+        build = annolib.AnnotatedBuild(filename)
+        self.assertEqual(build._getCache(), None)
+        self.assertEqual(len(build.getAllJobs()), 300)
+
+    def test_pickled_cache(self):
+        # A pickle is never loaded from the cache file
+        filename = self._copy("make-3.82-emake-7.0.0.xml")
+        marker = os.path.join(self.tmp_dir, "unpickled")
+        plant_pickle(buildcache.cache_filename(filename), marker)
+
+        build = annolib.AnnotatedBuild(filename)
+        self.assertEqual(build._getCache(), None)
+        self.assertEqual(len(build.getAllJobs()), 300)
+        build.close()
+        self.assertFalse(os.path.exists(marker))
+
+    def test_damaged_cache(self):
+        filename = self._copy("job-error.xml")
+        annolib.AnnotatedBuild(filename).writeCache()
+        cache_file = buildcache.cache_filename(filename)
+        with open(cache_file, "rb") as fh:
+            data = fh.read()
+
+        for size in [0, 10, len(data) // 2, len(data) - 1]:
+            with open(cache_file, "wb") as fh:
+                fh.write(data[:size])
+            build = annolib.AnnotatedBuild(filename)
+            self.assertEqual(build._getCache(), None)
+            build.close()
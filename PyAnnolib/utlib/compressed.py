@@ -0,0 +1,124 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyannolib import annolib
+from pyannolib import compressed
+from utlib import util
+
+ANNO_FILE = "make-3.82-emake-7.0.0.xml"
+
+class CompressedTests(unittest.TestCase):
+    """Test reading gzip, xz, and block-compressed annotation files."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Parse the uncompressed file once, for this entire class"""
+        cls.plain_file = os.path.join(util.UTFILES_DIR, ANNO_FILE)
+        build = annolib.AnnotatedBuild(cls.plain_file)
+        cls.reports = [job.getTextReport() for job in build.getAllJobs()]
+        cls.metrics = build.getMetrics()
+        build.close()
+
+        with open(cls.plain_file, "rb") as fh:
+            cls.data = fh.read()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_gzip(self):
+        filename = os.path.join(self.tmp_dir, ANNO_FILE + ".gz")
+        fh = gzip.open(filename, "wb")
+        fh.write(self.data)
+        fh.close()
+        return filename
+
+    def _write_block(self, block_size=4096):
+        filename = os.path.join(self.tmp_dir, ANNO_FILE + ".z")
+        with open(self.plain_file, "rb") as fh:
+            compressed.write_block_file(fh, filename, block_size)
+        return filename
+
+    def _check_build(self, filename, workers=None):
+        build = annolib.AnnotatedBuild(filename)
+        reports = [job.getTextReport() for job in build.iterJobs(workers)]
+        self.assertEqual(reports, self.reports)
+        self.assertEqual(build.getMetrics(), self.metrics)
+        self.assertEqual(build.getJob("J0000000012067840").getName(), "make")
+        build.close()
+
+    def test_file_type(self):
+        self.assertEqual(compressed.file_type(self.plain_file),
+                compressed.TYPE_PLAIN)
+        self.assertEqual(compressed.file_type(self._write_gzip()),
+                compressed.TYPE_GZIP)
+        self.assertEqual(compressed.file_type(self._write_block()),
+                compressed.TYPE_BLOCK)
+
+    def test_gzip(self):
+        self._check_build(self._write_gzip())
+
+    def test_gzip_metrics(self):
+        # A gzip stream is not read to the end to find the metrics;
+        # they are filled in when the body is parsed.
+        build = annolib.AnnotatedBuild(self._write_gzip())
+        self.assertEqual(build.getMetrics(), {})
+        build.getAllJobs()
+        self.assertEqual(build.getMetrics(), self.metrics)
+        build.close()
+
+    def test_read_ahead_seek(self):
+        filename = self._write_gzip()
+        for read_ahead in (True, False):
+            fh = compressed.ReadAheadFile(lambda: gzip.open(filename, "rb"),
+                    read_ahead)
+            self.assertEqual(fh.seek(1000), 1000)
+            self.assertEqual(fh.read(10), self.data[1000:1010])
+            self.assertEqual(fh.seek(5), 5)
+            self.assertEqual(fh.read(10), self.data[5:15])
+            fh.close()
+
+    def test_xz(self):
+        if compressed.lzma is None:
+            return
+
+        filename = os.path.join(self.tmp_dir, ANNO_FILE + ".xz")
+        with open(filename, "wb") as fh:
+            fh.write(compressed.lzma.compress(self.data))
+        self._check_build(filename)
+
+    def test_block(self):
+        # The metrics are read from the footer, without
+        # parsing the body
+        build = annolib.AnnotatedBuild(self._write_block())
+        self.assertEqual(build.getMetrics(), self.metrics)
+        build.close()
+
+        self._check_build(self._write_block())
+
+    def test_block_parallel(self):
+        self._check_build(self._write_block(), workers=2)
+
+    def test_block_seek(self):
+        fh = compressed.BlockCompressedFile(self._write_block(1000))
+        for pos in (0, 999, 1000, 12345, len(self.data) - 3):
+            fh.seek(pos)
+            self.assertEqual(fh.read(2500), self.data[pos:pos + 2500])
+
+        fh.seek(-10, os.SEEK_END)
+        self.assertEqual(fh.readall(), self.data[-10:])
+        self.assertEqual(fh.read(10), "")
+        fh.close()
+
+    def test_multi_part_unsupported(self):
+        filename = self._write_gzip()
+        shutil.copy(filename, filename + "_1")
+        self.assertRaises(annolib.PyAnnolibError,
+                annolib.AnnotatedBuild, filename)
@@ -4,6 +4,7 @@ import os
 import unittest
 
 from pyannolib import annolib
+from pyannolib import concatfile
 from utlib import util
 
 class ConcatTests(unittest.TestCase):
@@ -48,6 +49,7 @@ class ConcatTests(unittest.TestCase):
         #
         # Test that one read() reads the entire string.
         #
+        self.fh.seek(0)
         self.fh.seek(10, os.SEEK_CUR)
         self.fh.seek(16, os.SEEK_CUR)
         data = self.fh.read()
@@ -60,3 +62,34 @@ class ConcatTests(unittest.TestCase):
         self.fh.seek(-34, os.SEEK_END)
         data = self.fh.read(8)
         self.assertEqual(data, "BCDEFGHI")
+
+    def test_read_across_files(self):
+        #
+        # Test that reads advance the position across file boundaries.
+        #
+        self.fh.seek(5)
+        self.assertEqual(self.fh.read(4), "FGHI")
+        self.assertEqual(self.fh.tell(), 9)
+        self.assertEqual(self.fh.read(20), "JKLMNOPQRSTUVWXYZ123")
+        self.assertEqual(self.fh.tell(), 29)
+
+    def test_readinto(self):
+        #
+        # Test the raw ConcatenatedFile, with and without mmap.
+        #
+        filenames = [os.path.join(util.UTFILES_DIR, name) for name in
+                ["concat.txt", "concat.txt_1", "concat.txt_2", "concat.txt_3"]]
+
+        for use_mmap in [False, True]:
+            raw = concatfile.ConcatenatedFile(filenames, "rb", use_mmap)
+            buf = bytearray(10)
+            raw.seek(3)
+            self.assertEqual(raw.readinto(buf), 10)
+            self.assertEqual(str(buf), "DEFGHIJKLM")
+            raw.seek(-4, os.SEEK_END)
+            self.assertEqual(raw.readinto(buf), 4)
+            self.assertEqual(str(buf[:4]), "6789")
+            self.assertEqual(raw.readinto(buf), 0)
+            raw.seek(20)
+            self.assertEqual(raw.read(), "UVWXYZ123456789")
+            raw.close()
@@ -3,6 +3,7 @@
 import unittest
 
 from tyrannolib import digraph
+from tyrannolib import graph
 
 class DAGTests(unittest.TestCase):
     """Check the DAG logic."""
@@ -94,3 +95,25 @@ class DAGTests(unittest.TestCase):
 
         with self.assertRaises(ValueError):
             dag.add_edge(node_a, edge_label, node_b)
+
+    def test_topological_order(self):
+        #
+        # Test the topological order, and finding a cycle
+        #
+        dag = digraph.DAG()
+
+        node_c = dag.add_node("c")
+        node_b = dag.add_node("b")
+        node_a = dag.add_node("a")
+        dag.add_edge(node_a, "USES", node_b)
+        dag.add_edge(node_b, "USES", node_c)
+        dag.set_edge(node_a, "USES", node_b)
+
+        self.assertEqual([node_a, node_b, node_c],
+                dag.get_topological_order())
+        self.assertEqual(None, dag.find_cycle())
+
+        dag.add_edge(node_c, "USES", node_a)
+        self.assertEqual([node_c, node_a, node_b], dag.find_cycle())
+        with self.assertRaises(graph.GraphError):
+            dag.get_topological_order()
@@ -0,0 +1,107 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyannolib import annolib
+from utlib import util
+from utlib.backends import _dump
+
+class EventTests(unittest.TestCase):
+    """Test the streaming iterEvents() API."""
+
+    def _events(self, filename, fields=None):
+        """Rebuild the Jobs from the events, checking their order."""
+        build = annolib.AnnotatedBuild(filename)
+        jobs = []
+        job = None
+        for (event, event_job, record) in build.iterEvents(fields):
+            if event == annolib.EVENT_JOB_START:
+                self.assertEqual(job, None)
+                self.assertEqual(record, None)
+                self.assertNotEqual(event_job.getMakeProcess(), None)
+                job = event_job
+                jobs.append(job)
+                continue
+
+            self.assertTrue(event_job is job)
+            if event == annolib.EVENT_TIMING:
+                job.timings.append(record)
+            elif event == annolib.EVENT_OP:
+                job.oplist.append(record)
+            elif event == annolib.EVENT_DEP:
+                job.deplist.append(record)
+            else:
+                self.assertEqual(event, annolib.EVENT_JOB_END)
+                self.assertEqual(record, None)
+                job = None
+
+        self.assertEqual(job, None)
+        result = (_dump(jobs), _dump(build.getMessages()),
+                _dump(build.make_procs), sorted(build.make_jobs.keys()))
+        build.close()
+        return result
+
+    def _jobs(self, filename, fields=None):
+        build = annolib.AnnotatedBuild(filename)
+        result = (_dump(build.getAllJobs(fields=fields)),
+                _dump(build.getMessages()), _dump(build.make_procs),
+                sorted(build.make_jobs.keys()))
+        build.close()
+        return result
+
+    def test_same_as_jobs(self):
+        filenames = glob.glob(os.path.join(util.UTFILES_DIR, "*.xml"))
+        self.assertTrue(filenames)
+        for filename in filenames:
+            self.assertEqual(self._events(filename), self._jobs(filename),
+                    filename)
+
+    def test_fields(self):
+        filename = os.path.join(util.UTFILES_DIR,
+                "make-3.82-emake-7.0.0.xml")
+        fields = [annolib.JOB_FIELD_OPS]
+        self.assertEqual(self._events(filename, fields),
+                self._jobs(filename, fields))
+
+        build = annolib.AnnotatedBuild(filename)
+        events = set([event for (event, _, _) in build.iterEvents(fields)])
+        self.assertEqual(events, set([annolib.EVENT_JOB_START,
+            annolib.EVENT_OP, annolib.EVENT_JOB_END]))
+        build.close()
+
+    def test_streaming(self):
+        # A job with a huge <opList> is handed out before
+        # all of it is read.
+        with open(os.path.join(util.UTFILES_DIR,
+            "make-3.82-emake-7.0.0.xml"), "rb") as fh:
+            data = fh.read()
+        pos = data.index(">", data.index("<job ")) + 1
+        num_ops = 50000
+        ops = "".join(['<op type="read" file="/src/file%d.h"/>\n' % (i,)
+            for i in xrange(num_ops)])
+        data = data[:pos] + "\n<opList>\n" + ops + "</opList>" + data[pos:]
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp_dir, "huge-job.xml")
+            with open(filename, "wb") as fh:
+                fh.write(data)
+
+            build = annolib.AnnotatedBuild(filename)
+            num_events = 0
+            for (event, job, record) in build.iterEvents():
+                if event == annolib.EVENT_OP:
+                    if num_events == 0:
+                        self.assertTrue(build.fh.tell() < len(data) / 2)
+                    num_events += 1
+                elif event == annolib.EVENT_JOB_END:
+                    self.assertEqual(len(job.getOperations()), 0)
+                    break
+            self.assertTrue(num_events > num_ops)
+            build.close()
+        finally:
+            shutil.rmtree(tmp_dir)
@@ -0,0 +1,98 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyannolib import annolib
+from utlib import util
+from utlib.backends import _dump
+
+# The Job attribute that holds each field, and its empty value
+FIELD_ATTRS = {
+    annolib.JOB_FIELD_TIMING : ("timings", []),
+    annolib.JOB_FIELD_OPS : ("oplist", []),
+    annolib.JOB_FIELD_DEPS : ("deplist", []),
+    annolib.JOB_FIELD_WAITING_JOBS : ("waiting_jobs", []),
+    annolib.JOB_FIELD_COMMANDS : ("commands", []),
+    annolib.JOB_FIELD_OUTPUTS : ("outputs", []),
+    annolib.JOB_FIELD_CONFLICT : ("conflict", None),
+    annolib.JOB_FIELD_VARS : ("vars", {}),
+    annolib.JOB_FIELD_COMMIT_TIMES : ("commit_times", None),
+}
+
+FIELD_SETS = [
+    [],
+    [annolib.JOB_FIELD_TIMING],
+    [annolib.JOB_FIELD_OPS, annolib.JOB_FIELD_DEPS],
+    [annolib.JOB_FIELD_COMMANDS],
+    [annolib.JOB_FIELD_OUTPUTS],
+    [annolib.JOB_FIELD_TIMING, annolib.JOB_FIELD_COMMANDS,
+        annolib.JOB_FIELD_OUTPUTS],
+    FIELD_ATTRS.keys(),
+]
+
+class JobFieldsTests(unittest.TestCase):
+    """Check iterJobs(fields=...)"""
+
+    def setUp(self):
+        # Work in a temp directory so the sidecar files
+        # don't litter utfiles
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _expected(self, jobs, fields):
+        """Clear the fields that were not asked for in the full jobs."""
+        skipped = dict([FIELD_ATTRS[field] for field in FIELD_ATTRS
+            if field not in fields])
+        for job in jobs:
+            for attr, empty in skipped.items():
+                setattr(job, attr, empty)
+        return _dump(jobs)
+
+    def _check(self, workers, backend, field_sets=FIELD_SETS):
+        filenames = glob.glob(os.path.join(util.UTFILES_DIR, "*.xml"))
+        for filename in filenames:
+            annofile = os.path.join(self.tmp_dir, os.path.basename(filename))
+            shutil.copy(filename, annofile)
+
+            for fields in field_sets:
+                build = annolib.AnnotatedBuild(annofile)
+                expected = self._expected(build.getAllJobs(), fields)
+
+                build = annolib.AnnotatedBuild(annofile, backend=backend)
+                jobs = build.getAllJobs(workers, fields)
+                self.assertEqual(_dump(jobs), expected,
+                        "%s differs with fields %s" % (filename, fields))
+
+    def test_etree(self):
+        self._check(None, annolib.BACKEND_ETREE)
+
+    def test_expat(self):
+        self._check(None, annolib.BACKEND_EXPAT)
+
+    def test_parallel(self):
+        # Starting the worker processes is slow, so try fewer
+        self._check(3, annolib.BACKEND_ETREE, FIELD_SETS[1:3])
+
+    def test_no_cache(self):
+        # A cache of partial jobs would be wrong
+        annofile = os.path.join(self.tmp_dir, "emake8.xml")
+        shutil.copy(os.path.join(util.UTFILES_DIR, "emake8.xml"), annofile)
+
+        build = annolib.AnnotatedBuild(annofile, write_cache=True)
+        build.getAllJobs(fields=[annolib.JOB_FIELD_TIMING])
+        self.assertFalse(os.path.exists(annofile + ".annocache"))
+
+        build.getAllJobs()
+        self.assertTrue(os.path.exists(annofile + ".annocache"))
+
+    def test_unknown_field(self):
+        build = annolib.AnnotatedBuild(
+                os.path.join(util.UTFILES_DIR, "emake8.xml"))
+        self.assertRaises(annolib.PyAnnolibError, build.iterJobs,
+                fields=["timings"])
@@ -0,0 +1,110 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import unittest
+
+from tyrannolib import graph
+
+def _diamond():
+    """0 -> 1 -> 3, 0 -> 2 -> 3, and 0 -> 3; 4 is on its own."""
+    return graph.Graph.fromEdges(5, [0, 0, 1, 2, 0], [1, 2, 3, 3, 3])
+
+class GraphTests(unittest.TestCase):
+    """Test the integer-node graph."""
+
+    def test_edges(self):
+        g = graph.Graph()
+        self.assertEqual(g.addNodes(3), 0)
+        self.assertEqual(g.addNode(), 3)
+        self.assertEqual(g.getNumNodes(), 4)
+
+        self.assertTrue(g.addEdge(0, 1))
+        self.assertFalse(g.addEdge(0, 1))
+        self.assertTrue(g.addEdge(0, 1, "dep"))
+        self.assertTrue(g.addEdge(0, 2, "dep"))
+        self.assertEqual(g.getNumEdges(), 3)
+        self.assertTrue(g.hasEdge(0, 1))
+        self.assertTrue(g.hasEdge(0, 1, "dep"))
+        self.assertFalse(g.hasEdge(1, 0))
+        self.assertFalse(g.hasEdge(0, 1, "other"))
+
+        self.assertEqual(g.getOutEdges(0), [(None, 1), ("dep", 1),
+            ("dep", 2)])
+        self.assertEqual(g.getInEdges(1), [(None, 0), ("dep", 0)])
+        self.assertEqual(g.getOutDegree(0), 3)
+        self.assertEqual(g.getInDegree(2), 1)
+        self.assertEqual(g.getRoots(), [0, 3])
+        self.assertEqual(g.getLeaves(), [1, 2, 3])
+
+        # The compressed edges are rebuilt after a change
+        g.addEdge(2, 3)
+        self.assertEqual(list(g.getSuccessors(2)), [3])
+        self.assertEqual(list(g.getPredecessors(3)), [2])
+        self.assertEqual(g.getRoots(), [0])
+
+        self.assertRaises(graph.GraphError, g.addEdge, 0, 4)
+        self.assertRaises(graph.GraphError, g.addEdge, -1, 0)
+
+    def test_bulk(self):
+        g = graph.Graph.fromEdges(3, [0, 1, 0, 1], [1, 2, 1, 0])
+        self.assertEqual(g.getNumEdges(), 3)
+        self.assertEqual(g.addEdges([2, 0], [0, 1]), 1)
+        self.assertEqual(list(g.getSuccessors(0)), [1])
+        self.assertEqual(list(g.getSuccessors(1)), [2, 0])
+        self.assertEqual(g.addEdges([], []), 0)
+
+        self.assertRaises(graph.GraphError, g.addEdges, [0], [])
+        self.assertRaises(graph.GraphError, g.addEdges, [0], [3])
+        self.assertRaises(graph.GraphError, graph.Graph.fromEdges,
+                2, [-1], [0])
+
+    def test_topological_sort(self):
+        g = _diamond()
+        order = list(g.topologicalSort())
+        self.assertEqual(sorted(order), range(5))
+        for node in xrange(5):
+            for succ in g.getSuccessors(node):
+                self.assertTrue(order.index(node) < order.index(succ))
+        self.assertTrue(g.isAcyclic())
+        self.assertEqual(g.findCycle(), None)
+        self.assertEqual(list(graph.Graph().topologicalSort()), [])
+
+    def test_cycle(self):
+        g = graph.Graph.fromEdges(5, [0, 1, 2, 3, 4], [1, 2, 3, 1, 0])
+        self.assertFalse(g.isAcyclic())
+        self.assertRaises(graph.GraphError, g.topologicalSort)
+        self.assertRaises(graph.GraphError, g.getLongestPath)
+        self.assertEqual(g.findCycle(), [1, 2, 3])
+
+        g = graph.Graph.fromEdges(1, [0], [0])
+        self.assertEqual(g.findCycle(), [0])
+
+    def test_reachable(self):
+        g = _diamond()
+        self.assertEqual(g.getReachable([1]), [1, 3])
+        self.assertEqual(g.getReachable([0]), [0, 1, 2, 3])
+        self.assertEqual(g.getReachable([3], reverse=True), [0, 1, 2, 3])
+        self.assertEqual(g.getReachable([1, 4], reverse=True), [0, 1, 4])
+        self.assertEqual(g.getReachable([]), [])
+        self.assertRaises(graph.GraphError, g.getReachable, [5])
+
+    def test_longest_path(self):
+        g = _diamond()
+        self.assertEqual(g.getLongestPath(), (3, [0, 1, 3]))
+        self.assertEqual(g.getLongestPath([1.0, 1.0, 5.0, 1.0, 2.0]),
+                (7.0, [0, 2, 3]))
+        self.assertEqual(g.getLongestPath([1.0, 1.0, 1.0, 1.0, 9.0]),
+                (9.0, [4]))
+        self.assertEqual(graph.Graph().getLongestPath(), (0, []))
+
+    def test_transitive_reduction(self):
+        g = _diamond()
+        g.addEdge(0, 1, "label")
+        reduced = g.getTransitiveReduction()
+        self.assertEqual(reduced.getNumNodes(), 5)
+        self.assertEqual(reduced.getOutEdges(0), [(None, 1), (None, 2),
+            ("label", 1)])
+        self.assertFalse(reduced.hasEdge(0, 3))
+        self.assertTrue(reduced.hasEdge(1, 3))
+        self.assertTrue(reduced.hasEdge(2, 3))
+        # The original is unchanged
+        self.assertTrue(g.hasEdge(0, 3))
@@ -0,0 +1,119 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import os
+import StringIO
+import unittest
+
+from pyannolib import annolib
+from tyrannolib import jobgraph
+from utlib import util
+
+def _graph(durations, edges):
+    """Make a JobGraph from a dict of job durations, and a list
+    of (from, to) edges."""
+    graph = jobgraph.JobGraph()
+    for (job_id, duration) in sorted(durations.items()):
+        graph.durations[graph.getJobNum(job_id)] = duration
+    for (from_job_id, to_job_id) in edges:
+        graph.addEdge(from_job_id, to_job_id)
+    graph.finish()
+    return graph
+
+class JobGraphTests(unittest.TestCase):
+    """Test the job dependency graph and its critical path."""
+
+    def test_critical_path(self):
+        graph = _graph({ "A" : 2.0, "B" : 3.0, "C" : 5.0, "D" : 1.0,
+            "E" : 7.0 }, [ ("A", "B"), ("B", "D"), ("A", "C"), ("C", "D"),
+                ("A", "A") ])
+        self.assertEqual(graph.getNumEdges(), 4)
+        path = graph.getCriticalPath()
+        self.assertEqual([graph.job_ids[i] for i in path], ["A", "C", "D"])
+        self.assertEqual(graph.getPathLength(path), 8.0)
+        self.assertEqual(list(graph.earliest_start), [0.0, 2.0, 2.0, 7.0, 0.0])
+        self.assertEqual(list(graph.getSuccessors(0)), [1, 2])
+
+        self.assertEqual(_graph({}, []).getCriticalPath(), [])
+
+    def test_cycle(self):
+        self.assertRaises(jobgraph.JobGraphError, _graph, {},
+                [ ("A", "B"), ("B", "C"), ("C", "A"), ("C", "D") ])
+
+    def test_build(self):
+        filename = os.path.join(util.UTFILES_DIR,
+                "make-3.82-emake-7.0.0.xml")
+        build = annolib.AnnotatedBuild(filename)
+        jobs = build.getAllJobs()
+        graph = jobgraph.build_graph(build)
+        build.close()
+
+        self.assertEqual(graph.getNumJobs(), len(jobs))
+        self.assertEqual(list(graph.seen), [1] * len(jobs))
+        self.assertEqual(graph.getNumEdges(),
+                sum([len(job.getWaitingJobs()) for job in jobs]) +
+                len([job for job in jobs
+                    if job.getMakeProcess().getParentJobID()]))
+
+        # No job can start before the jobs it depends on finish
+        graph.calculateEarliestStarts()
+        for (from_num, to_num) in zip(graph.edge_from, graph.edge_to):
+            self.assertTrue(graph.earliest_start[to_num] >=
+                    graph.earliest_start[from_num] + graph.durations[from_num])
+
+        # The path is a chain of dependencies, and nothing ends later
+        path = graph.getCriticalPath()
+        for (from_num, to_num) in zip(path, path[1:]):
+            self.assertTrue(to_num in graph.getSuccessors(from_num))
+        length = graph.getPathLength(path)
+        self.assertAlmostEqual(length,
+                sum([graph.durations[job_num] for job_num in path]))
+        for job_num in xrange(graph.getNumJobs()):
+            self.assertTrue(graph.earliest_start[job_num] +
+                    graph.durations[job_num] <= length)
+
+    def test_slack(self):
+        graph = _graph({ "A" : 2.0, "B" : 3.0, "C" : 5.0, "D" : 1.0,
+            "E" : 7.0 }, [ ("A", "B"), ("B", "D"), ("A", "C"), ("C", "D") ])
+        graph.calculateLatestStarts()
+        self.assertEqual(graph.getEndTime(), 8.0)
+        self.assertEqual(list(graph.latest_start), [0.0, 4.0, 2.0, 7.0, 1.0])
+        self.assertEqual([graph.getSlack(i) for i in xrange(5)],
+                [0.0, 2.0, 0.0, 0.0, 1.0])
+
+        # Only the jobs that were seen are ranked
+        for job_num in xrange(5):
+            graph.seen[job_num] = 1
+            graph.names[job_num] = "target-%d" % (job_num % 4,)
+            graph.job_types[job_num] = annolib.JOB_TYPE_RULE
+        graph.seen[3] = 0
+        self.assertEqual(graph.getPriorities(), [0, 2, 4, 1])
+        self.assertEqual(graph.getPriorities([annolib.JOB_TYPE_PARSE]), [])
+
+        # target-0 is listed once, for A
+        fh = StringIO.StringIO()
+        self.assertEqual(graph.writePriorities(fh), 3)
+        self.assertEqual(fh.getvalue().splitlines(), [
+            "rank,target,slack,earliest_start,latest_start,duration,job_id",
+            "1,target-0,0.000,0.000,0.000,2.000,A",
+            "2,target-2,0.000,2.000,2.000,5.000,C",
+            "3,target-1,2.000,2.000,4.000,3.000,B",
+            ])
+
+    def test_build_slack(self):
+        filename = os.path.join(util.UTFILES_DIR,
+                "make-3.82-emake-7.0.0.xml")
+        build = annolib.AnnotatedBuild(filename)
+        graph = jobgraph.build_graph(build)
+        build.close()
+        graph.calculateLatestStarts()
+
+        # The jobs on the critical path have no slack, and no job
+        # can be started later than its dependents allow
+        for job_num in graph.getCriticalPath():
+            self.assertAlmostEqual(graph.getSlack(job_num), 0.0)
+        for (from_num, to_num) in zip(graph.edge_from, graph.edge_to):
+            self.assertTrue(graph.latest_start[from_num] +
+                    graph.durations[from_num] <=
+                    graph.latest_start[to_num] + 1e-9)
+        self.assertEqual(sorted(graph.getPriorities()),
+                range(graph.getNumJobs()))
@@ -0,0 +1,173 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import cPickle
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyannolib import annolib
+from pyannolib import jobindex
+from utlib import util
+
+ANNO_FILE = "make-3.82-emake-7.0.0.xml"
+
+class Planted(object):
+    """Unpickling this creates the file named in it."""
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __reduce__(self):
+        return (open, (self.filename, "w"))
+
+def plant_pickle(sidecar_file, marker_file):
+    """Write a pickle to sidecar_file that, if it were unpickled,
+    would create marker_file."""
+    with open(sidecar_file, "wb") as fh:
+        cPickle.dump({ "version" : 1, "payload" : Planted(marker_file) },
+                fh, cPickle.HIGHEST_PROTOCOL)
+
+class JobIndexTests(unittest.TestCase):
+    """Test the byte-offset job index and random access to jobs."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Parse the file once, for this entire class"""
+        annofile = os.path.join(util.UTFILES_DIR, ANNO_FILE)
+        build = annolib.AnnotatedBuild(annofile)
+        cls.jobs = build.getAllJobs()
+        build.close()
+
+    def setUp(self):
+        # Work in a temp directory so the sidecar files don't
+        # litter utfiles
+        self.tmp_dir = tempfile.mkdtemp()
+        self.annofile = os.path.join(self.tmp_dir, ANNO_FILE)
+        shutil.copy(os.path.join(util.UTFILES_DIR, ANNO_FILE), self.annofile)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _split(self, num_parts):
+        """Split the annotation file into file, file_1, file_2, ..."""
+        with open(self.annofile, "rb") as fh:
+            data = fh.read()
+        part_size = len(data) // num_parts + 1
+        for i in range(num_parts):
+            if i == 0:
+                filename = self.annofile
+            else:
+                filename = "%s_%d" % (self.annofile, i)
+            with open(filename, "wb") as fh:
+                fh.write(data[i * part_size:(i + 1) * part_size])
+
+    def _check_jobs(self, build):
+        ids = [job.getID() for job in self.jobs]
+        jobs = build.getJobs(ids)
+
+        self.assertEqual(ids, [job.getID() for job in jobs])
+        for orig, indexed in zip(self.jobs, jobs):
+            self.assertEqual(orig.getTextReport(), indexed.getTextReport())
+            self.assertEqual(orig.getMakeProcess().getID(),
+                    indexed.getMakeProcess().getID())
+
+    def test_get_jobs(self):
+        build = annolib.AnnotatedBuild(self.annofile)
+        self.assertEqual(len(build.getJobIndex()), len(self.jobs))
+        self._check_jobs(build)
+        build.close()
+
+    def test_get_job(self):
+        build = annolib.AnnotatedBuild(self.annofile)
+        job = build.getJob("J0000000012067840")
+        self.assertEqual(job.getName(), "make")
+        self.assertEqual(job.getMakeProcess().getID(), "M00000006")
+        self.assertEqual(build.getJob("J-no-such-job"), None)
+        build.close()
+
+    def test_job_path(self):
+        # The index lets getJobPath() find parent jobs that
+        # were never read
+        build = annolib.AnnotatedBuild(self.annofile)
+        job = build.getJob("J0000000012067840")
+        job_path = [obj.getID() for obj in build.getJobPath(job)]
+
+        expected = ["M00000000", "J0000000012012f50",
+                    "M00000001", "J0000000012028170",
+                    "M00000006", "J0000000012067840"]
+
+        self.assertEqual(job_path, expected)
+        build.close()
+
+    def test_iter_after_get(self):
+        # getJob() must not disturb a later iterJobs()
+        build = annolib.AnnotatedBuild(self.annofile)
+        build.getJob("J0000000012067840")
+        self.assertEqual(len(build.getAllJobs()), len(self.jobs))
+        build.close()
+
+    def test_sidecar(self):
+        build = annolib.AnnotatedBuild(self.annofile)
+        build.getJobIndex()
+        build.close()
+
+        sidecar = jobindex.sidecar_filename(self.annofile)
+        self.assertTrue(os.path.exists(sidecar))
+
+        # The sidecar is used when the file is unchanged
+        index = jobindex.JobIndex(jobindex.file_key([self.annofile]))
+        self.assertTrue(index.load(sidecar))
+        self.assertEqual(len(index), len(self.jobs))
+
+        # ...but not when the file has changed
+        with open(self.annofile, "ab") as fh:
+            fh.write("\n")
+        index = jobindex.JobIndex(jobindex.file_key([self.annofile]))
+        self.assertFalse(index.load(sidecar))
+
+    def test_damaged_sidecar(self):
+        build = annolib.AnnotatedBuild(self.annofile)
+        build.getJobIndex()
+        build.close()
+
+        sidecar = jobindex.sidecar_filename(self.annofile)
+        with open(sidecar, "rb") as fh:
+            data = fh.read()
+        key = jobindex.file_key([self.annofile])
+        for size in [0, 10, len(data) // 2, len(data) - 1]:
+            with open(sidecar, "wb") as fh:
+                fh.write(data[:size])
+            self.assertFalse(jobindex.JobIndex(key).load(sidecar))
+
+        # A damaged sidecar is replaced
+        build = annolib.AnnotatedBuild(self.annofile)
+        self._check_jobs(build)
+        build.close()
+        self.assertTrue(jobindex.JobIndex(key).load(sidecar))
+
+    def test_pickled_sidecar(self):
+        # A pickle is never loaded from the sidecar
+        sidecar = jobindex.sidecar_filename(self.annofile)
+        marker = os.path.join(self.tmp_dir, "unpickled")
+        plant_pickle(sidecar, marker)
+
+        index = jobindex.JobIndex(jobindex.file_key([self.annofile]))
+        self.assertFalse(index.load(sidecar))
+
+        build = annolib.AnnotatedBuild(self.annofile)
+        self._check_jobs(build)
+        build.close()
+        self.assertFalse(os.path.exists(marker))
+
+    def test_small_chunks(self):
+        # Records that are split across read() calls are still found
+        with open(self.annofile, "rb") as fh:
+            expected = list(jobindex.scan_body(fh))
+            scanned = list(jobindex.scan_body(fh, chunk_size=7))
+        self.assertEqual(expected, scanned)
+
+    def test_multi_part(self):
+        self._split(3)
+        build = annolib.AnnotatedBuild(self.annofile)
+        self._check_jobs(build)
+        build.close()
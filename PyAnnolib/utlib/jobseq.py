@@ -125,3 +125,70 @@ class SeqTests(unittest.TestCase):
         expected = [ (5.0, 3.0)]
 
         self._test_merge(orig, expected)
+
+
+class ConcurrencyTests(unittest.TestCase):
+    """Check the concurrency histogram and step function.
+
+    Here, fragments are (node, invoked, completed).
+    """
+
+    def _cluster(self, frags):
+        cluster = sequencing.Cluster()
+        for (node, invoked, completed) in frags:
+            cluster.agents.setdefault(node, sequencing.Agent())
+            cluster.agents[node].addTimingTuple(invoked, completed)
+        return cluster
+
+    def _brute_force(self, frags):
+        """Count the running agents in each 0.5 second slice."""
+        histogram = {}
+        times = [t * 0.5 for t in range(int(max([frag[2]
+            for frag in frags]) * 2))]
+        for time in times:
+            N = len(set([node for (node, invoked, completed) in frags
+                if invoked <= time < completed]))
+            if N:
+                histogram[N] = histogram.get(N, 0.0) + 0.5
+        return histogram
+
+    def test_partial_overlap(self):
+        frags = [ ("a", 3.0, 5.0), ("b", 1.0, 4.0) ]
+        cluster = self._cluster(frags)
+        self.assertEqual(cluster.calculateSteps(),
+                [ (1.0, 1), (3.0, 2), (4.0, 1), (5.0, 0) ])
+        self.assertEqual(cluster.calculateHistogram(), { 1 : 3.0, 2 : 1.0 })
+        self.assertEqual(cluster.calculateHistogram(),
+                self._brute_force(frags))
+
+    def test_gaps_and_touching(self):
+        # The gap from 2.0 to 3.0 isn't counted, and b's start
+        # at 6.0 when a ends is not a change in concurrency.
+        frags = [ ("a", 0.0, 2.0), ("a", 3.0, 6.0), ("b", 6.0, 7.0),
+                ("c", 4.0, 4.0) ]
+        cluster = self._cluster(frags)
+        self.assertEqual(cluster.calculateSteps(),
+                [ (0.0, 1), (2.0, 0), (3.0, 1), (7.0, 0) ])
+        self.assertEqual(cluster.calculateHistogram(), { 1 : 6.0 })
+
+    def test_same_agent_counted_once(self):
+        frags = [ ("a", 0.0, 4.0), ("a", 1.0, 2.0), ("a", 1.5, 5.0),
+                ("b", 1.0, 3.0), ("c", 2.0, 3.5) ]
+        cluster = self._cluster(frags)
+        self.assertEqual(cluster.calculateHistogram(),
+                { 1 : 2.5, 2 : 1.5, 3 : 1.0 })
+        self.assertEqual(cluster.calculateHistogram(),
+                self._brute_force(frags))
+
+    def test_many(self):
+        frags = []
+        for i in range(200):
+            node = "n%d" % (i % 7,)
+            invoked = (i * 37 % 101) * 0.5
+            frags.append((node, invoked, invoked + (i % 5) * 0.5))
+        cluster = self._cluster(frags)
+        self.assertEqual(cluster.calculateHistogram(),
+                self._brute_force(frags))
+        self.assertEqual(cluster.getEarliestStart(), 0.0)
+        self.assertEqual(cluster.getLatestEnd(),
+                max([frag[2] for frag in frags]))
@@ -0,0 +1,86 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyannolib import annolib
+from tyrannolib import latency
+from utlib import util
+
+# (job ID, type, node, invoked, completed, writejobs); J4 ran
+# before J3 finished, and J5 is in a sub-make run by J1
+JOBS = [
+    ("J1", "rule", "n1", 0.0, 1.0, []),
+    ("J2", "rule", "n2", 0.5, 2.0, []),
+    ("J3", "rule", "n1", 2.5, 3.0, ["J1", "J2"]),
+    ("J4", "rule", "n2", 2.75, 4.0, ["J3"]),
+]
+SUB_JOBS = [
+    ("J5", "parse", "n2", 1.25, 1.5, []),
+]
+
+def _job_xml(job_id, job_type, node, invoked, completed, write_jobs):
+    text = '<job id="%s" thread="1" type="%s" name="%s">\n' % (job_id,
+            job_type, job_id)
+    if write_jobs:
+        text += '<depList>\n'
+        for write_job in write_jobs:
+            text += '<dep writejob="%s" file="/src/%s"/>\n' % (write_job,
+                    write_job)
+        text += '</depList>\n'
+    text += '<timing invoked="%s" completed="%s" node="%s"/>\n</job>\n' % \
+            (invoked, completed, node)
+    return text
+
+class LatencyTests(unittest.TestCase):
+    """Test the dispatch latency analysis."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, "latency.xml")
+
+        with open(os.path.join(util.UTFILES_DIR, "emake8.xml"), "rb") as fh:
+            data = fh.read()
+        with open(self.filename, "wb") as fh:
+            fh.write(data[:data.index("<make ")])
+            fh.write('<make level="0" cmd="emake" cwd="/src" '
+                    'mode="gmake3.81">\n')
+            fh.write(_job_xml(*JOBS[0]))
+            fh.write('<make level="1" cmd="make" cwd="/src/sub" '
+                    'mode="gmake3.81">\n')
+            for job in SUB_JOBS:
+                fh.write(_job_xml(*job))
+            fh.write('</make>\n')
+            for job in JOBS[1:]:
+                fh.write(_job_xml(*job))
+            fh.write('</make>\n</build>\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_latency(self):
+        dispatch = latency.DispatchLatency(num_worst=2)
+        build = annolib.AnnotatedBuild(self.filename)
+        for job in build.iterJobs(fields=latency.JOB_FIELDS):
+            dispatch.addJob(job)
+        build.close()
+
+        # J5 waited for J1, J3 for J2, and J4 started early
+        self.assertEqual(dispatch.getNumJobs(), 2)
+        self.assertEqual(dispatch.num_early, 1)
+        self.assertEqual(dict([(node, list(latencies)) for (node, latencies)
+            in dispatch.by_node.items()]), { "n1" : [0.5], "n2" : [0.25] })
+        self.assertEqual(sorted(dispatch.by_type.keys()), ["parse", "rule"])
+        self.assertEqual(dispatch.getWorst(), [
+            (0.5, "J3", "rule", "n1", "J3"),
+            (0.25, "J5", "parse", "n2", "J5")])
+        self.assertEqual(len(dispatch.completed), 5)
+
+    def test_summary(self):
+        dispatch = latency.DispatchLatency()
+        self.assertEqual(dispatch.getSummary([4.0, 1.0, 3.0, 2.0]),
+                (4, 2.5, 3.0, 4.0, 4.0))
+        self.assertEqual(dispatch.getSummary([]), (0, 0.0, 0.0, 0.0, 0.0))
+        self.assertEqual(dispatch.getWorst(), [])
@@ -0,0 +1,121 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import cPickle
+import sys
+import unittest
+
+from pyannolib import annolib
+from pyannolib import pathtable
+
+# A job with one op of each type, and some repeated files
+OPS = [
+    ("read", "/src/a.c", "file", "1", "1"),
+    ("read", "/src/a.h", "file", "1", "1"),
+    ("lookup", "/src/b.h", "file", "0", "1"),
+    ("create", "/obj/a.o", "file", "1", "1"),
+    ("modify", "/obj/a.o", "file", "1", "1"),
+    ("unlink", "/obj/a.tmp", "file", "1", "1"),
+    ("link", "/bin/a", "symlink", "1", "1"),
+    ("append", "/obj/log", "file", "1", "1"),
+    ("read", "/src/a.h", "file", "1", "1"),
+    ("mystery", "/src", "dir", "1", "0"),
+]
+
+def _job_xml(ops):
+    text = '<job id="J00000001" type="rule" name="a">\n<opList>\n'
+    for (op_type, filename, filetype, found, isdir) in ops:
+        text += '<op type="%s" file="%s" filetype="%s" found="%s" ' \
+                'isdir="%s"/>\n' % (op_type, filename, filetype, found, isdir)
+    text += '</opList>\n</job>\n'
+    return text
+
+def _values(ops):
+    return [(op.getType(), op.getFile(), op.getFileType(), op.getFound(),
+        op.getIsDir()) for op in ops]
+
+class OpListTests(unittest.TestCase):
+    """Test the array-backed list of a Job's Operations."""
+
+    def setUp(self):
+        self.path_table = pathtable.PathTable()
+        self.job = annolib._parse_job_text(_job_xml(OPS), 0, True, (),
+                self.path_table)
+        self.oplist = self.job.getOperations()
+
+    def test_iterate(self):
+        self.assertEqual(len(self.oplist), len(OPS))
+        self.assertEqual(_values(self.oplist), OPS)
+        for op in self.oplist:
+            self.assertTrue(isinstance(op, annolib.Operation))
+            self.assertTrue(op.path_table is self.path_table)
+
+    def test_index(self):
+        self.assertEqual(_values([self.oplist[0]]), OPS[:1])
+        self.assertEqual(_values([self.oplist[3]]), OPS[3:4])
+        self.assertEqual(_values([self.oplist[-1]]), OPS[-1:])
+        self.assertEqual(_values(self.oplist[2:5]), OPS[2:5])
+        self.assertRaises(IndexError, self.oplist.__getitem__, len(OPS))
+
+    def test_append(self):
+        oplist = annolib.OpList(self.path_table)
+        for op in self.oplist:
+            oplist.append(op)
+        self.assertEqual(_values(oplist), OPS)
+
+        oplist = annolib.OpList(self.path_table)
+        oplist.addColumns(*zip(*OPS))
+        self.assertEqual(_values(oplist), OPS)
+
+    def test_helpers(self):
+        self.assertEqual(self.oplist.countByType(), {"read" : 3,
+            "lookup" : 1, "create" : 1, "modify" : 1, "unlink" : 1,
+            "link" : 1, "append" : 1, "mystery" : 1})
+
+        self.assertEqual(self.oplist.getFiles(),
+                [filename for (_, filename, _, _, _) in OPS])
+        self.assertEqual(self.oplist.getFiles([annolib.OP_TYPE_READ]),
+                ["/src/a.c", "/src/a.h", "/src/a.h"])
+        self.assertEqual(self.oplist.getFileIDs([annolib.OP_TYPE_READ]),
+                self.path_table.getIDs(["/src/a.c", "/src/a.h", "/src/a.h"]))
+        self.assertEqual(self.oplist.getFiles(["no-such-type"]), [])
+        self.assertEqual(self.oplist.getWrittenFiles(),
+                ["/obj/a.o", "/obj/a.tmp", "/bin/a", "/obj/log"])
+
+        empty = annolib.OpList(self.path_table)
+        self.assertFalse(empty)
+        self.assertEqual(empty.countByType(), {})
+        self.assertEqual(empty.getWrittenFiles(), [])
+
+    def test_pickle(self):
+        data = cPickle.dumps(self.job, cPickle.HIGHEST_PROTOCOL)
+        job = cPickle.loads(data)
+        self.assertEqual(_values(job.getOperations()), OPS)
+
+        # A process that gave its codes in another order
+        (file_ids, codes, path_table, values) = self.oplist.__getstate__()
+        other_values = list(reversed(values))
+        code_map = [other_values.index(value) for value in values]
+        oplist = annolib.OpList.__new__(annolib.OpList)
+        oplist.__setstate__((file_ids,
+            type(codes)("B", map(code_map.__getitem__, codes)),
+            path_table, other_values))
+        self.assertEqual(_values(oplist), OPS)
+
+    def test_path_table(self):
+        path_table = pathtable.PathTable()
+        path_table.getID("/somewhere/else")
+        self.job.setPathTable(path_table)
+        self.assertEqual(_values(self.oplist), OPS)
+        self.assertTrue(self.oplist.path_table is path_table)
+
+    def test_compact(self):
+        num_ops = 100000
+        ops = [("read", "/src/file%d.h" % (i % 100,), "file", "1", "1")
+                for i in xrange(num_ops)]
+        job = annolib._parse_job_text(_job_xml(ops), 0, True)
+        oplist = job.getOperations()
+        self.assertEqual(len(oplist), num_ops)
+        self.assertEqual(oplist.countByType(), {"read" : num_ops})
+
+        size = sys.getsizeof(oplist.file_ids) + sys.getsizeof(oplist.codes)
+        self.assertTrue(size < 10 * num_ops, size)
@@ -0,0 +1,85 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyannolib import annolib
+from utlib import util
+
+class ParallelTests(unittest.TestCase):
+    """Check that the parallel parser gives the same results as the
+    serial parser."""
+
+    def setUp(self):
+        # Work in a temp directory so the job index sidecar files
+        # don't litter utfiles
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _copy(self, name, num_parts=1):
+        """Copy an annotation file, splitting it into num_parts files."""
+        with open(os.path.join(util.UTFILES_DIR, name), "rb") as fh:
+            data = fh.read()
+
+        annofile = os.path.join(self.tmp_dir, name)
+        part_size = len(data) // num_parts + 1
+        for i in range(num_parts):
+            if i == 0:
+                filename = annofile
+            else:
+                filename = "%s_%d" % (annofile, i)
+            with open(filename, "wb") as fh:
+                fh.write(data[i * part_size:(i + 1) * part_size])
+        return annofile
+
+    def _compare(self, annofile):
+        build = annolib.AnnotatedBuild(annofile)
+        serial_jobs = build.getAllJobs()
+        serial_messages = [m.getText() for m in build.getMessages()]
+        build.close()
+
+        build = annolib.AnnotatedBuild(annofile)
+
+        # Use a small chunk size so that there are many chunks
+        parser = annolib.AnnoParallelBodyParser(build, True, 3,
+                chunk_size=4096)
+        parallel_jobs = list(parser.parse())
+
+        self.assertEqual([j.getID() for j in serial_jobs],
+                [j.getID() for j in parallel_jobs])
+
+        for serial_job, parallel_job in zip(serial_jobs, parallel_jobs):
+            self.assertEqual(serial_job.getTextReport(),
+                    parallel_job.getTextReport())
+            self.assertEqual(serial_job.getMakeProcess().getID(),
+                    parallel_job.getMakeProcess().getID())
+            self.assertEqual(
+                    [obj.getID() for obj in build.getJobPath(parallel_job)],
+                    [obj.getID() for obj in build.getJobPath(serial_job)])
+
+        self.assertEqual(serial_messages,
+                [m.getText() for m in build.getMessages()])
+        build.close()
+
+    def test_jobs(self):
+        self._compare(self._copy("make-3.82-emake-7.0.0.xml"))
+
+    def test_messages(self):
+        self._compare(self._copy("message-record.xml"))
+
+    def test_multi_part(self):
+        # Splitting at arbitrary bytes means some records straddle
+        # two parts.
+        self._compare(self._copy("make-3.82-emake-5.3.0.xml", 4))
+
+    def test_iter_jobs(self):
+        annofile = self._copy("job-error.xml")
+        build = annolib.AnnotatedBuild(annofile)
+        serial_ids = [job.getID() for job in build.iterJobs()]
+        parallel_ids = [job.getID() for job in build.iterJobs(workers=2)]
+        self.assertEqual(serial_ids, parallel_ids)
+        build.close()
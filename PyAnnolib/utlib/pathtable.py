@@ -0,0 +1,101 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import cPickle
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyannolib import annolib
+from pyannolib import pathtable
+from utlib import util
+
+ANNO_FILE = "make-3.82-emake-7.0.0.xml"
+
+class PathTableTests(unittest.TestCase):
+    """Test the build's table of op and dep file names."""
+
+    def setUp(self):
+        # Work in a temp directory so the sidecar files
+        # don't litter utfiles
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, ANNO_FILE)
+        shutil.copy(os.path.join(util.UTFILES_DIR, ANNO_FILE),
+                self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _files(self, build, jobs):
+        """Return the file names of all the ops and deps, and check
+        that they are in the build's PathTable."""
+        path_table = build.getPathTable()
+        files = []
+        for job in jobs:
+            for record in list(job.getOperations()) + job.getDependencies():
+                self.assertTrue(record.path_table is path_table)
+                self.assertEqual(path_table.getPath(record.getFileID()),
+                        record.getFile())
+                files.append(record.getFile())
+        return files
+
+    def test_table(self):
+        table = pathtable.PathTable()
+        self.assertEqual(len(table), 0)
+        self.assertEqual(table.getID(None), 0)
+        self.assertEqual(table.getPath(0), None)
+
+        self.assertEqual(table.getID("/a/b.c"), 1)
+        self.assertEqual(table.getID("/a/d.c"), 2)
+        self.assertEqual(table.getID("/a/b.c"), 1)
+        self.assertEqual(table.getIDs(["/a/d.c", "/e", None]), [2, 3, 0])
+        self.assertEqual(len(table), 3)
+        self.assertEqual(table.getPath(3), "/e")
+
+        copy = cPickle.loads(cPickle.dumps(table, cPickle.HIGHEST_PROTOCOL))
+        self.assertEqual(copy.paths, table.paths)
+        self.assertEqual(copy.getID("/a/d.c"), 2)
+        self.assertEqual(copy.getID("/f"), 4)
+
+    def test_shared(self):
+        build = annolib.AnnotatedBuild(self.filename)
+        jobs = build.getAllJobs()
+        files = self._files(build, jobs)
+        self.assertTrue(len(set(files)) < len(files))
+        self.assertEqual(len(build.getPathTable()), len(set(files)))
+
+        # Each path is stored once
+        paths = {}
+        for job in jobs:
+            for op in job.getOperations():
+                path = paths.setdefault(op.getFile(), op.getFile())
+                self.assertTrue(op.getFile() is path)
+                self.assertTrue(op.file is path)
+        build.close()
+
+    def test_sources(self):
+        build = annolib.AnnotatedBuild(self.filename)
+        expected = self._files(build, build.getAllJobs())
+        build.close()
+
+        build = annolib.AnnotatedBuild(self.filename,
+                backend=annolib.BACKEND_EXPAT)
+        self.assertEqual(self._files(build, build.getAllJobs()), expected)
+        build.close()
+
+        build = annolib.AnnotatedBuild(self.filename)
+        self.assertEqual(self._files(build, build.iterJobs(workers=2)),
+                expected)
+        job_ids = [job.getID() for job in build.iterJobs()]
+        self.assertEqual(self._files(build, build.getJobs(job_ids)),
+                expected)
+        build.close()
+
+        build = annolib.AnnotatedBuild(self.filename)
+        build.writeCache()
+        build.close()
+
+        build = annolib.AnnotatedBuild(self.filename)
+        self.assertEqual(self._files(build, build.iterJobs()), expected)
+        self.assertNotEqual(build._getCache(), None)
+        build.close()
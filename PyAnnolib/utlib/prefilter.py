@@ -0,0 +1,88 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import glob
+import os
+import unittest
+
+from pyannolib import annolib
+from pyannolib import jobindex
+from pyannolib import prefilter
+from utlib import util
+from utlib.backends import _dump
+
+class PrefilterTests(unittest.TestCase):
+    """Check iterJobs(prefilter=...)"""
+
+    def _build_state(self, build):
+        return (_dump(build.getMessages()), _dump(build.make_procs),
+                sorted(build.make_jobs.keys()), _dump(build.getMetrics()))
+
+    def _check(self, job_filter, wanted):
+        """The prefilter should give the jobs for which wanted(job)
+        is True, and the same messages and make processes as a
+        full parse."""
+        filenames = glob.glob(os.path.join(util.UTFILES_DIR, "*.xml"))
+        for filename in filenames:
+            build = annolib.AnnotatedBuild(filename)
+            expected = [job for job in build.getAllJobs() if wanted(job)]
+            expected_state = self._build_state(build)
+
+            build = annolib.AnnotatedBuild(filename)
+            jobs = list(build.iterJobs(prefilter=job_filter))
+            self.assertEqual(_dump(jobs), _dump(expected), filename)
+            self.assertEqual(self._build_state(build), expected_state,
+                    filename)
+
+    def test_pattern(self):
+        job_filter = prefilter.JobPrefilter(["<failed "])
+        self._check(job_filter, lambda job: job.getRetval() != job.SUCCESS)
+
+    def test_predicate(self):
+        job_filter = prefilter.JobPrefilter(predicate=prefilter.attr_equals(
+            "type", annolib.JOB_TYPE_PARSE))
+        self._check(job_filter,
+                lambda job: job.getType() == annolib.JOB_TYPE_PARSE)
+
+    def test_pattern_or_predicate(self):
+        job_filter = prefilter.JobPrefilter(["<failed "],
+                prefilter.attr_equals("type", annolib.JOB_TYPE_END))
+        self._check(job_filter,
+                lambda job: job.getRetval() != job.SUCCESS or
+                job.getType() == annolib.JOB_TYPE_END)
+
+    def test_all(self):
+        job_filter = prefilter.JobPrefilter(predicate=lambda attrs: True)
+        self._check(job_filter, lambda job: True)
+
+    def test_none(self):
+        self._check(prefilter.JobPrefilter(), lambda job: False)
+
+    def test_job_in_make_path(self):
+        # The parent jobs of the makes are there even if they
+        # didn't match
+        filename = os.path.join(util.UTFILES_DIR,
+                "make-3.82-emake-7.0.0.xml")
+        build = annolib.AnnotatedBuild(filename)
+        expected = dict([(job.getID(), build.getJobPath(job))
+            for job in build.iterJobs()])
+
+        build = annolib.AnnotatedBuild(filename)
+        job_filter = prefilter.JobPrefilter(predicate=prefilter.attr_equals(
+            "type", annolib.JOB_TYPE_RULE))
+        num_jobs = 0
+        for job in build.iterJobs(prefilter=job_filter):
+            self.assertEqual(_dump(build.getJobPath(job)),
+                    _dump(expected[job.getID()]))
+            num_jobs += 1
+        self.assertTrue(num_jobs > 0)
+
+    def test_scan_text(self):
+        # The text is right even when elements cross read boundaries
+        filename = os.path.join(util.UTFILES_DIR, "job-error.xml")
+        with open(filename, "rb") as fh:
+            data = fh.read()
+            for chunk_size in (64, 1000):
+                events = list(jobindex.scan_body(fh, 0, chunk_size, True))
+                self.assertTrue(events)
+                for (kind, offset, length, attrs_text, text) in events:
+                    self.assertEqual(text, data[offset:offset + length])
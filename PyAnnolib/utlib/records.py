@@ -0,0 +1,44 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import os
+import unittest
+
+from pyannolib import annolib
+from utlib import util
+
+class RecordTests(unittest.TestCase):
+    """Check that the record classes are compact."""
+
+    def setUp(self):
+        filename = os.path.join(util.UTFILES_DIR,
+                "make-3.82-emake-7.0.0.xml")
+        self.build = annolib.AnnotatedBuild(filename)
+        self.jobs = self.build.getAllJobs()
+
+    def test_no_dict(self):
+        records = list(self.jobs) + self.build.make_procs.values()
+        for job in self.jobs:
+            records.extend(job.getTimings())
+            records.extend(job.getOperations())
+            records.extend(job.getDependencies())
+            records.extend(job.getCommands())
+            records.extend(job.getOutputs())
+        for record in records:
+            self.assertFalse(hasattr(record, "__dict__"),
+                    record.__class__.__name__)
+
+        job = self.jobs[0]
+        self.assertRaises(AttributeError, setattr, job, "my_data", 1)
+
+    def test_shared_values(self):
+        ops = [op for job in self.jobs for op in job.getOperations()]
+        self.assertTrue(len(ops) > 1)
+        # One string object per value
+        op_type_ids = set([id(op.getType()) for op in ops])
+        op_types = set([op.getType() for op in ops])
+        self.assertEqual(len(op_type_ids), len(op_types))
+
+        job_types = dict([(job.getType(), job.getType())
+            for job in self.jobs])
+        for job in self.jobs:
+            self.assertTrue(job.getType() is job_types[job.getType()])
@@ -0,0 +1,69 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import os
+import unittest
+
+from pyannolib import annolib
+from tyrannolib import jobgraph
+from tyrannolib import simulate
+from utlib import util
+from utlib.jobgraph import _graph
+
+class SimulateTests(unittest.TestCase):
+    """Test the build simulator."""
+
+    def test_policies(self):
+        # A and B are independent; C is followed by a long job
+        graph = _graph({ "A" : 1.0, "B" : 1.0, "C" : 1.0, "D" : 10.0 },
+                [ ("C", "D") ])
+
+        sim = simulate.Simulation(graph, 2, simulate.POLICY_FIFO)
+        self.assertEqual(sim.getMakespan(), 12.0)
+        sim = simulate.Simulation(graph, 2, simulate.POLICY_LARGEST_DURATION)
+        self.assertEqual(sim.getMakespan(), 12.0)
+        sim = simulate.Simulation(graph, 2, simulate.POLICY_LONGEST_PATH)
+        self.assertEqual(sim.getMakespan(), 11.0)
+        self.assertEqual(sim.getUtilization(), 13.0 / 22.0)
+
+        sim = simulate.Simulation(graph, 1)
+        self.assertEqual(sim.getMakespan(), 13.0)
+        self.assertEqual(sim.getUtilization(), 1.0)
+
+        self.assertRaises(simulate.SimulationError, simulate.Simulation,
+                graph, 0)
+        self.assertRaises(simulate.SimulationError, simulate.Simulation,
+                graph, 2, "no-such-policy")
+
+    def test_dependencies(self):
+        graph = _graph({ "A" : 2.0, "B" : 3.0, "C" : 5.0, "D" : 1.0,
+            "E" : 7.0 }, [ ("A", "B"), ("B", "D"), ("A", "C"), ("C", "D") ])
+        self.assertEqual(simulate.Simulation(graph, 2).getMakespan(), 11.0)
+        self.assertEqual(simulate.Simulation(graph, 3).getMakespan(), 8.0)
+
+        sim = simulate.Simulation(graph, 3, record=True)
+        self.assertEqual(sim.cluster.calculateHistogram(),
+                { 1 : 1.0, 2 : 4.0, 3 : 3.0 })
+
+        self.assertEqual(simulate.Simulation(_graph({}, []),
+            4).getMakespan(), 0.0)
+
+    def test_build(self):
+        filename = os.path.join(util.UTFILES_DIR,
+                "make-3.82-emake-7.0.0.xml")
+        build = annolib.AnnotatedBuild(filename)
+        graph = jobgraph.build_graph(build)
+        build.close()
+
+        busy_time = sum(graph.durations)
+        for policy in simulate.POLICIES.keys():
+            # With enough agents, only the dependencies matter
+            sim = simulate.Simulation(graph, graph.getNumJobs(), policy)
+            self.assertAlmostEqual(sim.getMakespan(), graph.getEndTime())
+
+            for num_agents in (1, 4):
+                sim = simulate.Simulation(graph, num_agents, policy,
+                        record=True)
+                self.assertTrue(sim.getMakespan() + 1e-9 >=
+                        max(graph.getEndTime(), busy_time / num_agents))
+                self.assertTrue(max(sim.cluster.calculateHistogram().keys())
+                        <= num_agents)
@@ -0,0 +1,79 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyannolib import annolib
+from tyrannolib import sqlexport
+from utlib import util
+
+ANNO_FILE = "make-3.82-emake-7.0.0.xml"
+
+class SQLExportTests(unittest.TestCase):
+    """Test loading a build into SQLite."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_file = os.path.join(self.tmp_dir, "build.db")
+
+        annofile = os.path.join(util.UTFILES_DIR, ANNO_FILE)
+        build = annolib.AnnotatedBuild(annofile)
+        self.jobs = build.getAllJobs()
+        self.metrics = build.getMetrics()
+        build.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _export(self, batch_size=sqlexport.BATCH_SIZE):
+        annofile = os.path.join(util.UTFILES_DIR, ANNO_FILE)
+        build = annolib.AnnotatedBuild(annofile)
+        num_jobs = sqlexport.export(build, self.db_file,
+                batch_size=batch_size)
+        build.close()
+        return num_jobs
+
+    def _query_one(self, sql, params=()):
+        columns, rows = sqlexport.query(self.db_file, sql, params)
+        return list(rows)[0][0]
+
+    def test_counts(self):
+        # A small batch size makes sure the batches are flushed
+        self.assertEqual(self._export(batch_size=7), len(self.jobs))
+
+        self.assertEqual(self._query_one("SELECT COUNT(*) FROM jobs"),
+                len(self.jobs))
+        self.assertEqual(self._query_one("SELECT COUNT(*) FROM ops"),
+                sum([len(job.getOperations()) for job in self.jobs]))
+        self.assertEqual(self._query_one("SELECT COUNT(*) FROM timings"),
+                sum([len(job.getTimings()) for job in self.jobs]))
+        self.assertEqual(self._query_one("SELECT COUNT(*) FROM metrics"),
+                len(self.metrics))
+
+    def test_job(self):
+        self._export()
+        columns, rows = sqlexport.query(self.db_file,
+                "SELECT name, make_id FROM jobs WHERE job_id = ?",
+                ("J0000000012067840",))
+        self.assertEqual(columns, ["name", "make_id"])
+        self.assertEqual(list(rows), [("make", "M00000006")])
+
+        # The make process tree can be walked with a join
+        parent = self._query_one("SELECT m.parent_job_id FROM makes m "
+                "JOIN jobs j ON j.make_id = m.make_id WHERE j.job_id = ?",
+                ("J0000000012067840",))
+        self.assertEqual(parent, "J0000000012028170")
+
+    def test_replace(self):
+        # Exporting again replaces the database
+        self._export()
+        self._export()
+        self.assertEqual(self._query_one("SELECT COUNT(*) FROM jobs"),
+                len(self.jobs))
+
+    def test_bad_query(self):
+        self._export()
+        self.assertRaises(sqlexport.SQLExportError, sqlexport.query,
+                self.db_file, "SELECT no_such_column FROM jobs")
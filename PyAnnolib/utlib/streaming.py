@@ -0,0 +1,123 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import gc
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyannolib import annolib
+from utlib import util
+
+NUM_JOBS = 6000
+
+def _write_anno(filename, num_jobs):
+    """Write an annotation file with num_jobs jobs, each with its
+    own files, a sub-make after every 50 jobs, and a message after
+    every 100."""
+    with open(os.path.join(util.UTFILES_DIR, "emake8.xml"), "rb") as fh:
+        data = fh.read()
+
+    with open(filename, "wb") as fh:
+        fh.write(data[:data.index("<make ")])
+        fh.write('<make level="0" cmd="emake" cwd="/src" mode="gmake3.81">\n')
+        for i in xrange(num_jobs):
+            fh.write('<job id="J%08x" thread="1" type="rule" name="f%d.o">\n'
+                    '<timing invoked="%d.0" completed="%d.5" node="n1"/>\n'
+                    '<opList>\n'
+                    '<op type="read" file="/src/f%d.c"/>\n'
+                    '<op type="create" file="/src/f%d.o"/>\n'
+                    '</opList>\n'
+                    '</job>\n' % (i, i, i, i, i, i))
+            if i % 50 == 49:
+                fh.write('<make level="1" cmd="make -C sub" '
+                        'cwd="/src/sub%d" mode="gmake3.81">\n'
+                        '<job id="J%08x" thread="1" type="exist" '
+                        'name="sub%d"/>\n'
+                        '</make>\n' % (i, i + 0x10000000, i))
+            if i % 100 == 99:
+                fh.write('<message thread="1" time="%d.0" severity="warning" '
+                        'code="EC0000">message %d</message>\n' % (i, i))
+        fh.write('</make>\n</build>\n')
+
+
+class StreamingTests(unittest.TestCase):
+    """Check that streaming mode keeps memory use flat."""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, "big.xml")
+        _write_anno(self.filename, NUM_JOBS)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _check_flat(self, backend):
+        """The number of live objects is the same after the first
+        tenth of the jobs as at the end."""
+        build = annolib.AnnotatedBuild(self.filename, backend=backend,
+                streaming=True)
+        num_objects = None
+        num_jobs = 0
+        for job in build.iterJobs():
+            num_jobs += 1
+            if num_jobs == NUM_JOBS // 10:
+                gc.collect()
+                num_objects = len(gc.get_objects())
+        del job
+        gc.collect()
+        growth = len(gc.get_objects()) - num_objects
+        build.close()
+
+        self.assertTrue(num_jobs > NUM_JOBS)
+        self.assertTrue(growth < 100, "%d new objects" % (growth,))
+        self.assertEqual(build.getMessages(), [])
+        self.assertEqual(build.make_jobs, {})
+
+    def test_etree(self):
+        self._check_flat(annolib.BACKEND_ETREE)
+
+    def test_expat(self):
+        self._check_flat(annolib.BACKEND_EXPAT)
+
+    @unittest.skipUnless(annolib.lxml_etree, "lxml is not installed")
+    def test_lxml(self):
+        self._check_flat(annolib.BACKEND_LXML)
+
+    def _check_pruned(self, parser_class):
+        # The finished elements are removed from the tree. iterparse()
+        # reads ahead, so there can be a few that are not finished.
+        build = annolib.AnnotatedBuild(self.filename)
+        parser = parser_class(build, True)
+        build.fh.seek(build.body_offset)
+        prefix = build.xml_decl + "<build>"
+        max_children = 0
+        for job in parser.parse(annolib.BodyStream(prefix, build.fh)):
+            num_children = sum([len(elem) for elem in parser.open_elems])
+            max_children = max(max_children, num_children)
+        build.close()
+        self.assertTrue(max_children < NUM_JOBS // 10, max_children)
+
+    def test_pruned(self):
+        self._check_pruned(annolib.AnnoXMLBodyParser)
+
+    @unittest.skipUnless(annolib.lxml_etree, "lxml is not installed")
+    def test_pruned_lxml(self):
+        self._check_pruned(annolib.AnnoLxmlBodyParser)
+
+    def test_same_jobs(self):
+        build = annolib.AnnotatedBuild(self.filename)
+        expected = [(job.getTextReport(), job.getMakeProcess().getCWD())
+                for job in build.iterJobs()]
+        build.close()
+
+        backends = [annolib.BACKEND_ETREE]
+        if annolib.lxml_etree is not None:
+            backends.append(annolib.BACKEND_LXML)
+        for backend in backends:
+            build = annolib.AnnotatedBuild(self.filename, backend=backend,
+                    streaming=True)
+            self.assertEqual([(job.getTextReport(),
+                job.getMakeProcess().getCWD()) for job in build.iterJobs()],
+                expected, backend)
+            build.close()
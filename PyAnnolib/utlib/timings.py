@@ -0,0 +1,60 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import os
+import unittest
+
+from pyannolib import annolib
+from utlib import util
+
+# A job that was run twice
+RERUN_JOB = """<job id="J00000001" type="rule" name="a.o">
+<timing invoked="1.250000" completed="2.000000" node="n1"/>
+<timing invoked="3.000000" completed="4.500000" node="n2"/>
+</job>
+"""
+
+class TimingTests(unittest.TestCase):
+    """Test the numeric timings."""
+
+    def test_floats(self):
+        job = annolib._parse_job_text(RERUN_JOB, 0, True)
+        (first, second) = job.getTimings()
+        self.assertEqual(first.getInvoked(), 1.25)
+        self.assertEqual(first.getCompleted(), 2.0)
+        self.assertEqual(first.getDuration(), 0.75)
+        self.assertEqual(second.duration, 1.5)
+        self.assertTrue(" 1.250000 sec" in first.getTextReport())
+
+        self.assertEqual(job.getFirstInvoked(), 1.25)
+        self.assertEqual(job.getLastCompleted(), 4.5)
+        self.assertEqual(job.getAgentTime(), 2.25)
+        self.assertEqual((job.first_invoked, job.last_completed,
+            job.agent_time), (1.25, 4.5, 2.25))
+
+    def test_missing(self):
+        job = annolib._parse_job_text('<job id="J1" type="rule">'
+                '<timing completed="bad" node="n1"/></job>', 0, True)
+        timing = job.getTimings()[0]
+        self.assertEqual(timing.getInvoked(), None)
+        self.assertEqual(timing.getCompleted(), None)
+        self.assertEqual(timing.getDuration(), None)
+        self.assertEqual(job.getFirstInvoked(), None)
+        self.assertEqual(job.getAgentTime(), 0.0)
+
+        job = annolib._parse_job_text('<job id="J1" type="rule"/>', 0, True)
+        self.assertEqual(job.getLastCompleted(), None)
+
+    def test_same_as_text(self):
+        # The reports show the times as they are in the file
+        filename = os.path.join(util.UTFILES_DIR,
+                "make-3.82-emake-7.0.0.xml")
+        with open(filename, "rb") as fh:
+            data = fh.read()
+
+        build = annolib.AnnotatedBuild(filename)
+        for job in build.iterJobs():
+            for timing in job.getTimings():
+                self.assertTrue(isinstance(timing.getInvoked(), float))
+                self.assertTrue('invoked="%s"' %
+                        (annolib.format_time(timing.getInvoked()),) in data)
+        build.close()
@@ -0,0 +1,71 @@
+# Copyright (c) 2014 by Cisco Systems, Inc.
+
+import os
+import StringIO
+import unittest
+
+from pyannolib import annolib
+from tyrannolib import utilization
+from utlib import util
+
+class UtilizationTests(unittest.TestCase):
+    """Test the time-bucketed utilization."""
+
+    def test_accumulate(self):
+        # Buckets are 2 seconds wide
+        intervals = [ (1.0, 2.0), (3.0, 9.0), (4.0, 4.5) ]
+        self.assertEqual(list(utilization.accumulate(intervals, 2.0, 5)),
+                [ 0.5, 0.5, 1.25, 1.0, 0.5 ])
+        self.assertEqual(list(utilization.accumulate([], 2.0, 3)),
+                [ 0.0, 0.0, 0.0 ])
+
+    def test_agents_and_types(self):
+        usage = utilization.Utilization(10)
+        # Overlapping timings on one agent are only counted once
+        usage.addTimingTuple("n1", "rule", 0.0, 15.0)
+        usage.addTimingTuple("n1", "rule", 5.0, 20.0)
+        usage.addTimingTuple("n2", "parse", 12.0, 17.0)
+        usage.addTimingTuple("n2", "parse", None, 17.0)
+        usage.calculate()
+
+        self.assertEqual(usage.getNumTimings(), 3)
+        self.assertEqual(usage.num_buckets, 2)
+        self.assertEqual(list(usage.agent_busy["n1"]), [ 1.0, 1.0 ])
+        self.assertEqual(list(usage.agent_busy["n2"]), [ 0.0, 0.5 ])
+        self.assertEqual(list(usage.getBusyAgents()), [ 1.0, 1.5 ])
+        self.assertEqual(list(usage.type_running["rule"]), [ 1.5, 1.5 ])
+        self.assertEqual(list(usage.type_running["parse"]), [ 0.0, 0.5 ])
+
+        fh = StringIO.StringIO()
+        usage.writeCSV(fh)
+        self.assertEqual(fh.getvalue().splitlines(), [
+            "start,end,busy_agents,agent:n1,agent:n2,type:parse,type:rule",
+            "0.000,10.000,1.0000,1.0000,0.0000,0.0000,1.5000",
+            "10.000,20.000,1.5000,1.0000,0.5000,0.5000,1.5000",
+            ])
+
+    def test_errors(self):
+        self.assertRaises(utilization.UtilizationError,
+                utilization.Utilization, 0)
+        usage = utilization.Utilization()
+        self.assertRaises(utilization.UtilizationError,
+                usage.addTimingTuple, "n1", "rule", 2.0, 1.0)
+
+    def test_build(self):
+        # The job types' running counts add up to the time spent in jobs
+        filename = os.path.join(util.UTFILES_DIR,
+                "make-3.82-emake-7.0.0.xml")
+        build = annolib.AnnotatedBuild(filename)
+        usage = utilization.Utilization(0.25)
+        job_time = 0.0
+        for job in build.iterJobs(fields=[annolib.JOB_FIELD_TIMING]):
+            usage.addJob(job)
+            job_time += job.getAgentTime()
+        build.close()
+
+        usage.calculate()
+        total = sum([sum(running)
+            for running in usage.type_running.values()]) * 0.25
+        self.assertAlmostEqual(total, job_time)
+        for busy in usage.agent_busy.values():
+            self.assertTrue(max(busy) <= 1.0 + 1e-9)